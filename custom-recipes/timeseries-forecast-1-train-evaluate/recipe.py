@@ -7,11 +7,16 @@ from dku_io_utils.utils import set_column_description
 from gluonts_forecasts.training_session import TrainingSession
 from dku_io_utils.recipe_config_loading import load_training_config, get_models_parameters
 from dku_io_utils.utils import write_to_folder
+from gluonts_forecasts.columnar_dataset import write_columnar_list_dataset_to_folder
+from dku_io_utils.prepared_data_cache import PreparedDataCache
+from dku_io_utils.session_checkpoint import SessionCheckpoint
+from dku_io_utils.model_selection import ModelSelection
 from gluonts_forecasts.model_handler import get_model_label
-from dku_constants import ObjectType
+from dku_constants import ObjectType, INGESTION_CHUNK_SIZE, GLUON_TRAIN_DATASET_DIRECTORY
 from timeseries_preparation.preparation import TimeseriesPreparator
 from safe_logger import SafeLogger
 from time import perf_counter
+import tempfile
 
 logger = SafeLogger("Forecast plugin")
 session_name = datetime.utcnow().isoformat() + "Z"
@@ -25,8 +30,6 @@ mxnet_context = set_mxnet_context(params["gpu_devices"])
 models_parameters = get_models_parameters(config, is_training_multivariate=params["is_training_multivariate"])
 start = perf_counter()
 
-training_df = params["training_dataset"].get_dataframe()
-
 timeseries_preparator = TimeseriesPreparator(
     time_column_name=params["time_column_name"],
     frequency=params["frequency"],
@@ -34,9 +37,87 @@ timeseries_preparator = TimeseriesPreparator(
     timeseries_identifiers_names=params["timeseries_identifiers_names"],
     external_features_columns_names=params["external_features_columns_names"],
     max_timeseries_length=params["max_timeseries_length"],
+    compact_dtypes=params["compact_dtypes"],
+    resampling_method=params["resampling_method"],
+)
+
+prepared_data_cache = PreparedDataCache(
+    folder=params["model_folder"],
+    partition_root=params["partition_root"],
+    preparation_parameters={
+        param: params[param]
+        for param in [
+            "time_column_name",
+            "frequency",
+            "target_columns_names",
+            "timeseries_identifiers_names",
+            "external_features_columns_names",
+            "max_timeseries_length",
+            "compact_dtypes",
+            "resampling_method",
+            "prediction_length",
+            "drop_short_timeseries",
+            "backtest_folds",
+        ]
+    },
 )
 
-training_df_prepared = timeseries_preparator.prepare_timeseries_dataframe(training_df)
+if params["max_timeseries_length"]:
+    # stream the training dataset by chunks to keep only the last records of each time series in memory
+    training_dataset_chunks = params["training_dataset"].iter_dataframes(chunksize=INGESTION_CHUNK_SIZE)
+    if params["use_prepared_data_cache"]:
+        training_dataset_chunks = prepared_data_cache.iter_fingerprinted_chunks(training_dataset_chunks)
+    training_df = timeseries_preparator.sample_last_dates_by_chunks(training_dataset_chunks)
+else:
+    training_df = params["training_dataset"].get_dataframe()
+    if params["use_prepared_data_cache"]:
+        prepared_data_cache.update_fingerprint(training_df)
+
+cached_prepared_data = prepared_data_cache.load() if params["use_prepared_data_cache"] else None
+if cached_prepared_data:
+    training_df_prepared, cached_full_list_dataset = cached_prepared_data
+else:
+    training_df_prepared = timeseries_preparator.prepare_timeseries_dataframe(training_df, copy=False)
+del training_df
+
+session_checkpoint = None
+if params["resume_interrupted_session"]:
+    session_checkpoint = SessionCheckpoint(
+        folder=params["model_folder"],
+        partition_root=params["partition_root"],
+        session_parameters={
+            "models_parameters": models_parameters,
+            **{
+                param: params[param]
+                for param in [
+                    "time_column_name",
+                    "frequency",
+                    "target_columns_names",
+                    "timeseries_identifiers_names",
+                    "external_features_columns_names",
+                    "prediction_length",
+                    "drop_short_timeseries",
+                    "backtest_folds",
+                    "epoch",
+                    "batch_size",
+                    "num_batches_per_epoch",
+                    "season_length",
+                    "make_forecasts",
+                    "evaluation_only",
+                ]
+            },
+        },
+    )
+    session_checkpoint.update_fingerprint(training_df_prepared)
+    session_name = session_checkpoint.find_resumable_session() or session_name
+
+estimated_training_times = None
+if params["time_budget"]:
+    # models of nightly sessions on similar data are expected to run about as long as in the last completed session
+    estimated_training_times = ModelSelection(folder=params["model_folder"], partition_root=params["partition_root"]).get_last_session_training_times()
+
+# local directory of the memory-mapped time series, removed when the recipe ends
+datasets_directory = tempfile.TemporaryDirectory() if params["disk_backed_datasets"] else None
 
 training_session = TrainingSession(
     target_columns_names=params["target_columns_names"],
@@ -53,10 +134,34 @@ training_session = TrainingSession(
     user_num_batches_per_epoch=params["num_batches_per_epoch"],
     season_length=params["season_length"],
     mxnet_context=mxnet_context,
+    storage_directory=datasets_directory.name if datasets_directory else None,
+    drop_short_timeseries=params["drop_short_timeseries"],
+    num_workers=params["training_num_workers"],
+    cores_per_model=params["cores_per_model"] or None,
+    checkpoint=session_checkpoint,
+    backtest_folds=params["backtest_folds"],
+    time_budget=params["time_budget"],
+    estimated_training_times=estimated_training_times,
 )
+# the training session holds the only reference to the prepared dataframe, so that its unused columns are released once the datasets are built
+del training_df_prepared
 training_session.init(partition_root=params["partition_root"], session_name=session_name)
-
-training_session.create_gluon_datasets()
+if session_checkpoint:
+    session_checkpoint.start(training_session.session_path)
+
+if cached_prepared_data:
+    # the evaluation dataset is a view of the cached full dataset
+    training_session.create_gluon_datasets(gluon_list_datasets=[cached_full_list_dataset.cut(params["prediction_length"]), cached_full_list_dataset])
+    del cached_full_list_dataset
+else:
+    training_session.create_gluon_datasets()
+
+if params["use_prepared_data_cache"] and not cached_prepared_data:
+    prepared_data_cache.save(
+        training_session.training_df,
+        training_session.full_list_dataset,
+        local_directory=datasets_directory.name if datasets_directory else None,
+    )
 
 training_session.instantiate_models()
 
@@ -68,18 +173,33 @@ if not params["evaluation_only"]:
 
     model_folder = params["model_folder"]
 
+    if not session_checkpoint:
+        # with a session checkpoint, predictors and parameters of the models were saved as soon as each model was completed
+        for model in training_session.models:
+            if model.predictor is None:
+                # model skipped or stopped to fit in the time budget
+                continue
+            model_path = "{}/{}/model.pk.gz".format(training_session.session_path, get_model_label(model.model_name))
+            write_to_folder(model.predictor, model_folder, model_path, ObjectType.PICKLE_GZ)
+
+            parameters_path = "{}/{}/params.json".format(training_session.session_path, get_model_label(model.model_name))
+            write_to_folder(model.model_parameters, model_folder, parameters_path, ObjectType.JSON)
+
+    gluon_train_dataset_path = "{}/{}".format(training_session.session_path, GLUON_TRAIN_DATASET_DIRECTORY)
+    write_columnar_list_dataset_to_folder(
+        training_session.full_list_dataset,
+        model_folder,
+        gluon_train_dataset_path,
+        local_directory=datasets_directory.name if datasets_directory and not cached_prepared_data else None,
+    )
+
+    # metrics are written last, they mark the session as completed
     metrics_path = "{}/metrics.csv".format(training_session.session_path)
     write_to_folder(training_session.get_metrics_df(), model_folder, metrics_path, ObjectType.CSV)
 
-    gluon_train_dataset_path = "{}/gluon_train_dataset.pk.gz".format(training_session.session_path)
-    write_to_folder(training_session.full_list_dataset, model_folder, gluon_train_dataset_path, ObjectType.PICKLE_GZ)
-
-    for model in training_session.models:
-        model_path = "{}/{}/model.pk.gz".format(training_session.session_path, get_model_label(model.model_name))
-        write_to_folder(model.predictor, model_folder, model_path, ObjectType.PICKLE_GZ)
-
-        parameters_path = "{}/{}/params.json".format(training_session.session_path, get_model_label(model.model_name))
-        write_to_folder(model.model_parameters, model_folder, parameters_path, ObjectType.JSON)
+    if session_checkpoint:
+        # the session cannot be resumed anymore, the evaluation results kept to resume it are removed
+        session_checkpoint.clear()
 
 logger.info("Completed training session {} in {:.2f} seconds".format(session_name, perf_counter() - start))
 
@@ -20,6 +20,16 @@ class METRICS_DATASET:
     MODEL_PARAMETERS = "model_params"
     SESSION = "training_session"
     TRAINING_TIME = "run_time"
+    BACKTEST_FOLD = "backtest_fold"
+    TRAINING_STATUS = "training_status"
+
+
+class TRAINING_STATUS:
+    """ Class of constants with the status of a model in the evaluation metrics dataframe of a training session with a time budget """
+
+    COMPLETED = "completed"
+    SKIPPED = "skipped"  # not started because its estimated run time exceeded the remaining time budget
+    STOPPED = "stopped"  # still running or waiting when the time budget ran out
 
 
 class TIMESERIES_KEYS:
@@ -32,6 +42,17 @@ class TIMESERIES_KEYS:
     FEAT_DYNAMIC_REAL = FieldName.FEAT_DYNAMIC_REAL
     FEAT_DYNAMIC_REAL_COLUMNS_NAMES = "feat_dynamic_real_columns_names"
     IDENTIFIERS = "identifiers"
+    TIMESERIES_ID = "__timeseries_id__"  # integer id of the identifiers group of a timeseries in the timeseries metadata table
+
+
+class TIMESERIES_STATISTICS:
+    """ Class of constants with labels of the columns of the timeseries statistics table """
+
+    LENGTH = "length"
+    MEAN = "mean"
+    SCALE = "scale"
+    ZERO_RATIO = "zero_ratio"
+    SEASONAL_ERROR = "seasonal_error"
 
 
 class ROW_ORIGIN:
@@ -62,12 +83,58 @@ METRICS_COLUMNS_DESCRIPTIONS = {
     METRICS_DATASET.SESSION: "Timestamp of training session",
     METRICS_DATASET.TARGET_COLUMN: "Aggregated and per-time-series metrics",
     METRICS_DATASET.TRAINING_TIME: "Time elapsed during model training and evaluation (in seconds)",
+    METRICS_DATASET.BACKTEST_FOLD: "Backtest window (0 for the last forecasting horizon) or average over all windows",
+    METRICS_DATASET.TRAINING_STATUS: "Whether the model was completed, skipped or stopped to fit in the time budget",
     ROW_ORIGIN.COLUMN_NAME: "Row origin",
 }
 
 # regex pattern to match the timestamps used for training sessions
 TIMESTAMP_REGEX_PATTERN = r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}.\d{6}Z"
 
+# number of rows per chunk when the training dataset is streamed to keep only the last records of each time series
+INGESTION_CHUNK_SIZE = 100000
+
+# maximum number of values of a target buffer loaded in memory at once to compute the timeseries statistics (unless a timeseries is longer)
+STATISTICS_CHUNK_SIZE = 1000000
+
+# number of rows copied at once from the training dataframe to the buffers of the gluon datasets
+DATASET_BUFFERS_CHUNK_SIZE = 1000000
+
+# subfolder of the model folder (within the partition root) where prepared training data are cached
+PREPARED_DATA_CACHE_DIRECTORY = "prepared_data_cache"
+
+
+# directory of a training session where the memory-mappable gluon train dataset is saved
+GLUON_TRAIN_DATASET_DIRECTORY = "gluon_train_dataset"
+
+
+class SESSION_CHECKPOINT_FILES:
+    """ Class of constants with the names of the files written in a training session as soon as each model is completed """
+
+    SESSION = "checkpoint.json"
+    METRICS = "metrics.csv"
+    PREDICTOR = "model.pk.gz"
+    PARAMETERS = "params.json"
+    RESULTS = "evaluation_results.pk"
+
+
+class PREPARED_DATA_CACHE_FILES:
+    """ Class of constants with the names of the files cached for a fingerprint in the prepared data cache directory """
+
+    TRAINING_DF = "training_df.pk"
+    GLUON_DATASET = "gluon_dataset"
+
+
+class COLUMNAR_DATASET_FILES:
+    """ Class of constants with the files names of a ColumnarListDataset saved in a directory """
+
+    METADATA = "metadata.json"
+    IDENTIFIERS = "identifiers.pk"
+    TARGET_PREFIX = "target_"
+    TIMESERIES_OFFSETS = "timeseries_offsets"
+    START_DATES = "start_dates"
+    FEAT_DYNAMIC_REAL = "feat_dynamic_real"
+
 
 FORECASTING_STYLE_PRESELECTED_MODELS = {
     "auto_univariate": ["trivial_identity", "seasonal_naive", "simplefeedforward"],
@@ -1,8 +1,9 @@
 import re
 import os
 from dku_io_utils.utils import read_from_folder
-from dku_constants import METRICS_DATASET, TIMESTAMP_REGEX_PATTERN, ObjectType
+from dku_constants import METRICS_DATASET, TIMESTAMP_REGEX_PATTERN, GLUON_TRAIN_DATASET_DIRECTORY, SESSION_CHECKPOINT_FILES, TRAINING_STATUS, ObjectType
 from gluonts_forecasts.model_handler import list_available_models_labels, get_model_name_from_label
+from gluonts_forecasts.columnar_dataset import read_columnar_list_dataset_from_folder
 
 
 class ModelSelectionError(ValueError):
@@ -83,26 +84,51 @@ class ModelSelection:
             )
         return model
 
+    def get_last_session_training_times(self):
+        """Retrieve the run time of each model completed in the last training session, to estimate the run time of the models of a new session.
+
+        Returns:
+            Dictionary of run time in seconds (value) by model label (key). Empty if there is no completed session.
+        """
+        try:
+            session_name = self._get_last_session()
+        except ModelSelectionError:
+            return {}
+        df = read_from_folder(self.folder, os.path.join(self.partition_root, session_name, SESSION_CHECKPOINT_FILES.METRICS), ObjectType.CSV)
+        df = df[df[METRICS_DATASET.TARGET_COLUMN] == METRICS_DATASET.AGGREGATED_ROW]
+        if METRICS_DATASET.BACKTEST_FOLD in df:
+            df = df[df[METRICS_DATASET.BACKTEST_FOLD].astype(str) == "0"]
+        if METRICS_DATASET.TRAINING_STATUS in df:
+            df = df[df[METRICS_DATASET.TRAINING_STATUS] == TRAINING_STATUS.COMPLETED]
+        return dict(zip(df[METRICS_DATASET.MODEL_COLUMN], df[METRICS_DATASET.TRAINING_TIME]))
+
     def get_gluon_train_dataset(self):
-        """ Retrieve the GluonDataset object with training data that was saved in the model folder during training """
+        """Retrieve the GluonDataset object with training data that was saved in the model folder during training.
+        It is memory-mapped from the columnar directory, or unpickled for sessions trained before this format existed.
+        """
+        gluon_train_dataset_directory = os.path.join(self.session_path, GLUON_TRAIN_DATASET_DIRECTORY)
+        if self.folder.get_path_details(path=gluon_train_dataset_directory)["exists"]:
+            return read_columnar_list_dataset_from_folder(self.folder, gluon_train_dataset_directory)
         gluon_train_dataset_path = f"{self.session_path}/gluon_train_dataset.pk.gz"
         gluon_train_dataset = read_from_folder(self.folder, gluon_train_dataset_path, ObjectType.PICKLE_GZ)
         return gluon_train_dataset
 
     def _get_last_session(self):
-        """Retrieve the last training session using name of subfolders and append the partition root path.
+        """Retrieve the last completed training session using name of subfolders and append the partition root path.
+        Sessions that were interrupted before their metrics were written are skipped.
 
         Returns:
             Timestamp of the last training session.
         """
         session_timestamps = []
-        for child in self.folder.get_path_details(path=self.partition_root)["children"]:
+        for child in self.folder.get_path_details(path=self.partition_root).get("children", []):
             if re.match(TIMESTAMP_REGEX_PATTERN, child["name"]):
                 session_timestamps += [child["name"]]
-        if len(session_timestamps) == 0:
-            raise ModelSelectionError(f"Model not found in {self.partition_root}")
-        last_session = max(session_timestamps, key=lambda timestamp: timestamp)
-        return last_session
+        for session_timestamp in sorted(session_timestamps, reverse=True):
+            metrics_path = os.path.join(self.partition_root, session_timestamp, SESSION_CHECKPOINT_FILES.METRICS)
+            if self.folder.get_path_details(path=metrics_path)["exists"]:
+                return session_timestamp
+        raise ModelSelectionError(f"Model not found in {self.partition_root}")
 
     def _get_best_model(self):
         """Find the best model according to self.performance_metric based on the aggregated metric rows
@@ -112,9 +138,20 @@ class ModelSelection:
         """
         available_models_labels = list_available_models_labels()
         df = read_from_folder(self.folder, f"{self.session_path}/metrics.csv", ObjectType.CSV)
+        if (df[METRICS_DATASET.TARGET_COLUMN] == METRICS_DATASET.AGGREGATED_ROW).any():
+            df = df[df[METRICS_DATASET.TARGET_COLUMN] == METRICS_DATASET.AGGREGATED_ROW]
+        if METRICS_DATASET.BACKTEST_FOLD in df:
+            # models of a backtest session are compared on their metrics averaged over all folds
+            df = df[df[METRICS_DATASET.BACKTEST_FOLD].astype(str) == METRICS_DATASET.AGGREGATED_ROW]
+        if METRICS_DATASET.TRAINING_STATUS in df:
+            # models skipped or stopped to fit in the time budget of the session have no saved predictor
+            df = df[df[METRICS_DATASET.TRAINING_STATUS] == TRAINING_STATUS.COMPLETED]
+        if df.empty:
+            raise ModelSelectionError(
+                f"No model was completed in session '{self.session_name}', all models were skipped or stopped to fit in its time budget. "
+                + "Please select another session or increase the time budget of the training recipe."
+            )
         try:
-            if (df[METRICS_DATASET.TARGET_COLUMN] == METRICS_DATASET.AGGREGATED_ROW).any():
-                df = df[df[METRICS_DATASET.TARGET_COLUMN] == METRICS_DATASET.AGGREGATED_ROW]
             assert df[METRICS_DATASET.MODEL_COLUMN].nunique() == len(df.index), "More than one row per model"
             model_label = df.loc[df[self.performance_metric].idxmin()][
                 METRICS_DATASET.MODEL_COLUMN
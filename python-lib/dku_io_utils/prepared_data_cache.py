@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+from pandas.util import hash_pandas_object
+from dku_io_utils.utils import read_from_folder, write_to_folder
+from dku_constants import ObjectType, PREPARED_DATA_CACHE_DIRECTORY, PREPARED_DATA_CACHE_FILES
+from gluonts_forecasts.columnar_dataset import write_columnar_list_dataset_to_folder, read_columnar_list_dataset_from_folder
+from safe_logger import SafeLogger
+
+logger = SafeLogger("Forecast plugin")
+
+
+class PreparedDataCache:
+    """
+    Class to store in the model folder the prepared training data, keyed by a fingerprint of the input data and of the preparation parameters,
+    so that training sessions on unchanged data with unchanged parameters can skip the preparation and gluon datasets creation.
+    The full gluon dataset is stored as a columnar directory next to the pickled dataframe, so that it is memory-mapped when it is loaded
+
+    Attributes:
+        folder (dataiku.Folder): Model folder
+        partition_root (str): Partition root path (empty if no partitioning)
+        fingerprint (hashlib.sha256): Running hash of the preparation parameters and of the input data
+    """
+
+    def __init__(self, folder, partition_root=None, preparation_parameters=None):
+        self.folder = folder
+        self.partition_root = "" if not partition_root else partition_root
+        self.fingerprint = hashlib.sha256(json.dumps(preparation_parameters, sort_keys=True, default=str).encode())
+
+    def update_fingerprint(self, dataframe):
+        """Update the fingerprint with the columns names and the content of dataframe, hashed row by row in a vectorized way"""
+        self.fingerprint.update(json.dumps(list(dataframe.columns), default=str).encode())
+        self.fingerprint.update(hash_pandas_object(dataframe, index=False).values.tobytes())
+
+    def iter_fingerprinted_chunks(self, dataframe_chunks):
+        """Yield the dataframe chunks after updating the fingerprint with each of them"""
+        for chunk in dataframe_chunks:
+            self.update_fingerprint(chunk)
+            yield chunk
+
+    def get_fingerprint(self):
+        return self.fingerprint.hexdigest()
+
+    def load(self):
+        """Retrieve the prepared data cached with the current fingerprint.
+
+        Returns:
+            Prepared training dataframe and full ColumnarListDataset with memory-mapped buffers, or None if nothing was cached with this fingerprint.
+        """
+        cache_path = self._get_cache_path()
+        training_df_path = os.path.join(cache_path, PREPARED_DATA_CACHE_FILES.TRAINING_DF)
+        gluon_dataset_path = os.path.join(cache_path, PREPARED_DATA_CACHE_FILES.GLUON_DATASET)
+        if not self.folder.get_path_details(path=training_df_path)["exists"] or not self.folder.get_path_details(path=gluon_dataset_path)["exists"]:
+            logger.info(f"No prepared data found in cache for fingerprint {self.get_fingerprint()}")
+            return None
+        logger.info("Input data and preparation parameters are unchanged, loading prepared data from cache")
+        training_df = read_from_folder(self.folder, training_df_path, ObjectType.PICKLE)
+        full_list_dataset = read_columnar_list_dataset_from_folder(self.folder, gluon_dataset_path)
+        return training_df, full_list_dataset
+
+    def save(self, training_df, full_list_dataset, local_directory=None):
+        """Cache the prepared data with the current fingerprint and remove the data cached with other fingerprints.
+        Other cut lengths of the gluon dataset are views of the full dataset, they are not cached.
+
+        Args:
+            training_df (DataFrame): Prepared training dataframe.
+            full_list_dataset (ColumnarListDataset): Gluon dataset of the full timeseries.
+            local_directory (str, optional): Local directory where full_list_dataset is already saved. Defaults to None, which means to save it first.
+        """
+        cache_directory = os.path.join(self.partition_root, PREPARED_DATA_CACHE_DIRECTORY)
+        cache_path = self._get_cache_path()
+        cache_directory_details = self.folder.get_path_details(path=cache_directory)
+        if cache_directory_details["exists"]:
+            for child in cache_directory_details.get("children", []):
+                if child["name"] != os.path.basename(cache_path):
+                    self.folder.delete_path(os.path.join(cache_directory, child["name"]))
+        write_to_folder(training_df, self.folder, os.path.join(cache_path, PREPARED_DATA_CACHE_FILES.TRAINING_DF), ObjectType.PICKLE)
+        write_columnar_list_dataset_to_folder(
+            full_list_dataset, self.folder, os.path.join(cache_path, PREPARED_DATA_CACHE_FILES.GLUON_DATASET), local_directory=local_directory
+        )
+
+    def _get_cache_path(self):
+        return os.path.join(self.partition_root, PREPARED_DATA_CACHE_DIRECTORY, self.get_fingerprint())
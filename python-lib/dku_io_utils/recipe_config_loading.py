@@ -131,7 +131,32 @@ def load_training_config(recipe_config):
         if params["max_timeseries_length"] < 4:
             raise PluginParamValidationError("Number of records must be higher than 4")
 
-    params["evaluation_strategy"] = "split"
+    params["resampling_method"] = recipe_config.get("resampling_method", "no_resampling")
+    if params["resampling_method"] == "no_resampling":
+        params["resampling_method"] = None
+
+    params["compact_dtypes"] = recipe_config.get("compact_dtypes", False)
+    params["training_num_workers"] = recipe_config.get("training_num_workers", 1)
+    if params["training_num_workers"] < 1:
+        raise PluginParamValidationError("Number of training processes must be at least 1")
+    params["cores_per_model"] = recipe_config.get("cores_per_model", 0)
+    if params["cores_per_model"] < 0:
+        raise PluginParamValidationError("Number of cores per model cannot be negative")
+    params["use_prepared_data_cache"] = recipe_config.get("use_prepared_data_cache", False)
+    params["disk_backed_datasets"] = recipe_config.get("disk_backed_datasets", False)
+    params["drop_short_timeseries"] = recipe_config.get("drop_short_timeseries", False)
+    params["resume_interrupted_session"] = recipe_config.get("resume_interrupted_session", False)
+    time_budget_minutes = recipe_config.get("time_budget_minutes", 0)
+    if time_budget_minutes < 0:
+        raise PluginParamValidationError("Time budget cannot be negative")
+    params["time_budget"] = time_budget_minutes * 60 if time_budget_minutes else None
+
+    params["evaluation_strategy"] = recipe_config.get("evaluation_strategy", "split")
+    params["backtest_folds"] = 1
+    if params["evaluation_strategy"] == "backtest":
+        params["backtest_folds"] = recipe_config.get("backtest_folds", 3)
+        if params["backtest_folds"] < 2:
+            raise PluginParamValidationError("Number of backtest windows must be at least 2")
     params["evaluation_only"] = False
 
     printable_params = {param: value for param, value in params.items() if "dataset" not in param and "folder" not in param}
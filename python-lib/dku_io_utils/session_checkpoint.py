@@ -0,0 +1,130 @@
+import re
+import os
+import json
+import hashlib
+from pandas.util import hash_pandas_object
+from dku_io_utils.utils import read_from_folder, write_to_folder
+from dku_constants import ObjectType, TIMESTAMP_REGEX_PATTERN, SESSION_CHECKPOINT_FILES
+from gluonts_forecasts.model_handler import get_model_label
+from safe_logger import SafeLogger
+
+logger = SafeLogger("Forecast plugin")
+
+
+class SessionCheckpoint:
+    """
+    Class to persist in the model folder the artifacts of each model of a training session as soon as the model is trained and evaluated,
+    so that an interrupted session can be resumed without training again the models that were completed.
+    Only used when resuming interrupted sessions is enabled, the checkpoint files are removed once the session is completed
+
+    Attributes:
+        folder (dataiku.Folder): Model folder
+        partition_root (str): Partition root path (empty if no partitioning)
+        fingerprint (hashlib.sha256): Running hash of the session parameters and of the training data
+        session_path (str): Path of the checkpointed session within the folder
+    """
+
+    def __init__(self, folder, partition_root=None, session_parameters=None):
+        self.folder = folder
+        self.partition_root = "" if not partition_root else partition_root
+        self.fingerprint = hashlib.sha256(json.dumps(session_parameters, sort_keys=True, default=str).encode())
+        self.session_path = None
+
+    def update_fingerprint(self, dataframe):
+        """Update the fingerprint with the columns names and the content of dataframe, hashed row by row in a vectorized way"""
+        self.fingerprint.update(json.dumps(list(dataframe.columns), default=str).encode())
+        self.fingerprint.update(hash_pandas_object(dataframe, index=False).values.tobytes())
+
+    def get_fingerprint(self):
+        return self.fingerprint.hexdigest()
+
+    def find_resumable_session(self):
+        """Find the last interrupted session that was started with the current fingerprint.
+        A session is interrupted if its metrics were not written, which is the last step of the train recipe.
+
+        Returns:
+            Timestamp of the session to resume or None if there is none.
+        """
+        path_details = self.folder.get_path_details(path=self.partition_root)
+        sessions_names = [child["name"] for child in path_details.get("children", []) if re.match(TIMESTAMP_REGEX_PATTERN, child["name"])]
+        for session_name in sorted(sessions_names, reverse=True):
+            session_path = os.path.join(self.partition_root, session_name)
+            if self.folder.get_path_details(path=os.path.join(session_path, SESSION_CHECKPOINT_FILES.METRICS))["exists"]:
+                # sessions older than the last completed one are not resumed
+                break
+            session_checkpoint_path = os.path.join(session_path, SESSION_CHECKPOINT_FILES.SESSION)
+            if not self.folder.get_path_details(path=session_checkpoint_path)["exists"]:
+                continue
+            with self.folder.get_download_stream(session_checkpoint_path) as stream:
+                session_checkpoint = json.loads(stream.read().decode())
+            if session_checkpoint.get("fingerprint") == self.get_fingerprint():
+                logger.info(f"Resuming interrupted training session {session_name}")
+                return session_name
+        logger.info(f"No interrupted training session found for fingerprint {self.get_fingerprint()}")
+        return None
+
+    def start(self, session_path):
+        """Mark the session as started with the current fingerprint, so that it can be resumed if it is interrupted.
+
+        Args:
+            session_path (str): Path of the session within the folder.
+        """
+        self.session_path = session_path
+        write_to_folder({"fingerprint": self.get_fingerprint()}, self.folder, os.path.join(session_path, SESSION_CHECKPOINT_FILES.SESSION), ObjectType.JSON)
+
+    def save_model(self, model, model_results, fold_index=0):
+        """Write the predictor and parameters of a trained model, then its evaluation results which mark the model as completed.
+        Only the evaluation results are written for the older folds of a backtest, their models are not kept.
+
+        Args:
+            model (Model): Trained and evaluated model.
+            model_results (tuple): Results of Model.train_evaluate.
+            fold_index (int, optional): Index of the backtest fold the model was evaluated on. Defaults to 0, the last one.
+        """
+        model_path = self._get_model_path(model)
+        if fold_index == 0:
+            if model.predictor is not None:
+                write_to_folder(model.predictor, self.folder, os.path.join(model_path, SESSION_CHECKPOINT_FILES.PREDICTOR), ObjectType.PICKLE_GZ)
+            write_to_folder(model.model_parameters, self.folder, os.path.join(model_path, SESSION_CHECKPOINT_FILES.PARAMETERS), ObjectType.JSON)
+        write_to_folder(model_results, self.folder, self._get_results_path(model, fold_index), ObjectType.PICKLE)
+
+    def load_model(self, model, fold_index=0):
+        """Retrieve the predictor and the evaluation results of a model completed before the session was interrupted.
+
+        Args:
+            model (Model): Untrained model of the resumed session.
+            fold_index (int, optional): Index of the backtest fold. Defaults to 0, the last one.
+
+        Returns:
+            Predictor (None if it was not saved) and results of Model.train_evaluate, or None if the model was not completed.
+        """
+        results_path = self._get_results_path(model, fold_index)
+        if not self.folder.get_path_details(path=results_path)["exists"]:
+            return None
+        model_results = read_from_folder(self.folder, results_path, ObjectType.PICKLE)
+        predictor_path = os.path.join(self._get_model_path(model), SESSION_CHECKPOINT_FILES.PREDICTOR)
+        predictor = None
+        if fold_index == 0 and self.folder.get_path_details(path=predictor_path)["exists"]:
+            predictor = read_from_folder(self.folder, predictor_path, ObjectType.PICKLE_GZ)
+        return predictor, model_results
+
+    def clear(self):
+        """Remove the checkpoint files of the completed session: its fingerprint and the evaluation results of its models.
+        Predictors and parameters of the models are kept, they are the artifacts of the session.
+        """
+        session_details = self.folder.get_path_details(path=self.session_path)
+        for child in session_details.get("children", []):
+            child_path = os.path.join(self.session_path, child["name"])
+            if child["name"] == SESSION_CHECKPOINT_FILES.SESSION:
+                self.folder.delete_path(child_path)
+                continue
+            for model_child in self.folder.get_path_details(path=child_path).get("children", []):
+                if model_child["name"].endswith(SESSION_CHECKPOINT_FILES.RESULTS):
+                    self.folder.delete_path(os.path.join(child_path, model_child["name"]))
+
+    def _get_model_path(self, model):
+        return os.path.join(self.session_path, get_model_label(model.model_name))
+
+    def _get_results_path(self, model, fold_index):
+        results_file_name = SESSION_CHECKPOINT_FILES.RESULTS if fold_index == 0 else f"fold_{fold_index}_{SESSION_CHECKPOINT_FILES.RESULTS}"
+        return os.path.join(self._get_model_path(model), results_file_name)
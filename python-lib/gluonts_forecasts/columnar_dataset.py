@@ -0,0 +1,345 @@
+import os
+import json
+import shutil
+import tempfile
+from collections.abc import Sequence
+from gluonts.dataset.common import ListDataset, ProcessDataEntry
+from dku_constants import TIMESERIES_KEYS, COLUMNAR_DATASET_FILES
+from safe_logger import SafeLogger
+import numpy as np
+import pandas as pd
+
+logger = SafeLogger("Forecast plugin")
+
+
+class ColumnarListDataset(ListDataset):
+    """
+    GluonTS ListDataset backed by columnar buffers instead of a list of timeseries dictionaries.
+    Values of each target column are stored in one contiguous array, external features in one array of shape features x rows,
+    and the rows of each timeseries are located with an offset index. The timeseries dictionaries of list_data are built on the fly
+    with views of these buffers, in the order of GluonDataset (all targets of the first timeseries, then all targets of the second one, ...).
+
+    Attributes:
+        frequency (str): Pandas timeseries frequency (e.g. '3M')
+        time_column_name (str)
+        target_columns_names (list): List of column names to predict
+        targets (list): One array of values per target column
+        timeseries_offsets (numpy.array): Index of the first row of each timeseries, followed by the number of rows
+        start_dates (numpy.array): Start date of each timeseries
+        external_features_columns_names (list): List of columns with dynamic real features over time
+        feat_dynamic_real (numpy.array): Array of external features of shape features x rows. None if no external features
+        identifiers (list): Dictionary of identifiers values (value) by identifiers column name (key) of each timeseries. None if no identifiers
+        cut_length (int): Number of last time steps removed from each timeseries
+    """
+
+    def __init__(
+        self,
+        frequency,
+        time_column_name,
+        target_columns_names,
+        targets,
+        timeseries_offsets,
+        start_dates,
+        external_features_columns_names=None,
+        feat_dynamic_real=None,
+        identifiers=None,
+        cut_length=0,
+    ):
+        self.process = ProcessDataEntry(frequency)
+        self.frequency = frequency
+        self.time_column_name = time_column_name
+        self.target_columns_names = target_columns_names
+        self.targets = targets
+        self.timeseries_offsets = timeseries_offsets
+        self.start_dates = start_dates
+        self.external_features_columns_names = external_features_columns_names
+        self.feat_dynamic_real = feat_dynamic_real
+        self.identifiers = identifiers
+        self.cut_length = cut_length
+
+    @property
+    def list_data(self):
+        return LazyTimeseriesList(self.get_timeseries, self.get_timeseries_count() * len(self.target_columns_names))
+
+    def cut(self, cut_length):
+        """Create a view of this dataset without the last cut_length time steps of each timeseries.
+        No buffer is copied, so the evaluation dataset costs no memory on top of the full dataset.
+
+        Args:
+            cut_length (int): Number of time steps to remove in addition to the ones already removed from this dataset.
+
+        Returns:
+            ColumnarListDataset sharing the buffers of this dataset.
+        """
+        return ColumnarListDataset(
+            frequency=self.frequency,
+            time_column_name=self.time_column_name,
+            target_columns_names=self.target_columns_names,
+            targets=self.targets,
+            timeseries_offsets=self.timeseries_offsets,
+            start_dates=self.start_dates,
+            external_features_columns_names=self.external_features_columns_names,
+            feat_dynamic_real=self.feat_dynamic_real,
+            identifiers=self.identifiers,
+            cut_length=self.cut_length + cut_length,
+        )
+
+    def get_timeseries_metadata(self):
+        """Build the timeseries metadata table from the columnar attributes, without building the timeseries dictionaries"""
+        timeseries_ids = np.repeat(np.arange(self.get_timeseries_count()), len(self.target_columns_names))
+        target_names = np.tile(self.target_columns_names, self.get_timeseries_count())
+        identifiers = pd.DataFrame(self.identifiers if self.identifiers is not None else [{}] * self.get_timeseries_count())
+        timeseries_metadata = identifiers.take(timeseries_ids)
+        timeseries_metadata.index = pd.MultiIndex.from_arrays([timeseries_ids, target_names], names=[TIMESERIES_KEYS.TIMESERIES_ID, TIMESERIES_KEYS.TARGET_NAME])
+        return timeseries_metadata
+
+    def get_timeseries_count(self):
+        """Return the number of timeseries (i.e. of identifiers groups), each one having one dictionary per target"""
+        return len(self.timeseries_offsets) - 1
+
+    def get_timeseries(self, index):
+        """Build the dictionary of the univariate timeseries at index with views of the buffers.
+
+        Args:
+            index (int): Index of the univariate timeseries in list_data.
+
+        Returns:
+            Dictionary for one timeseries, with the same keys as the ones created by GluonDataset.
+        """
+        timeseries_index, target_index = divmod(index, len(self.target_columns_names))
+        start = self.timeseries_offsets[timeseries_index]
+        end = self.timeseries_offsets[timeseries_index + 1] - self.cut_length
+        univariate_timeseries = {
+            TIMESERIES_KEYS.START: pd.Timestamp(self.start_dates[timeseries_index]),
+            TIMESERIES_KEYS.TARGET: self.targets[target_index][start:end],
+            TIMESERIES_KEYS.TARGET_NAME: self.target_columns_names[target_index],
+            TIMESERIES_KEYS.TIME_COLUMN_NAME: self.time_column_name,
+        }
+        if self.feat_dynamic_real is not None:
+            univariate_timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL] = self.feat_dynamic_real[:, start:end]
+            univariate_timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL_COLUMNS_NAMES] = self.external_features_columns_names
+        if self.identifiers is not None:
+            univariate_timeseries[TIMESERIES_KEYS.IDENTIFIERS] = self.identifiers[timeseries_index]
+        return univariate_timeseries
+
+
+class ProjectedListDataset(ListDataset):
+    """
+    GluonTS ListDataset hiding some fields of the timeseries of another ListDataset, without copying it.
+    The timeseries dictionaries are shallow copies built on the fly during iteration and the ProcessDataEntry of the projected dataset is reused.
+
+    Attributes:
+        list_dataset (gluonts.dataset.common.ListDataset): Projected dataset
+        hidden_fields (list): Keys of the timeseries dictionaries to hide
+    """
+
+    def __init__(self, list_dataset, hidden_fields):
+        self.process = list_dataset.process
+        self.list_dataset = list_dataset
+        self.hidden_fields = hidden_fields
+
+    @property
+    def list_data(self):
+        return LazyTimeseriesList(self.get_timeseries, len(self.list_dataset.list_data))
+
+    def get_timeseries_metadata(self):
+        return get_timeseries_metadata(self.list_dataset)
+
+    def get_timeseries(self, index):
+        """Return the timeseries dictionary at index of the projected dataset without the hidden fields"""
+        timeseries = self.list_dataset.list_data[index]
+        return {key: value for key, value in timeseries.items() if key not in self.hidden_fields}
+
+
+class LazyTimeseriesList(Sequence):
+    """Read-only sequence of timeseries dictionaries built on the fly, used as list_data of lazy ListDatasets
+
+    Attributes:
+        get_timeseries (function): Function returning the timeseries dictionary at an index
+        length (int): Number of timeseries dictionaries
+    """
+
+    def __init__(self, get_timeseries, length):
+        self.get_timeseries = get_timeseries
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Timeseries index out of range")
+        return self.get_timeseries(index)
+
+
+def get_timeseries_metadata(list_dataset):
+    """Create a compact table of the metadata of each univariate timeseries of a gluon list dataset, in the order of list_data.
+    Rows are indexed by the integer id of the identifiers group of the timeseries (computed once, in order of first appearance)
+    and by the target name, and columns are the identifiers columns.
+
+    Args:
+        list_dataset (gluonts.dataset.common.ListDataset): ListDataset created with the GluonDataset class.
+
+    Returns:
+        DataFrame with one row per univariate timeseries.
+    """
+    if isinstance(list_dataset, (ColumnarListDataset, ProjectedListDataset)):
+        return list_dataset.get_timeseries_metadata()
+    list_data = list_dataset.list_data
+    timeseries_metadata = pd.DataFrame([timeseries.get(TIMESERIES_KEYS.IDENTIFIERS, {}) for timeseries in list_data], index=range(len(list_data)))
+    if len(timeseries_metadata.columns) > 0:
+        timeseries_ids = timeseries_metadata.groupby(list(timeseries_metadata.columns), sort=False).ngroup().values
+    else:
+        timeseries_ids = np.zeros(len(list_data), dtype=int)
+    target_names = [timeseries[TIMESERIES_KEYS.TARGET_NAME] for timeseries in list_data]
+    timeseries_metadata.index = pd.MultiIndex.from_arrays([timeseries_ids, target_names], names=[TIMESERIES_KEYS.TIMESERIES_ID, TIMESERIES_KEYS.TARGET_NAME])
+    return timeseries_metadata
+
+
+def get_timeseries_identifiers(timeseries_metadata):
+    """Keep one row of identifiers per timeseries id of a timeseries metadata table, so that identifiers can be looked up by id"""
+    timeseries_ids = timeseries_metadata.index.get_level_values(TIMESERIES_KEYS.TIMESERIES_ID)
+    timeseries_identifiers = timeseries_metadata[~timeseries_ids.duplicated()]
+    timeseries_identifiers.index = timeseries_ids[~timeseries_ids.duplicated()]
+    return timeseries_identifiers.sort_index()
+
+
+def allocate_buffer(shape, dtype, directory=None, name=None):
+    """Allocate an array in memory, or in a memory-mapped .npy file of directory so that it is paged to disk instead of held in RAM.
+
+    Args:
+        shape (tuple): Shape of the array.
+        dtype (numpy.dtype): Type of the array values.
+        directory (str, optional): Local directory of the disk-backed dataset. Defaults to None, which means to allocate in memory.
+        name (str, optional): Name of the .npy file without extension. Required if directory is not None.
+
+    Returns:
+        Empty numpy.array or numpy.memmap.
+    """
+    if directory is None:
+        return np.empty(shape, dtype=dtype)
+    return np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+
+def save_columnar_list_dataset(columnar_list_dataset, directory):
+    """Write the buffers of a ColumnarListDataset as .npy files and its other attributes as a small metadata file in a local directory.
+    Buffers already memory-mapped from this directory are only flushed.
+
+    Args:
+        columnar_list_dataset (ColumnarListDataset)
+        directory (str): Local directory path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    buffers = {f"{COLUMNAR_DATASET_FILES.TARGET_PREFIX}{i}": target for i, target in enumerate(columnar_list_dataset.targets)}
+    buffers[COLUMNAR_DATASET_FILES.TIMESERIES_OFFSETS] = columnar_list_dataset.timeseries_offsets
+    buffers[COLUMNAR_DATASET_FILES.START_DATES] = columnar_list_dataset.start_dates
+    if columnar_list_dataset.feat_dynamic_real is not None:
+        buffers[COLUMNAR_DATASET_FILES.FEAT_DYNAMIC_REAL] = columnar_list_dataset.feat_dynamic_real
+    for name, buffer in buffers.items():
+        path = os.path.join(directory, f"{name}.npy")
+        if isinstance(buffer, np.memmap) and buffer.filename == os.path.abspath(path):
+            buffer.flush()
+        else:
+            np.save(path, buffer)
+    if columnar_list_dataset.identifiers is not None:
+        pd.DataFrame(columnar_list_dataset.identifiers).to_pickle(os.path.join(directory, COLUMNAR_DATASET_FILES.IDENTIFIERS))
+    metadata = {
+        "frequency": columnar_list_dataset.frequency,
+        "time_column_name": columnar_list_dataset.time_column_name,
+        "target_columns_names": columnar_list_dataset.target_columns_names,
+        "external_features_columns_names": columnar_list_dataset.external_features_columns_names,
+        "cut_length": columnar_list_dataset.cut_length,
+    }
+    with open(os.path.join(directory, COLUMNAR_DATASET_FILES.METADATA), "w") as metadata_file:
+        json.dump(metadata, metadata_file)
+
+
+def load_columnar_list_dataset(directory, mmap_mode="r"):
+    """Load a ColumnarListDataset saved with save_columnar_list_dataset.
+    With memory mapping, only the pages of the timeseries that are iterated over are read from disk.
+
+    Args:
+        directory (str): Local directory path.
+        mmap_mode (str, optional): numpy.load memory-map mode. Defaults to "r" (read-only). None loads the buffers in memory.
+
+    Returns:
+        ColumnarListDataset
+    """
+    with open(os.path.join(directory, COLUMNAR_DATASET_FILES.METADATA)) as metadata_file:
+        metadata = json.load(metadata_file)
+
+    def load_buffer(name):
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+    identifiers_path = os.path.join(directory, COLUMNAR_DATASET_FILES.IDENTIFIERS)
+    return ColumnarListDataset(
+        frequency=metadata["frequency"],
+        time_column_name=metadata["time_column_name"],
+        target_columns_names=metadata["target_columns_names"],
+        targets=[load_buffer(f"{COLUMNAR_DATASET_FILES.TARGET_PREFIX}{i}") for i in range(len(metadata["target_columns_names"]))],
+        timeseries_offsets=load_buffer(COLUMNAR_DATASET_FILES.TIMESERIES_OFFSETS),
+        start_dates=load_buffer(COLUMNAR_DATASET_FILES.START_DATES),
+        external_features_columns_names=metadata["external_features_columns_names"],
+        feat_dynamic_real=load_buffer(COLUMNAR_DATASET_FILES.FEAT_DYNAMIC_REAL) if metadata["external_features_columns_names"] else None,
+        identifiers=pd.read_pickle(identifiers_path).to_dict("records") if os.path.exists(identifiers_path) else None,
+        cut_length=metadata["cut_length"],
+    )
+
+
+def write_columnar_list_dataset_to_folder(columnar_list_dataset, folder, path, local_directory=None):
+    """Write a ColumnarListDataset to the folder/path directory as flat .npy buffers, an offset index and a small metadata table,
+    so that it can be memory-mapped when it is read.
+
+    Args:
+        columnar_list_dataset (ColumnarListDataset)
+        folder (dataiku.Folder)
+        path (str): Path of the directory within the folder.
+        local_directory (str, optional): Local directory where columnar_list_dataset is already saved. Defaults to None, which means to save it first.
+    """
+    logger.info(f"Saving directory '{path}' to folder")
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        if local_directory is None:
+            local_directory = temporary_directory
+            save_columnar_list_dataset(columnar_list_dataset, local_directory)
+        for file_name in os.listdir(local_directory):
+            with open(os.path.join(local_directory, file_name), "rb") as local_file, folder.get_writer(os.path.join(path, file_name)) as writer:
+                shutil.copyfileobj(local_file, writer)
+
+
+def read_columnar_list_dataset_from_folder(folder, path):
+    """Read a ColumnarListDataset written with write_columnar_list_dataset_to_folder.
+    Buffers of folders on the local filesystem are memory-mapped in place, so only the pages of the timeseries that are used are read.
+    Other folders are first downloaded to a local temporary directory.
+
+    Args:
+        folder (dataiku.Folder)
+        path (str): Path of the directory within the folder.
+
+    Raises:
+        ValueError: No directory was found at the requested path.
+
+    Returns:
+        ColumnarListDataset with memory-mapped buffers.
+    """
+    logger.info(f"Loading directory '{path}' from folder")
+    path_details = folder.get_path_details(path=path)
+    if not path_details["exists"]:
+        raise ValueError(f"Directory at path '{path}' does not exist in folder {folder.get_name()}")
+    try:
+        # only available for folders on the local filesystem
+        local_folder_path = folder.get_path()
+    except Exception:
+        local_folder_path = None
+    if local_folder_path is not None and os.path.isdir(os.path.join(local_folder_path, path.lstrip("/"))):
+        return load_columnar_list_dataset(os.path.join(local_folder_path, path.lstrip("/")))
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        for child in path_details.get("children", []):
+            local_file_path = os.path.join(temporary_directory, child["name"])
+            with folder.get_download_stream(os.path.join(path, child["name"])) as stream, open(local_file_path, "wb") as local_file:
+                shutil.copyfileobj(stream, local_file)
+        # mapped files stay readable after the temporary directory is removed
+        return load_columnar_list_dataset(temporary_directory)
@@ -1,6 +1,17 @@
-from gluonts.dataset.common import ListDataset
-from dku_constants import TIMESERIES_KEYS
+from gluonts_forecasts.columnar_dataset import (
+    ColumnarListDataset,
+    ProjectedListDataset,
+    allocate_buffer,
+    save_columnar_list_dataset,
+    load_columnar_list_dataset,
+)
+from dku_constants import TIMESERIES_KEYS, COLUMNAR_DATASET_FILES, DATASET_BUFFERS_CHUNK_SIZE
+from timeseries_preparation.preparation import MAX_REPORTED_TIMESERIES
+from safe_logger import SafeLogger
 import numpy as np
+import os
+
+logger = SafeLogger("Forecast plugin")
 
 
 class GluonDataset:
@@ -15,6 +26,9 @@ class GluonDataset:
         target_columns_names (list): List of column names to predict
         timeseries_identifiers_names (list): Columns to identify multiple time series when data is in long format
         external_features_columns_names (list): List of columns with dynamic real features over time
+        storage_directory (str): Local directory where the buffers of the datasets are memory-mapped. None to keep them in memory
+        drop_short_timeseries (bool): True to drop the timeseries that are too short instead of raising an error
+        dropped_timeseries_identifiers (DataFrame): Identifiers of the dropped timeseries (one row per timeseries)
     """
 
     def __init__(
@@ -26,6 +40,8 @@ class GluonDataset:
         timeseries_identifiers_names=None,
         external_features_columns_names=None,
         min_length=None,
+        storage_directory=None,
+        drop_short_timeseries=False,
     ):
         self.dataframe = dataframe
         self.time_column_name = time_column_name
@@ -34,116 +50,184 @@ class GluonDataset:
         self.timeseries_identifiers_names = timeseries_identifiers_names
         self.external_features_columns_names = external_features_columns_names
         self.min_length = min_length
+        self.storage_directory = storage_directory
+        self.drop_short_timeseries = drop_short_timeseries
+        self.dropped_timeseries_identifiers = None
 
     def create_list_datasets(self, cut_lengths=[]):
         """Create timeseries for each identifier tuple and each target.
+        Columnar buffers are filled from the dataframe by chunks of rows, in the order of the timeseries, without any sorted copy
+        of the dataframe. The dataset of each cut length is a view of the full dataset, so adding cut lengths costs no extra memory.
+        With a storage_directory, the buffers are written to memory-mapped files and the timeseries are streamed from disk.
 
         Args:
-            cut_length (int, optional): Remove the last cut_length time steps of each timeseries. Defaults to empty list.
+            cut_lengths (list, optional): Remove the last cut_length time steps of each timeseries. Defaults to empty list.
 
         Returns:
-            List of gluonts.dataset.common.ListDataset with extra keys for each timeseries
+            List of ColumnarListDataset (gluonts.dataset.common.ListDataset) with extra keys for each timeseries
         """
-        multivariate_timeseries_per_cut_length = [[] for cut_length in cut_lengths]
+        rows_order, timeseries_offsets = self._get_rows_order_and_offsets()
+        rows_order, timeseries_offsets = self._check_minimum_length(rows_order, timeseries_offsets, max(cut_lengths, default=0))
+        first_rows = timeseries_offsets[:-1] if rows_order is None else rows_order[timeseries_offsets[:-1]]
+
+        if self.storage_directory is not None:
+            os.makedirs(self.storage_directory, exist_ok=True)
+        targets = []
+        for target_index, target_column_name in enumerate(self.target_columns_names):
+            target = allocate_buffer(
+                (timeseries_offsets[-1],),
+                self.dataframe[target_column_name].dtype,
+                self.storage_directory,
+                f"{COLUMNAR_DATASET_FILES.TARGET_PREFIX}{target_index}",
+            )
+            fill_buffer(target, self.dataframe[target_column_name].values, rows_order)
+            targets.append(target)
+        feat_dynamic_real = None
+        if self.external_features_columns_names:
+            feat_dynamic_real = allocate_buffer(
+                (len(self.external_features_columns_names), timeseries_offsets[-1]),
+                self._get_external_features_dtype(self.dataframe),
+                self.storage_directory,
+                COLUMNAR_DATASET_FILES.FEAT_DYNAMIC_REAL,
+            )
+            for feature_index, external_feature_column_name in enumerate(self.external_features_columns_names):
+                fill_buffer(feat_dynamic_real[feature_index], self.dataframe[external_feature_column_name].values, rows_order)
+        identifiers = None
         if self.timeseries_identifiers_names:
-            for identifiers_values, identifiers_df in self.dataframe.groupby(self.timeseries_identifiers_names):
-                for cut_length_index, cut_length in enumerate(cut_lengths):
-                    multivariate_timeseries_per_cut_length[cut_length_index] += self._create_gluon_multivariate_timeseries(
-                        identifiers_df, cut_length, identifiers_values=identifiers_values
-                    )
-        else:
-            for cut_length_index, cut_length in enumerate(cut_lengths):
-                multivariate_timeseries_per_cut_length[cut_length_index] += self._create_gluon_multivariate_timeseries(self.dataframe, cut_length)
-        gluon_list_dataset_per_cut_length = []
-        for multivariate_timeseries in multivariate_timeseries_per_cut_length:
-            gluon_list_dataset_per_cut_length += [ListDataset(multivariate_timeseries, freq=self.frequency)]
-        return gluon_list_dataset_per_cut_length
-
-    def _create_gluon_multivariate_timeseries(self, dataframe, cut_length, identifiers_values=None):
-        """Create a list of timeseries dictionaries for each target column
+            identifiers = self.dataframe.iloc[first_rows][self.timeseries_identifiers_names].to_dict("records")
+
+        full_list_dataset = ColumnarListDataset(
+            frequency=self.frequency,
+            time_column_name=self.time_column_name,
+            target_columns_names=self.target_columns_names,
+            targets=targets,
+            timeseries_offsets=timeseries_offsets,
+            start_dates=self.dataframe[self.time_column_name].values[first_rows],
+            external_features_columns_names=self.external_features_columns_names if self.external_features_columns_names else None,
+            feat_dynamic_real=feat_dynamic_real,
+            identifiers=identifiers,
+        )
+        if self.storage_directory is not None:
+            save_columnar_list_dataset(full_list_dataset, self.storage_directory)
+            full_list_dataset = load_columnar_list_dataset(self.storage_directory)
+        return [full_list_dataset.cut(cut_length) for cut_length in cut_lengths]
+
+    def _get_external_features_dtype(self, dataframe):
+        """Find the most compact type that can store all external features without loss.
+        Binary or low-cardinality integer features (e.g. 0/1 holiday flags) are stored as int8 or int16 instead of float64,
+        they are expanded to float32 by the ProcessDataEntry of the dataset when timeseries are fed to the models.
 
         Args:
-            dataframe (DataFrame): Timeseries dataframe with one or multiple target columns.
-            cut_length (int): Remove the last cut_length time steps of each timeseries.
-            identifiers_values (obj/tuple, optional): Values or tuple of values of the groupby. Defaults to None.
+            dataframe (DataFrame): Dataframe with the external features columns.
 
         Returns:
-            List of timeseries dictionaries
+            numpy.dtype of the external features buffer.
         """
-        self._check_minimum_length(dataframe, cut_length)
-        multivariate_timeseries = []
-        for target_column_name in self.target_columns_names:
-            multivariate_timeseries.append(self._create_gluon_univariate_timeseries(dataframe, target_column_name, cut_length, identifiers_values))
-        return multivariate_timeseries
-
-    def _create_gluon_univariate_timeseries(self, dataframe, target_column_name, cut_length, identifiers_values=None):
-        """Create a dictionary with keys to store information about the timeseries:
-            - start (Pandas.Timestamp): start date of timeseries
-            - target (numpy.array): array of target values
-            - target_name (str): name of target column
-            - time_column_name (str)
-            - feat_dynamic_real (numpy.array, optional): array of external features of shape features x values
-            - feat_dynamic_real_columns_names (list, optional): list of external features column names
-            - identifiers (dict, optional): dictionary of identifiers values (value) by identifiers column name (key)
-
-        Args:
-            dataframe (DataFrame): Timeseries dataframe with one or multiple target columns
-            target_column_name (str)
-            cut_length (int): Remove the last cut_length time steps of each timeseries.
-            identifiers_values (obj/tuple, optional): Values or tuple of values of the groupby. Defaults to None.
+        external_features_dtype = np.result_type(*[dataframe[column_name].dtype for column_name in self.external_features_columns_names])
+        if len(dataframe.index) == 0:
+            return external_features_dtype
+        min_value, max_value = np.inf, -np.inf
+        for external_feature_column_name in self.external_features_columns_names:
+            values = dataframe[external_feature_column_name].values
+            if values.dtype == bool:
+                values = values.view(np.int8)
+            elif not np.issubdtype(values.dtype, np.number):
+                return external_features_dtype
+            elif np.issubdtype(values.dtype, np.floating) and not np.array_equal(values, np.rint(values)):
+                # NaN, infinite and decimal values are kept as floats
+                return external_features_dtype
+            min_value, max_value = min(min_value, values.min()), max(max_value, values.max())
+        for compact_dtype in [np.int8, np.int16]:
+            if np.iinfo(compact_dtype).min <= min_value and max_value <= np.iinfo(compact_dtype).max:
+                return np.dtype(compact_dtype)
+        return external_features_dtype
+
+    def _get_rows_order_and_offsets(self):
+        """Find the order of the rows that groups the rows of each timeseries together (keeping their order within each timeseries)
+        and locate the timeseries in this order. Rows with missing identifiers are removed like in a groupby.
 
         Returns:
-            Dictionary for one timeseries
+            numpy.array of the positions of the rows of the dataframe in the order of the timeseries. None if the dataframe is already in this order.
+            numpy.array of the index of the first row of each timeseries, followed by the number of rows.
         """
-        length = -cut_length if cut_length > 0 else None
-        univariate_timeseries = {
-            TIMESERIES_KEYS.START: dataframe[self.time_column_name].iloc[0],
-            TIMESERIES_KEYS.TARGET: dataframe[target_column_name].iloc[:length].values,
-            TIMESERIES_KEYS.TARGET_NAME: target_column_name,
-            TIMESERIES_KEYS.TIME_COLUMN_NAME: self.time_column_name,
-        }
-        if self.external_features_columns_names:
-            univariate_timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL] = dataframe[self.external_features_columns_names].iloc[:length].values.T
-            univariate_timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL_COLUMNS_NAMES] = self.external_features_columns_names
-        if identifiers_values is not None:
-            if len(self.timeseries_identifiers_names) > 1:
-                identifiers_map = {self.timeseries_identifiers_names[i]: identifier_value for i, identifier_value in enumerate(identifiers_values)}
-            else:
-                identifiers_map = {self.timeseries_identifiers_names[0]: identifiers_values}
-            univariate_timeseries[TIMESERIES_KEYS.IDENTIFIERS] = identifiers_map
-        return univariate_timeseries
-
-    def _check_minimum_length(self, dataframe, cut_length):
-        """Check that the timeseries dataframe has enough values.
+        if not self.timeseries_identifiers_names:
+            return None, np.array([0, len(self.dataframe.index)])
+        group_index = self.dataframe.groupby(self.timeseries_identifiers_names, sort=True, observed=True).ngroup().values
+        rows_order = None
+        if (group_index < 0).any() or (np.diff(group_index) < 0).any():
+            rows_order = np.argsort(group_index, kind="stable")
+            rows_order = rows_order[group_index[rows_order] >= 0]
+            group_index = group_index[rows_order]
+        timeseries_offsets = np.append(0, np.cumsum(np.bincount(group_index))) if len(group_index) > 0 else np.array([0])
+        return rows_order, timeseries_offsets
+
+    def _check_minimum_length(self, rows_order, timeseries_offsets, cut_length):
+        """Check that all timeseries have enough values, based on their number of rows before any timeseries is built.
+        Drop the short timeseries if drop_short_timeseries is True.
 
         Args:
-            dataframe (DataFrame): Timeseries dataframe with one or multiple target columns
-            cut_length (int): Numnber of time steps that will be removed from each timeseries.
+            rows_order (numpy.array): Positions of the rows of the dataframe in the order of the timeseries. None if the dataframe is in this order.
+            timeseries_offsets (numpy.array): Index of the first row of each timeseries, followed by the number of rows.
+            cut_length (int): Maximum number of time steps that will be removed from each timeseries.
 
         Raises:
-            ValueError: If the dataframe doesn't have enough values.
+            ValueError: If timeseries don't have enough values and drop_short_timeseries is False, or if all timeseries are too short.
+
+        Returns:
+            Rows order and timeseries offsets without the short timeseries.
         """
-        min_length = self.min_length
+        min_length = self.min_length or 0
         if cut_length:
             min_length += cut_length
-        if len(dataframe.index) < min_length:
-            raise ValueError(f"Time series must have at least {min_length} values")
+        timeseries_lengths = np.diff(timeseries_offsets)
+        short_timeseries = timeseries_lengths < min_length
+        if not short_timeseries.any():
+            return rows_order, timeseries_offsets
+
+        if rows_order is None:
+            rows_order = np.arange(timeseries_offsets[-1])
+        message = f"Time series must have at least {min_length} values"
+        if self.timeseries_identifiers_names:
+            short_first_rows = rows_order[timeseries_offsets[:-1][short_timeseries]]
+            short_identifiers = self.dataframe.iloc[short_first_rows][self.timeseries_identifiers_names].reset_index(drop=True)
+            short_identifiers_records = short_identifiers.to_dict(orient="records")
+            logger.warning(f"{len(short_identifiers_records)} time series have less than {min_length} values: {short_identifiers_records}")
+            message += f", {len(short_identifiers_records)} time series are too short: {short_identifiers_records[:MAX_REPORTED_TIMESERIES]}"
+            if len(short_identifiers_records) > MAX_REPORTED_TIMESERIES:
+                message += f" and {len(short_identifiers_records) - MAX_REPORTED_TIMESERIES} others (full list in the logs)"
+        if not self.drop_short_timeseries or short_timeseries.all():
+            raise ValueError(message)
+
+        logger.warning(f"Dropping {short_timeseries.sum()} time series with less than {min_length} values")
+        self.dropped_timeseries_identifiers = short_identifiers
+        rows_order = rows_order[np.repeat(~short_timeseries, timeseries_lengths)]
+        timeseries_offsets = np.append(0, np.cumsum(timeseries_lengths[~short_timeseries]))
+        return rows_order, timeseries_offsets
+
+
+def fill_buffer(buffer, values, rows_order=None):
+    """Copy values to a buffer in the order of rows_order, by chunks of rows, so that the reordered values are never all held in memory
+    at once and the chunks written to a memory-mapped buffer can be paged out to disk.
+
+    Args:
+        buffer (numpy.array): One-dimensional array (in memory or memory-mapped) of the size of rows_order.
+        values (numpy.array): Values of a column of the dataframe.
+        rows_order (numpy.array, optional): Positions of the values to copy, in order. Defaults to None, which means to copy all values in order.
+    """
+    for start in range(0, len(buffer), DATASET_BUFFERS_CHUNK_SIZE):
+        end = min(start + DATASET_BUFFERS_CHUNK_SIZE, len(buffer))
+        buffer[start:end] = values[start:end] if rows_order is None else values[rows_order[start:end]]
 
 
-def remove_unused_external_features(list_dataset, frequency):
-    """Copy a gluon list dataset and remove the external features fields
+def remove_unused_external_features(list_dataset):
+    """Project a gluon list dataset to hide its external features fields, without copying it
 
     Args:
         list_dataset (ListDataset): Gluon ListDataset with FEAT_DYNAMIC_REAL fields
-        frequency (str)
 
     Returns:
-        A ListDataset without FEAT_DYNAMIC_REAL fields
-    """    
-    new_list_dataset = []
-    for data in list_dataset.list_data:
-        new_data = data.copy()
-        new_data.pop(TIMESERIES_KEYS.FEAT_DYNAMIC_REAL, None)
-        new_data.pop(TIMESERIES_KEYS.FEAT_DYNAMIC_REAL_COLUMNS_NAMES, None)
-        new_list_dataset.append(new_data)
-    return ListDataset(new_list_dataset, freq=frequency)
+        A ProjectedListDataset (gluonts.dataset.common.ListDataset) without FEAT_DYNAMIC_REAL fields
+    """
+    return ProjectedListDataset(
+        list_dataset, hidden_fields=[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL, TIMESERIES_KEYS.FEAT_DYNAMIC_REAL_COLUMNS_NAMES]
+    )
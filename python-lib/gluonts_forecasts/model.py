@@ -1,7 +1,8 @@
-from dku_constants import EVALUATION_METRICS_DESCRIPTIONS, METRICS_DATASET, TIMESERIES_KEYS, CUSTOMISABLE_FREQUENCIES_OFFSETS
+from dku_constants import EVALUATION_METRICS_DESCRIPTIONS, METRICS_DATASET, TIMESERIES_KEYS, TIMESERIES_STATISTICS, CUSTOMISABLE_FREQUENCIES_OFFSETS
 from gluonts.evaluation.backtest import make_evaluation_predictions
-from gluonts.evaluation import Evaluator
 from gluonts_forecasts.gluon_dataset import remove_unused_external_features
+from gluonts_forecasts.columnar_dataset import get_timeseries_metadata
+from gluonts_forecasts.timeseries_statistics import get_timeseries_statistics, PrecomputedStatisticsEvaluator
 from gluonts_forecasts.model_handler import ModelHandler
 from gluonts_forecasts.utils import concat_timeseries_per_identifiers, concat_all_timeseries, quantile_forecasts_series
 from time import perf_counter
@@ -109,7 +110,7 @@ class Model(ModelHandler):
         self.retraining_time = perf_counter() - start
         logger.info(f"Re-training {self.get_label()} model on entire dataset: Done in {self.retraining_time:.2f} seconds")
 
-    def train_evaluate(self, train_list_dataset, test_list_dataset, make_forecasts=False, retrain=False):
+    def train_evaluate(self, train_list_dataset, test_list_dataset, make_forecasts=False, retrain=False, timeseries_statistics=None):
         """Train Model on train_list_dataset and evaluate it on test_list_dataset. Then retrain on test_list_dataset if retrain=True.
 
         Args:
@@ -117,6 +118,8 @@ class Model(ModelHandler):
             test_list_dataset (gluonts.dataset.common.ListDataset): ListDataset created with the GluonDataset class.
             make_forecasts (bool, optional): Whether to make the evaluation forecasts and return them. Defaults to False.
             retrain (bool, optional): Whether to retrain model on test_list_dataset after the evaluation. Defaults to False.
+            timeseries_statistics (DataFrame, optional): Statistics of the timeseries of test_list_dataset without their last prediction_length values,
+                shared by all models of a training session. Defaults to None, which means to compute them.
 
         Returns:
             Evaluation metrics DataFrame for each target and aggregated.
@@ -124,36 +127,41 @@ class Model(ModelHandler):
             DataFrame of predictions for the last prediction_length timesteps of the test_list_dataset timeseries if make_forecasts is True.
         """
         if not self.use_external_features and TIMESERIES_KEYS.FEAT_DYNAMIC_REAL in train_list_dataset.list_data[0]:
-            train_list_dataset = remove_unused_external_features(train_list_dataset, self.frequency)
-            test_list_dataset = remove_unused_external_features(test_list_dataset, self.frequency)
+            train_list_dataset = remove_unused_external_features(train_list_dataset)
+            test_list_dataset = remove_unused_external_features(test_list_dataset)
+
+        if timeseries_statistics is None:
+            timeseries_statistics = get_timeseries_statistics(test_list_dataset, self.frequency, cut_length=self.prediction_length)
 
         logger.info(f"Evaluating {self.get_label()} model performance...")
         start = perf_counter()
         evaluation_predictor = self._train_estimator(train_list_dataset)
 
-        agg_metrics, item_metrics, forecasts = self._make_evaluation_predictions(evaluation_predictor, test_list_dataset)
+        agg_metrics, item_metrics, forecasts = self._make_evaluation_predictions(evaluation_predictor, test_list_dataset, timeseries_statistics)
         self.evaluation_time = perf_counter() - start
         logger.info(f"Evaluating {self.get_label()} model performance: Done in {self.evaluation_time:.2f} seconds")
 
         if retrain:
             self.train(test_list_dataset)
 
-        metrics, identifiers_columns = self._format_metrics(agg_metrics, item_metrics, train_list_dataset)
+        timeseries_metadata = get_timeseries_metadata(train_list_dataset)
+        metrics, identifiers_columns = self._format_metrics(agg_metrics, item_metrics, timeseries_metadata, timeseries_statistics)
 
         if make_forecasts:
-            median_forecasts_timeseries = self._compute_median_forecasts_timeseries(forecasts, train_list_dataset)
+            median_forecasts_timeseries = self._compute_median_forecasts_timeseries(forecasts, timeseries_metadata)
             multiple_df = concat_timeseries_per_identifiers(median_forecasts_timeseries)
-            forecasts_df = concat_all_timeseries(multiple_df)
+            forecasts_df = concat_all_timeseries(multiple_df, timeseries_metadata)
             return metrics, identifiers_columns, forecasts_df
 
         return metrics, identifiers_columns
 
-    def _make_evaluation_predictions(self, predictor, test_list_dataset):
+    def _make_evaluation_predictions(self, predictor, test_list_dataset, timeseries_statistics):
         """Evaluate predictor and generate sample forecasts.
 
         Args:
             predictor (gluonts.model.predictor.Predictor): Trained object used to make forecasts.
             test_list_dataset (gluonts.dataset.common.ListDataset): ListDataset created with the GluonDataset class.
+            timeseries_statistics (DataFrame): Statistics of the timeseries of test_list_dataset before the forecasts dates.
 
         Returns:
             Dictionary of aggregated metrics over all timeseries.
@@ -165,17 +173,23 @@ class Model(ModelHandler):
             forecasts = list(forecast_it)
         except Exception as err:
             raise ModelPredictionError(f"GluonTS '{self.model_name}' model crashed when making predictions. Full error: {err}")
-        evaluator = Evaluator(num_workers=min(2, multiprocessing.cpu_count()))
+        for i, forecast in enumerate(forecasts):
+            # position of the timeseries in the statistics table, used by the evaluator to look up its seasonal error
+            forecast.item_id = i
+        # models trained in the worker processes of a parallel session cannot start their own pool of evaluation processes
+        num_workers = 0 if multiprocessing.current_process().daemon else min(2, multiprocessing.cpu_count())
+        evaluator = PrecomputedStatisticsEvaluator(timeseries_statistics, num_workers=num_workers)
         agg_metrics, item_metrics = evaluator(ts_it, forecasts, num_series=len(test_list_dataset))
         return agg_metrics, item_metrics, forecasts
 
-    def _format_metrics(self, agg_metrics, item_metrics, train_list_dataset):
+    def _format_metrics(self, agg_metrics, item_metrics, timeseries_metadata, timeseries_statistics):
         """Append agg_metrics to item_metrics and add new columns: model_name, target_column, identifiers_columns
 
         Args:
             agg_metrics (dict): Dictionary of aggregated metrics over all timeseries.
             item_metrics (DataFrame): [description]
-            train_list_dataset (gluonts.dataset.common.ListDataset): ListDataset created with the GluonDataset class.
+            timeseries_metadata (DataFrame): Timeseries metadata table of the ListDataset used for training.
+            timeseries_statistics (DataFrame): Statistics of the timeseries used for training.
 
         Returns:
             DataFrame of metrics, model name, target column and identifiers columns.
@@ -183,22 +197,14 @@ class Model(ModelHandler):
         item_metrics[METRICS_DATASET.MODEL_COLUMN] = ModelHandler.get_label(self)
         agg_metrics[METRICS_DATASET.MODEL_COLUMN] = ModelHandler.get_label(self)
 
-        identifiers_columns = (
-            list(train_list_dataset.list_data[0][TIMESERIES_KEYS.IDENTIFIERS].keys()) if TIMESERIES_KEYS.IDENTIFIERS in train_list_dataset.list_data[0] else []
-        )
-        identifiers_values = {identifiers_column: [] for identifiers_column in identifiers_columns}
-        target_columns = []
-        for univariate_timeseries in train_list_dataset.list_data:
-            target_columns += [univariate_timeseries[TIMESERIES_KEYS.TARGET_NAME]]
-            for identifiers_column in identifiers_columns:
-                identifiers_values[identifiers_column] += [univariate_timeseries[TIMESERIES_KEYS.IDENTIFIERS][identifiers_column]]
-
-        item_metrics[METRICS_DATASET.TARGET_COLUMN] = target_columns
+        identifiers_columns = list(timeseries_metadata.columns)
+
+        item_metrics[METRICS_DATASET.TARGET_COLUMN] = timeseries_metadata.index.get_level_values(TIMESERIES_KEYS.TARGET_NAME).values
         agg_metrics[METRICS_DATASET.TARGET_COLUMN] = METRICS_DATASET.AGGREGATED_ROW
         agg_metrics[METRICS_DATASET.TRAINING_TIME] = self.evaluation_time + self.retraining_time
 
         for identifiers_column in identifiers_columns:
-            item_metrics[identifiers_column] = identifiers_values[identifiers_column]
+            item_metrics[identifiers_column] = timeseries_metadata[identifiers_column].values
             agg_metrics[identifiers_column] = METRICS_DATASET.AGGREGATED_ROW  # or keep empty but will cast integer to float
 
         metrics = item_metrics.append(agg_metrics, ignore_index=True)
@@ -210,7 +216,7 @@ class Model(ModelHandler):
             + list(EVALUATION_METRICS_DESCRIPTIONS.keys())
             + [METRICS_DATASET.TRAINING_TIME]
         ]
-        metrics[METRICS_DATASET.MODEL_PARAMETERS] = self._get_model_parameters_json(train_list_dataset)
+        metrics[METRICS_DATASET.MODEL_PARAMETERS] = self._get_model_parameters_json(timeseries_statistics)
 
         return metrics, identifiers_columns
 
@@ -238,10 +244,10 @@ class Model(ModelHandler):
                 raise ModelTrainingError(f"GluonTS '{self.model_name}' model crashed during training. Full error: {err}")
         return predictor
 
-    def _get_model_parameters_json(self, train_list_dataset):
+    def _get_model_parameters_json(self, timeseries_statistics):
         """ Returns a JSON string containing model parameters and results """
-        timeseries_number = len(train_list_dataset.list_data)
-        timeseries_total_length = sum([len(ts[TIMESERIES_KEYS.TARGET]) for ts in train_list_dataset.list_data])
+        timeseries_number = len(timeseries_statistics.index)
+        timeseries_total_length = int(timeseries_statistics[TIMESERIES_STATISTICS.LENGTH].sum())
         model_params = {
             "model_name": ModelHandler.get_label(self),
             "frequency": self.frequency,
@@ -261,28 +267,23 @@ class Model(ModelHandler):
             model_params["mxnet.context"] = str(self.mxnet_context)
         return json.dumps(model_params)
 
-    def _compute_median_forecasts_timeseries(self, forecasts_list, train_list_dataset):
+    def _compute_median_forecasts_timeseries(self, forecasts_list, timeseries_metadata):
         """Compute median forecasts timeseries for each Forecast of forecasts_list.
 
         Args:
             forecasts_list (list): List of gluonts.model.forecast.Forecast (objects storing the predicted distributions as samples).
-            train_list_dataset (gluonts.dataset.common.ListDataset): ListDataset created with the GluonDataset class.
+            timeseries_metadata (DataFrame): Timeseries metadata table of the ListDataset used for evaluation.
 
         Returns:
-            Dictionary of list of forecasts timeseries (value) by identifiers (key). Key is None if no identifiers.
+            Dictionary of list of forecasts timeseries (value) by timeseries id (key).
         """
+        timeseries_ids = timeseries_metadata.index.get_level_values(TIMESERIES_KEYS.TIMESERIES_ID).values
+        target_names = timeseries_metadata.index.get_level_values(TIMESERIES_KEYS.TARGET_NAME).values
         median_forecasts_timeseries = {}
         for i, sample_forecasts in enumerate(forecasts_list):
-            series = quantile_forecasts_series(sample_forecasts, 0.5, self.custom_frequency).rename(
-                f"{self.model_name}_{train_list_dataset.list_data[i][TIMESERIES_KEYS.TARGET_NAME]}"
-            )
-            if TIMESERIES_KEYS.IDENTIFIERS in train_list_dataset.list_data[i]:
-                timeseries_identifier_key = tuple(sorted(train_list_dataset.list_data[i][TIMESERIES_KEYS.IDENTIFIERS].items()))
-            else:
-                timeseries_identifier_key = None
-
-            if timeseries_identifier_key in median_forecasts_timeseries:
-                median_forecasts_timeseries[timeseries_identifier_key] += [series]
+            series = quantile_forecasts_series(sample_forecasts, 0.5, self.custom_frequency).rename(f"{self.model_name}_{target_names[i]}")
+            if timeseries_ids[i] in median_forecasts_timeseries:
+                median_forecasts_timeseries[timeseries_ids[i]] += [series]
             else:
-                median_forecasts_timeseries[timeseries_identifier_key] = [series]
+                median_forecasts_timeseries[timeseries_ids[i]] = [series]
         return median_forecasts_timeseries
@@ -0,0 +1,147 @@
+from gluonts.evaluation import Evaluator
+from gluonts.time_feature import get_seasonality
+from gluonts_forecasts.columnar_dataset import ColumnarListDataset, ProjectedListDataset
+from dku_constants import TIMESERIES_KEYS, TIMESERIES_STATISTICS, STATISTICS_CHUNK_SIZE
+import numpy as np
+import pandas as pd
+
+
+def get_timeseries_statistics(list_dataset, frequency, cut_length=0):
+    """Compute statistics of each univariate timeseries of a gluon list dataset, in the order of list_data.
+    Statistics of columnar datasets are computed with cumulative sums over the target buffers, without building any timeseries.
+    Buffers are read by chunks of whole timeseries, so that memory-mapped buffers are never fully loaded in memory.
+
+    Args:
+        list_dataset (gluonts.dataset.common.ListDataset): ListDataset created with the GluonDataset class.
+        frequency (str): Pandas timeseries frequency used to find the seasonality of the seasonal naive error.
+        cut_length (int, optional): Ignore the last cut_length values of each timeseries. Defaults to 0.
+
+    Returns:
+        DataFrame with one row per univariate timeseries and columns length, mean, scale (mean of absolute values),
+        zero_ratio and seasonal_error (mean absolute error of the seasonal naive forecast, as computed by the GluonTS Evaluator).
+    """
+    seasonality = get_seasonality(frequency)
+    if isinstance(list_dataset, ProjectedListDataset):
+        return get_timeseries_statistics(list_dataset.list_dataset, frequency, cut_length)
+    if isinstance(list_dataset, ColumnarListDataset):
+        starts = list_dataset.timeseries_offsets[:-1]
+        ends = np.maximum(list_dataset.timeseries_offsets[1:] - list_dataset.cut_length - cut_length, starts)
+        timeseries_statistics = []
+        for target in list_dataset.targets:
+            timeseries_statistics += [_compute_chunked_buffer_statistics(target, starts, ends, seasonality)]
+        # interleave targets to follow the order of list_data (all targets of the first timeseries, then all targets of the second one, ...)
+        return pd.concat(timeseries_statistics, keys=range(len(timeseries_statistics))).swaplevel().sort_index().reset_index(drop=True)
+    timeseries_statistics = []
+    for timeseries in list_dataset.list_data:
+        target = np.asarray(timeseries[TIMESERIES_KEYS.TARGET], dtype=float)
+        target = target[: max(len(target) - cut_length, 0)]
+        timeseries_statistics += [_compute_buffer_statistics(target, np.array([0]), np.array([len(target)]), seasonality)]
+    if not timeseries_statistics:
+        return _compute_buffer_statistics(np.array([]), np.array([], dtype=int), np.array([], dtype=int), seasonality)
+    return pd.concat(timeseries_statistics, ignore_index=True)
+
+
+def _compute_chunked_buffer_statistics(values, starts, ends, seasonality):
+    """Compute the statistics of the timeseries located between starts and ends in values, by chunks of whole timeseries.
+    Only the values of one chunk are converted to floats at a time.
+
+    Args:
+        values (numpy.array): Target values of all timeseries, possibly memory-mapped.
+        starts (numpy.array): Index of the first value of each timeseries, in increasing order.
+        ends (numpy.array): Index after the last value of each timeseries, in increasing order.
+        seasonality (int): Seasonality of the seasonal naive error.
+
+    Returns:
+        DataFrame of statistics with one row per timeseries.
+    """
+    if len(starts) == 0:
+        return _compute_buffer_statistics(np.array([]), starts, ends, seasonality)
+    chunks_statistics = []
+    chunk_first = 0
+    while chunk_first < len(starts):
+        # a chunk holds at least one timeseries, and as many following ones as fit in STATISTICS_CHUNK_SIZE values
+        chunk_last = max(np.searchsorted(ends, starts[chunk_first] + STATISTICS_CHUNK_SIZE, side="right"), chunk_first + 1)
+        chunk_start, chunk_end = starts[chunk_first], ends[chunk_last - 1]
+        chunk_values = np.asarray(values[chunk_start:chunk_end], dtype=float)
+        chunks_statistics += [
+            _compute_buffer_statistics(chunk_values, starts[chunk_first:chunk_last] - chunk_start, ends[chunk_first:chunk_last] - chunk_start, seasonality)
+        ]
+        chunk_first = chunk_last
+    return pd.concat(chunks_statistics, ignore_index=True)
+
+
+def _compute_buffer_statistics(values, starts, ends, seasonality):
+    """Compute the statistics of the timeseries located between starts and ends in values with cumulative sums. Missing values are ignored.
+
+    Args:
+        values (numpy.array): Target values of all timeseries.
+        starts (numpy.array): Index of the first value of each timeseries.
+        ends (numpy.array): Index after the last value of each timeseries.
+        seasonality (int): Seasonality of the seasonal naive error.
+
+    Returns:
+        DataFrame of statistics with one row per timeseries.
+    """
+    lengths = ends - starts
+    observed = ~np.isnan(values)
+    observed_count = _sum_between(observed, starts, ends)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = _sum_between(np.where(observed, values, 0), starts, ends) / observed_count
+        scale = _sum_between(np.where(observed, np.abs(values), 0), starts, ends) / observed_count
+        zero_ratio = _sum_between(values == 0, starts, ends) / lengths
+        # like the GluonTS Evaluator, fall back to a lag of 1 when the timeseries is not longer than the seasonality
+        seasonal_errors_sum, seasonal_errors_count = _sum_lagged_absolute_errors(values, starts, ends, seasonality)
+        naive_errors_sum, naive_errors_count = _sum_lagged_absolute_errors(values, starts, ends, 1)
+        is_seasonal = seasonality < lengths
+        seasonal_error = np.where(is_seasonal, seasonal_errors_sum, naive_errors_sum) / np.where(is_seasonal, seasonal_errors_count, naive_errors_count)
+    return pd.DataFrame(
+        {
+            TIMESERIES_STATISTICS.LENGTH: lengths,
+            TIMESERIES_STATISTICS.MEAN: mean,
+            TIMESERIES_STATISTICS.SCALE: scale,
+            TIMESERIES_STATISTICS.ZERO_RATIO: zero_ratio,
+            TIMESERIES_STATISTICS.SEASONAL_ERROR: seasonal_error,
+        }
+    )
+
+
+def _sum_between(values, starts, ends):
+    """Sum values between each start (included) and end (excluded) index with a cumulative sum"""
+    cumulative_sum = np.append(0, np.cumsum(values, dtype=float))
+    return cumulative_sum[ends] - cumulative_sum[starts]
+
+
+def _sum_lagged_absolute_errors(values, starts, ends, lag):
+    """Sum and count the observed absolute differences between values lag steps apart within each timeseries"""
+    if lag >= len(values):
+        return np.zeros(len(starts)), np.zeros(len(starts))
+    absolute_errors = np.abs(values[lag:] - values[:-lag])
+    observed = ~np.isnan(absolute_errors)
+    # differences starting from index i of a timeseries are valid for start <= i < end - lag
+    lagged_starts = np.minimum(starts, len(absolute_errors))
+    lagged_ends = np.clip(ends - lag, lagged_starts, len(absolute_errors))
+    return (
+        _sum_between(np.where(observed, absolute_errors, 0), lagged_starts, lagged_ends),
+        _sum_between(observed, lagged_starts, lagged_ends),
+    )
+
+
+class PrecomputedStatisticsEvaluator(Evaluator):
+    """
+    GluonTS Evaluator using the seasonal errors of a timeseries statistics table instead of recomputing them for every model.
+    Forecasts must have the position of their timeseries in the statistics table as item_id.
+
+    Attributes:
+        timeseries_statistics (DataFrame): Statistics of the timeseries computed on the data before the forecasts dates.
+    """
+
+    def __init__(self, timeseries_statistics, **kwargs):
+        super().__init__(**kwargs)
+        self.seasonal_errors = timeseries_statistics[TIMESERIES_STATISTICS.SEASONAL_ERROR].values
+
+    def extract_past_data(self, time_series, forecast):
+        # past data is only needed by the seasonal error (which is precomputed) and the OWA metric (which is not computed)
+        return np.array([])
+
+    def seasonal_error(self, past_data, forecast):
+        return self.seasonal_errors[forecast.item_id]
@@ -2,7 +2,9 @@ import pandas as pd
 import numpy as np
 from gluonts_forecasts.model_handler import ModelHandler, get_model_label
 from gluonts_forecasts.gluon_dataset import remove_unused_external_features
+from gluonts_forecasts.columnar_dataset import get_timeseries_metadata
 from gluonts_forecasts.utils import concat_timeseries_per_identifiers, concat_all_timeseries, add_row_origin, quantile_forecasts_series
+from timeseries_preparation.preparation import encode_timeseries_identifiers, decode_timeseries_identifiers, get_categorical_dtypes
 from dku_constants import METRICS_DATASET, METRICS_COLUMNS_DESCRIPTIONS, TIMESERIES_KEYS, ROW_ORIGIN, CUSTOMISABLE_FREQUENCIES_OFFSETS
 from gluonts.model.forecast import QuantileForecast
 from safe_logger import SafeLogger
@@ -37,6 +39,7 @@ class TrainedModel:
         self.time_column_name = None
         self.identifiers_columns = None
         self.forecasts_df = None
+        self.timeseries_metadata = None
         self.frequency = gluon_dataset.process.trans[0].freq
         self.history_length_limit = history_length_limit
         self.model_name = model_name
@@ -50,23 +53,26 @@ class TrainedModel:
         model_handler = ModelHandler(self.model_name)
         if self.model_name and not model_handler.can_use_external_feature() and TIMESERIES_KEYS.FEAT_DYNAMIC_REAL in self.gluon_dataset.list_data[0]:
             # remove external features from the ListDataset used for predictions if the model cannot use them
-            gluon_dataset_without_external_features = remove_unused_external_features(self.gluon_dataset, self.frequency)
+            gluon_dataset_without_external_features = remove_unused_external_features(self.gluon_dataset)
             forecasts = self.predictor.predict(gluon_dataset_without_external_features)
         else:
             forecasts = self.predictor.predict(self.gluon_dataset)
 
         forecasts_list = list(forecasts)
 
+        # metadata of all timeseries with their identifiers keys, computed once for forecasts and history formatting
+        self.timeseries_metadata = get_timeseries_metadata(self.gluon_dataset)
+
         forecasts_timeseries = self._compute_forecasts_timeseries(forecasts_list)
 
         multiple_df = concat_timeseries_per_identifiers(forecasts_timeseries)
 
-        self.forecasts_df = concat_all_timeseries(multiple_df)
+        self.forecasts_df = concat_all_timeseries(multiple_df, self.timeseries_metadata)
 
         self.time_column_name = self.gluon_dataset.list_data[0][TIMESERIES_KEYS.TIME_COLUMN_NAME]
-        self.identifiers_columns = (
-            list(self.gluon_dataset.list_data[0][TIMESERIES_KEYS.IDENTIFIERS].keys()) if TIMESERIES_KEYS.IDENTIFIERS in self.gluon_dataset.list_data[0] else []
-        )
+        self.identifiers_columns = list(self.timeseries_metadata.columns)
+        # merges and sorts are done on integer codes, identifiers are decoded in get_forecasts_df
+        encode_timeseries_identifiers(self.forecasts_df, self.identifiers_columns)
 
         if self.include_history:
             self.forecasts_df = self._include_history(self.frequency, history_length_limit=self.history_length_limit)
@@ -87,7 +93,8 @@ class TrainedModel:
         """
         history_timeseries = self._retrieve_history_timeseries(frequency, history_length_limit)
         multiple_df = concat_timeseries_per_identifiers(history_timeseries)
-        history_df = concat_all_timeseries(multiple_df)
+        history_df = concat_all_timeseries(multiple_df, self.timeseries_metadata)
+        encode_timeseries_identifiers(history_df, self.identifiers_columns, get_categorical_dtypes(self.forecasts_df, self.identifiers_columns))
         return history_df.merge(self.forecasts_df, on=["index"] + self.identifiers_columns, how="left", indicator=True)
 
     def _generate_history_target_series(self, timeseries, frequency, history_length_limit=None):
@@ -102,7 +109,11 @@ class TrainedModel:
             Series with DatetimeIndex.
         """
         target_series = pd.Series(
-            np.append(timeseries[TIMESERIES_KEYS.TARGET], np.repeat(np.nan, self.prediction_length)),
+            np.append(
+                timeseries[TIMESERIES_KEYS.TARGET],
+                # keep float32 targets of compact mode instead of upcasting them to float64
+                np.full(self.prediction_length, np.nan, dtype=np.result_type(timeseries[TIMESERIES_KEYS.TARGET].dtype, np.float32)),
+            ),
             name=timeseries[TIMESERIES_KEYS.TARGET_NAME],
             index=pd.date_range(
                 start=timeseries[TIMESERIES_KEYS.START],
@@ -146,27 +157,23 @@ class TrainedModel:
             history_length_limit (int): Maximum number of values to retrieve from historical data per timeseries. Default to None which means all.
 
         Returns:
-            Dictionary of list of timeseries by identifiers (None if no identifiers)
+            Dictionary of list of timeseries by timeseries id
         """
+        timeseries_ids = self.timeseries_metadata.index.get_level_values(TIMESERIES_KEYS.TIMESERIES_ID).values
         history_timeseries = {}
-        for i, timeseries in enumerate(self.gluon_dataset.list_data):
-            if TIMESERIES_KEYS.IDENTIFIERS in timeseries:
-                timeseries_identifier_key = tuple(sorted(timeseries[TIMESERIES_KEYS.IDENTIFIERS].items()))
-            else:
-                timeseries_identifier_key = None
-
+        for timeseries, timeseries_id in zip(self.gluon_dataset.list_data, timeseries_ids):
             target_series = self._generate_history_target_series(timeseries, frequency, history_length_limit)
 
             if TIMESERIES_KEYS.FEAT_DYNAMIC_REAL_COLUMNS_NAMES in timeseries:
                 assert timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL].shape[1] >= len(timeseries[TIMESERIES_KEYS.TARGET]) + self.prediction_length
-                if timeseries_identifier_key not in history_timeseries:
+                if timeseries_id not in history_timeseries:
                     external_features_df = self._generate_history_external_features_dataframe(timeseries, frequency, history_length_limit)
-                    history_timeseries[timeseries_identifier_key] = [external_features_df]
+                    history_timeseries[timeseries_id] = [external_features_df]
 
-            if timeseries_identifier_key in history_timeseries:
-                history_timeseries[timeseries_identifier_key] += [target_series]
+            if timeseries_id in history_timeseries:
+                history_timeseries[timeseries_id] += [target_series]
             else:
-                history_timeseries[timeseries_identifier_key] = [target_series]
+                history_timeseries[timeseries_id] = [target_series]
         return history_timeseries
 
     def _compute_forecasts_timeseries(self, forecasts_list):
@@ -176,15 +183,12 @@ class TrainedModel:
             forecasts_list (list): List of gluonts.model.forecast.Forecast (objects storing the predicted distributions as samples).
 
         Returns:
-            Dictionary of list of forecasts timeseries by identifiers (None if no identifiers)
+            Dictionary of list of forecasts timeseries by timeseries id
         """
+        timeseries_ids = self.timeseries_metadata.index.get_level_values(TIMESERIES_KEYS.TIMESERIES_ID).values
+        target_names = self.timeseries_metadata.index.get_level_values(TIMESERIES_KEYS.TARGET_NAME).values
         forecasts_timeseries = {}
         for i, sample_forecasts in enumerate(forecasts_list):
-            if TIMESERIES_KEYS.IDENTIFIERS in self.gluon_dataset.list_data[i]:
-                timeseries_identifier_key = tuple(sorted(self.gluon_dataset.list_data[i][TIMESERIES_KEYS.IDENTIFIERS].items()))
-            else:
-                timeseries_identifier_key = None
-
             if i == 0 and isinstance(sample_forecasts, QuantileForecast):
                 self.quantiles = self._round_to_existing_quantiles(sample_forecasts)
 
@@ -197,13 +201,13 @@ class TrainedModel:
 
                 forecasts_series = (
                     quantile_forecasts_series(sample_forecasts, quantile, self.frequency)
-                    .rename(f"{forecasts_label_prefix}_{self.gluon_dataset.list_data[i][TIMESERIES_KEYS.TARGET_NAME]}")
+                    .rename(f"{forecasts_label_prefix}_{target_names[i]}")
                     .iloc[: self.prediction_length]
                 )
-                if timeseries_identifier_key in forecasts_timeseries:
-                    forecasts_timeseries[timeseries_identifier_key] += [forecasts_series]
+                if timeseries_ids[i] in forecasts_timeseries:
+                    forecasts_timeseries[timeseries_ids[i]] += [forecasts_series]
                 else:
-                    forecasts_timeseries[timeseries_identifier_key] = [forecasts_series]
+                    forecasts_timeseries[timeseries_ids[i]] = [forecasts_series]
         return forecasts_timeseries
 
     def _reorder_forecasts_df(self):
@@ -220,7 +224,7 @@ class TrainedModel:
         Returns:
             Forecasts DaaFrame
         """
-        if TIMESERIES_KEYS.IDENTIFIERS in self.gluon_dataset.list_data[0]:
+        if self.identifiers_columns:
             self._reorder_forecasts_df()
         if session:
             self.forecasts_df[METRICS_DATASET.SESSION] = session
@@ -230,6 +234,7 @@ class TrainedModel:
         self.forecasts_df = self.forecasts_df.sort_values(
             by=self.identifiers_columns + [self.time_column_name], ascending=[True] * len(self.identifiers_columns) + [False]
         )
+        decode_timeseries_identifiers(self.forecasts_df, self.identifiers_columns)
 
         return self.forecasts_df
 
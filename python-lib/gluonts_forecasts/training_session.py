@@ -1,12 +1,17 @@
 import pandas as pd
+import numpy as np
 import os
-import math
+import multiprocessing
+import dill as pickle
+from time import time
+from threadpoolctl import threadpool_limits
 from pandas.api.types import is_numeric_dtype, is_string_dtype
 from gluonts_forecasts.model import Model
-from dku_constants import METRICS_DATASET, METRICS_COLUMNS_DESCRIPTIONS, TIMESERIES_KEYS, EVALUATION_METRICS_DESCRIPTIONS, ROW_ORIGIN
-from gluonts_forecasts.gluon_dataset import GluonDataset
+from dku_constants import METRICS_DATASET, METRICS_COLUMNS_DESCRIPTIONS, TIMESERIES_STATISTICS, EVALUATION_METRICS_DESCRIPTIONS, ROW_ORIGIN, TRAINING_STATUS
+from gluonts_forecasts.gluon_dataset import GluonDataset, remove_unused_external_features
+from gluonts_forecasts.timeseries_statistics import get_timeseries_statistics
 from gluonts_forecasts.model_handler import list_available_models
-from gluonts_forecasts.utils import add_row_origin
+from timeseries_preparation.preparation import decode_timeseries_identifiers
 from safe_logger import SafeLogger
 
 
@@ -24,7 +29,8 @@ class TrainingSession:
         epoch (int): Number of epochs used by the GluonTS Trainer class
         models_parameters (dict): Dictionary of model names (key) and their parameters (value)
         prediction_length (int): Number of time steps to predict
-        training_df (DataFrame): Training dataframe
+        training_df (DataFrame): Training dataframe. Once the gluon datasets are built, only its columns joined to the evaluation forecasts are kept,
+            and it is released before training if no forecasts are made
         make_forecasts (bool): True to output the evaluation predictions of the last prediction_length time steps
         external_features_columns_names (list): List of columns with dynamic real features over time
         timeseries_identifiers_names (list): Columns to identify multiple time series when data is in long format
@@ -33,6 +39,21 @@ class TrainingSession:
         num_batches_per_epoch (int): Number of batches per epoch
         season_length (int): Length of the seasonality parameter.
         mxnet_context (mxnet.context.Context): MXNet context to use for Deep Learning models training.
+        storage_directory (str): Local directory where the gluon datasets are memory-mapped to train with bounded memory. None to keep them in memory
+        drop_short_timeseries (bool): True to drop the timeseries that are too short to be trained and evaluated on instead of failing
+        timeseries_statistics (DataFrame): Statistics of the timeseries of the evaluation train dataset, computed once and shared by all models
+        num_workers (int): Number of processes training and evaluating models in parallel. 1 to train models one after another
+        cores_per_model (int): Number of CPU cores each worker process is pinned to. None to split the available cores evenly between workers
+        checkpoint (SessionCheckpoint): Checkpoint where each model is saved as soon as it is completed, and where models completed
+            before an interruption are loaded from. None to keep models in memory until the end of the session
+        backtest_folds (int): Number of successive prediction_length windows each model is evaluated on (rolling-origin backtest).
+            1 to evaluate only on the last prediction_length time steps
+        backtest_list_datasets (list): Train and test gluon list datasets of the backtest folds before the last one, from the most recent to the oldest
+        backtest_timeseries_statistics (list): Statistics of the timeseries of the train dataset of each fold of backtest_list_datasets
+        time_budget (float): Maximum number of seconds to train and evaluate all models. None for no limit
+        estimated_training_times (dict): Estimated run time in seconds (value) by model label (key), e.g. of the previous session
+        deadline (float): Wall-clock time at which the time budget runs out. None for no limit
+        unfinished_tasks (dict): Training status (value) by (model index, fold index) (key) of the models not completed within the time budget
     """
 
     def __init__(
@@ -51,6 +72,14 @@ class TrainingSession:
         user_num_batches_per_epoch=None,
         season_length=None,
         mxnet_context=None,
+        storage_directory=None,
+        drop_short_timeseries=False,
+        num_workers=1,
+        cores_per_model=None,
+        checkpoint=None,
+        backtest_folds=1,
+        time_budget=None,
+        estimated_training_times=None,
     ):
         self.models_parameters = models_parameters
         self.models = []
@@ -68,16 +97,29 @@ class TrainingSession:
         self.session_name = None
         self.session_path = None
         if self.make_forecasts:
-            self.forecasts_df = pd.DataFrame()
             self.evaluation_forecasts_df = None
         self.evaluation_train_list_dataset = None
         self.full_list_dataset = None
+        self.list_datasets_without_external_features = None
+        self.timeseries_statistics = None
         self.metrics_df = None
         self.batch_size = batch_size
         self.user_num_batches_per_epoch = user_num_batches_per_epoch
         self.num_batches_per_epoch = None
         self.season_length = season_length
         self.mxnet_context = mxnet_context
+        self.storage_directory = storage_directory
+        self.drop_short_timeseries = drop_short_timeseries
+        self.num_workers = num_workers
+        self.cores_per_model = cores_per_model
+        self.checkpoint = checkpoint
+        self.backtest_folds = backtest_folds
+        self.backtest_list_datasets = []
+        self.backtest_timeseries_statistics = []
+        self.time_budget = time_budget
+        self.estimated_training_times = estimated_training_times or {}
+        self.deadline = None
+        self.unfinished_tasks = {}
 
     def init(self, session_name, partition_root=None):
         """Create the session_path. Check types of target, external features and timeseries identifiers columns.
@@ -95,52 +137,100 @@ class TrainingSession:
         self._check_target_columns_types()
         self._check_external_features_columns_types()
 
-    def create_gluon_datasets(self):
+    def create_gluon_datasets(self, gluon_list_datasets=None):
         """Create train and test gluon list datasets.
-        The last prediction_length time steps are removed from each timeseries of the train dataset.
+        The last prediction_length time steps are removed from each timeseries of the train dataset, which is a view of the full dataset buffers.
+        With a backtest, each older fold is evaluated on the prediction_length time steps before the ones of the next fold,
+        its train and test datasets are cut from the full dataset, so they are also views of its buffers.
+        Compute the statistics of each timeseries of the train datasets once, to size the training and evaluate all models.
         Compute optimal num_batches_per_epoch value based on the train dataset size._check_target_columns_types
-        """
 
-        gluon_dataset = GluonDataset(
-            dataframe=self.training_df,
-            time_column_name=self.time_column_name,
-            frequency=self.frequency,
-            target_columns_names=self.target_columns_names,
-            timeseries_identifiers_names=self.timeseries_identifiers_names,
-            external_features_columns_names=self.external_features_columns_names,
-            min_length=2 * self.prediction_length,  # Assuming that context_length = prediction_length
-        )
+        Args:
+            gluon_list_datasets (list, optional): Train and test gluon list datasets already created from the same training data
+                (e.g. loaded from the prepared data cache). Defaults to None, which means to create them.
+        """
+        if gluon_list_datasets is None:
+            gluon_dataset = GluonDataset(
+                dataframe=self.training_df,
+                time_column_name=self.time_column_name,
+                frequency=self.frequency,
+                target_columns_names=self.target_columns_names,
+                timeseries_identifiers_names=self.timeseries_identifiers_names,
+                external_features_columns_names=self.external_features_columns_names,
+                # Assuming that context_length = prediction_length, for the oldest backtest fold
+                min_length=(self.backtest_folds + 1) * self.prediction_length,
+                storage_directory=self.storage_directory,
+                drop_short_timeseries=self.drop_short_timeseries,
+            )
 
-        gluon_list_datasets = gluon_dataset.create_list_datasets(cut_lengths=[self.prediction_length, 0])
+            gluon_list_datasets = gluon_dataset.create_list_datasets(cut_lengths=[self.prediction_length, 0])
+            if gluon_dataset.dropped_timeseries_identifiers is not None:
+                self._remove_dropped_timeseries(gluon_dataset.dropped_timeseries_identifiers)
+        # models read the timeseries from the datasets buffers, the training dataframe is only kept for the evaluation forecasts
+        evaluation_forecasts_columns_names = self._get_evaluation_forecasts_columns_names()
+        if len(evaluation_forecasts_columns_names) < len(self.training_df.columns):
+            self.training_df = self.training_df[evaluation_forecasts_columns_names]
         self.evaluation_train_list_dataset = gluon_list_datasets[0]
         self.full_list_dataset = gluon_list_datasets[1]
+        self.timeseries_statistics = get_timeseries_statistics(self.evaluation_train_list_dataset, self.frequency)
+        self.backtest_list_datasets = [
+            (self.full_list_dataset.cut((fold_index + 1) * self.prediction_length), self.full_list_dataset.cut(fold_index * self.prediction_length))
+            for fold_index in range(1, self.backtest_folds)
+        ]
+        self.backtest_timeseries_statistics = [
+            get_timeseries_statistics(train_list_dataset, self.frequency) for train_list_dataset, _ in self.backtest_list_datasets
+        ]
 
         if self.user_num_batches_per_epoch == -1:
             self.num_batches_per_epoch = self._compute_optimal_num_batches_per_epoch()
         else:
             self.num_batches_per_epoch = self.user_num_batches_per_epoch
 
+    def _get_evaluation_forecasts_columns_names(self):
+        """Return the columns of the training dataframe joined to the evaluation forecasts, in the order of the training dataframe"""
+        evaluation_forecasts_columns_names = set(
+            [self.time_column_name] + self.target_columns_names + self.timeseries_identifiers_names + self.external_features_columns_names
+        )
+        return [column_name for column_name in self.training_df.columns if column_name in evaluation_forecasts_columns_names]
+
+    def _remove_dropped_timeseries(self, dropped_timeseries_identifiers):
+        """Remove from the training dataframe the rows of the timeseries that were dropped from the gluon datasets.
+
+        Args:
+            dropped_timeseries_identifiers (DataFrame): Identifiers of the dropped timeseries (one row per timeseries).
+        """
+        rows_identifiers = pd.MultiIndex.from_frame(self.training_df[self.timeseries_identifiers_names])
+        dropped_rows = rows_identifiers.isin(pd.MultiIndex.from_frame(dropped_timeseries_identifiers))
+        self.training_df = self.training_df[~dropped_rows].reset_index(drop=True)
+
     def instantiate_models(self):
         """Instantiate all the selected models. """
         for model_name, model_parameters in self.models_parameters.items():
-            self.models.append(
-                Model(
-                    model_name,
-                    model_parameters=model_parameters,
-                    frequency=self.frequency,
-                    prediction_length=self.prediction_length,
-                    epoch=self.epoch,
-                    use_external_features=self.use_external_features,
-                    batch_size=self.batch_size,
-                    num_batches_per_epoch=self.num_batches_per_epoch,
-                    season_length=self.season_length,
-                    mxnet_context=self.mxnet_context,
-                )
-            )
+            self.models.append(self._create_model(model_name, model_parameters))
 
-    def train_evaluate(self, retrain=False):
-        """Call the right train and evaluate function depending on the need to make forecasts. """
+    def _create_model(self, model_name, model_parameters):
+        return Model(
+            model_name,
+            model_parameters=model_parameters,
+            frequency=self.frequency,
+            prediction_length=self.prediction_length,
+            epoch=self.epoch,
+            use_external_features=self.use_external_features,
+            batch_size=self.batch_size,
+            num_batches_per_epoch=self.num_batches_per_epoch,
+            season_length=self.season_length,
+            mxnet_context=self.mxnet_context,
+        )
 
+    def train_evaluate(self, retrain=False):
+        """Call the right train and evaluate function depending on the need to make forecasts.
+        The time budget, if any, starts now.
+        """
+        if self.time_budget is not None:
+            self.deadline = time() + self.time_budget
+        if not self.make_forecasts:
+            # the training dataframe is kept after the datasets are built only to be cached with them, it is released before training
+            self.training_df = None
         if self.make_forecasts:
             self._train_evaluate_make_forecast(retrain)
         else:
@@ -149,37 +239,280 @@ class TrainingSession:
     def _train_evaluate(self, retrain):
         """Evaluate all the selected models (then retrain on complete data if specified) and get the metrics dataframe. """
         metrics_df = pd.DataFrame()
-        for model in self.models:
-            item_metrics = model.train_evaluate(self.evaluation_train_list_dataset, self.full_list_dataset, retrain=retrain)[0]
-            metrics_df = metrics_df.append(item_metrics)
+        for model_index, model_folds_results in enumerate(self._train_evaluate_models(retrain, make_forecasts=False)):
+            metrics_df = metrics_df.append(self._get_model_metrics(model_index, model_folds_results))
         metrics_df[METRICS_DATASET.SESSION] = self.session_name
         self.metrics_df = self._reorder_metrics_df(metrics_df)
 
     def _train_evaluate_make_forecast(self, retrain):
-        """Evaluate all the selected models (then retrain on complete data if specified), get the metrics dataframe and create the forecasts dataframe. """
+        """Evaluate all the selected models (then retrain on complete data if specified), get the metrics dataframe and create the forecasts dataframe.
+        Forecasts are assembled by position: each model fills its columns of a single block aligned with the rows of the training dataframe,
+        sorted by timeseries identifiers (ascending) and time column (descending).
+        """
         metrics_df = pd.DataFrame()
-        for model in self.models:
-            (item_metrics, identifiers_columns, forecasts_df) = model.train_evaluate(
-                self.evaluation_train_list_dataset, self.full_list_dataset, make_forecasts=True, retrain=retrain
-            )
-            forecasts_df = forecasts_df.rename(columns={"index": self.time_column_name})
-            if self.forecasts_df.empty:
-                self.forecasts_df = forecasts_df
-            else:
-                self.forecasts_df = self.forecasts_df.merge(forecasts_df, on=[self.time_column_name] + identifiers_columns)
-            metrics_df = metrics_df.append(item_metrics)
+        rows_order, timeseries_offsets = self._get_evaluation_rows_order()
+        # forecasts of each model are sorted by timeseries and time, they fill the first prediction_length rows of each timeseries in reverse order
+        forecasts_positions = (timeseries_offsets[:-1, np.newaxis] + np.arange(self.prediction_length)[::-1]).ravel()
+        # GluonTS forecasts samples are float32
+        forecasts_block = np.full((len(rows_order), len(self.models) * len(self.target_columns_names)), np.nan, dtype=np.float32)
+        forecasts_columns_names = []
+        for model_index, model_folds_results in enumerate(self._train_evaluate_models(retrain, make_forecasts=True)):
+            metrics_df = metrics_df.append(self._get_model_metrics(model_index, model_folds_results))
+            if model_folds_results[0] is None:
+                # models not completed within the time budget have no forecasts columns
+                continue
+            _, identifiers_columns, forecasts_df = model_folds_results[0]
+            for forecasts_column_name in forecasts_df.columns.drop(["index"] + identifiers_columns):
+                forecasts_block[forecasts_positions, len(forecasts_columns_names)] = forecasts_df[forecasts_column_name].values
+                forecasts_columns_names.append(forecasts_column_name)
         metrics_df[METRICS_DATASET.SESSION] = self.session_name
         self.metrics_df = self._reorder_metrics_df(metrics_df)
 
-        self.evaluation_forecasts_df = self.training_df.merge(self.forecasts_df, on=[self.time_column_name] + identifiers_columns, how="left", indicator=True)
+        self.evaluation_forecasts_df = self.training_df.take(rows_order).reset_index(drop=True)
+        forecasts_block_df = pd.DataFrame(forecasts_block[:, : len(forecasts_columns_names)], columns=forecasts_columns_names)
+        self.evaluation_forecasts_df = pd.concat([self.evaluation_forecasts_df, forecasts_block_df], axis=1)
+        row_origin = np.full(len(rows_order), ROW_ORIGIN.TRAIN, dtype=object)
+        row_origin[forecasts_positions] = ROW_ORIGIN.EVALUATION
+        self.evaluation_forecasts_df[ROW_ORIGIN.COLUMN_NAME] = row_origin
+        self.evaluation_forecasts_df[METRICS_DATASET.SESSION] = self.session_name
+
+    def _get_evaluation_rows_order(self):
+        """Locate the rows of each timeseries of the training dataframe, in the order of the timeseries of the gluon datasets.
+        Rows of a timeseries are expected in time order, as they are in the gluon datasets.
+
+        Returns:
+            numpy.array of the positions of the rows of training_df sorted by timeseries identifiers (ascending) and time column (descending).
+            Rows with missing identifiers, which belong to no timeseries, are put last.
+            numpy.array of the index of the first row of each timeseries in this order, followed by the number of rows in timeseries.
+        """
+        if not self.timeseries_identifiers_names:
+            return np.arange(len(self.training_df.index))[::-1], np.array([0, len(self.training_df.index)])
+        group_index = self.training_df.groupby(self.timeseries_identifiers_names, sort=True, observed=True).ngroup().values
+        # sorting on descending row positions within each timeseries puts the most recent dates first
+        rows_order = np.lexsort((-np.arange(len(group_index)), np.where(group_index < 0, np.iinfo(group_index.dtype).max, group_index)))
+        timeseries_offsets = np.append(0, np.cumsum(np.bincount(group_index[group_index >= 0])))
+        return rows_order, timeseries_offsets
+
+    def _train_evaluate_models(self, retrain, make_forecasts):
+        """Train and evaluate all the models on all the backtest folds, in worker processes if num_workers is greater than 1.
+        Models completed before the session was interrupted are loaded from the checkpoint instead of being trained again.
+        Only the last fold is retrained and forecasted, older folds are evaluated by fresh instances of the models.
+        With a time budget, models always run in worker processes, from the cheapest to the most expensive, so that the ones
+        still running when the budget runs out can be stopped. Their status is stored in unfinished_tasks.
+
+        Args:
+            retrain (bool): Whether to retrain the models on the full dataset after the evaluation.
+            make_forecasts (bool): Whether to make the evaluation forecasts.
+
+        Returns:
+            List of the results of Model.train_evaluate on each fold (the last one first), in the order of the models.
+            Results of the models not completed within the time budget are None.
+        """
+        results = [[None] * self.backtest_folds for _ in self.models]
+        if self.checkpoint is not None:
+            for model_index, model in enumerate(self.models):
+                for fold_index in range(self.backtest_folds):
+                    checkpointed_model = self.checkpoint.load_model(model, fold_index=fold_index)
+                    if checkpointed_model is not None:
+                        logger.info(f"Model {model.get_label()} already completed on fold {fold_index}, loaded from checkpoint")
+                        predictor, results[model_index][fold_index] = checkpointed_model
+                        if fold_index == 0:
+                            model.predictor = predictor
+        tasks = [
+            (model_index, fold_index, retrain and fold_index == 0, make_forecasts and fold_index == 0)
+            for model_index in range(len(self.models))
+            for fold_index in range(self.backtest_folds)
+            if results[model_index][fold_index] is None
+        ]
+
+        if self.deadline is None and (self.num_workers <= 1 or len(tasks) <= 1):
+            for task in tasks:
+                model_index, fold_index, model, results[model_index][fold_index] = self._train_evaluate_model(*task)
+                self._save_model_checkpoint(model, results[model_index][fold_index], fold_index)
+            return results
+        if not tasks:
+            return results
+
+        num_workers = min(max(self.num_workers, 1), len(tasks))
+        cores_sets = self._get_workers_cores_sets(num_workers)
+        cores_sets_queue = multiprocessing.SimpleQueue()
+        for cores_set in cores_sets:
+            cores_sets_queue.put(cores_set)
+
+        logger.info(f"Training {len(tasks)} models and folds with {num_workers} processes")
+        # the session is handed to the workers when they start (inherited without copy when processes are forked), tasks only carry model indexes
+        with multiprocessing.Pool(processes=num_workers, initializer=_init_training_worker, initargs=(self, cores_sets_queue)) as pool:
+            if self.deadline is None:
+                # deep learning models are usually the slowest, they are started first so that they don't run last on their own
+                tasks = sorted(tasks, key=lambda task: self.models[task[0]].trainer is None)
+            else:
+                # with a time budget, the cheapest models are started first so that as many models as possible are completed
+                tasks = sorted(tasks, key=lambda task: self._get_estimated_cost(self.models[task[0]]))
+            results_iterator = pool.imap_unordered(_train_evaluate_worker_model, tasks)
+            for finished_count in range(1, len(tasks) + 1):
+                try:
+                    model_index, fold_index, serialized_predictor, model_results = results_iterator.next(timeout=self._get_remaining_time())
+                except multiprocessing.TimeoutError:
+                    logger.warning(f"Time budget of {self.time_budget} seconds exceeded, stopping the models still running or waiting")
+                    break
+                model = self.models[model_index]
+                if model_results is None:
+                    logger.info(f"Model {model.get_label()} skipped on fold {fold_index} to fit in the time budget")
+                    self.unfinished_tasks[(model_index, fold_index)] = TRAINING_STATUS.SKIPPED
+                    continue
+                logger.info(f"Model {model.get_label()} trained and evaluated on fold {fold_index} ({finished_count}/{len(tasks)})")
+                if serialized_predictor is not None:
+                    model.predictor = pickle.loads(serialized_predictor)
+                results[model_index][fold_index] = model_results
+                self._save_model_checkpoint(model, model_results, fold_index)
+        # leaving the pool context terminates the workers of the models still running
+        for model_index, fold_index, _, _ in tasks:
+            if results[model_index][fold_index] is None and (model_index, fold_index) not in self.unfinished_tasks:
+                self.unfinished_tasks[(model_index, fold_index)] = TRAINING_STATUS.STOPPED
+        return results
+
+    def _get_remaining_time(self):
+        """Return the number of seconds left in the time budget, or None if there is no time budget"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time(), 0)
+
+    def _get_estimated_cost(self, model):
+        """Rank a model by its expected run time: naive predictors first, then statistical models fitted on each timeseries,
+        then deep learning models. Models of the same kind are ranked by their estimated run time when it is known.
+
+        Args:
+            model (Model)
+
+        Returns:
+            Tuple used as sorting key.
+        """
+        if model.estimator is None:
+            kind_cost = 0
+        elif model.trainer is None:
+            kind_cost = 1
+        else:
+            kind_cost = 2
+        return kind_cost, self.estimated_training_times.get(model.get_label(), 0)
+
+    def _train_evaluate_scheduled_model(self, model_index, fold_index, retrain, make_forecasts):
+        """Train and evaluate a model on a backtest fold, unless its estimated run time exceeds the remaining time budget.
 
-        self.evaluation_forecasts_df = add_row_origin(self.evaluation_forecasts_df, both=ROW_ORIGIN.EVALUATION, left_only=ROW_ORIGIN.TRAIN)
+        Returns:
+            Same as _train_evaluate_model, with None as model and results if the model was skipped.
+        """
+        remaining_time = self._get_remaining_time()
+        if remaining_time is not None:
+            estimated_training_time = self.estimated_training_times.get(self.models[model_index].get_label())
+            if remaining_time <= 0 or (estimated_training_time is not None and estimated_training_time > remaining_time):
+                return model_index, fold_index, None, None
+        return self._train_evaluate_model(model_index, fold_index, retrain, make_forecasts)
+
+    def _save_model_checkpoint(self, model, model_results, fold_index):
+        """Save a completed model to the checkpoint, if any, so that it is not trained again if the session is interrupted"""
+        if self.checkpoint is not None:
+            self.checkpoint.save_model(model, model_results, fold_index=fold_index)
+
+    def _train_evaluate_model(self, model_index, fold_index, retrain, make_forecasts):
+        """Train and evaluate a single model of the session on a backtest fold.
+        Older folds are evaluated by a fresh instance of the model, so that the model of the last fold is left untouched.
 
-        # sort forecasts dataframe by timeseries identifiers (ascending) and time column (descending)
-        self.evaluation_forecasts_df = self.evaluation_forecasts_df.sort_values(
-            by=identifiers_columns + [self.time_column_name], ascending=[True] * len(identifiers_columns) + [False]
+        Args:
+            model_index (int): Index of the model in the models list.
+            fold_index (int): Index of the backtest fold, 0 for the last prediction_length time steps.
+            retrain (bool): Whether to retrain the model on the full dataset after the evaluation.
+            make_forecasts (bool): Whether to make the evaluation forecasts.
+
+        Returns:
+            Index of the model, index of the fold, trained model and results of Model.train_evaluate.
+        """
+        model = self.models[model_index]
+        timeseries_statistics = self.timeseries_statistics
+        if fold_index > 0:
+            model = self._create_model(model.model_name, model.model_parameters)
+            timeseries_statistics = self.backtest_timeseries_statistics[fold_index - 1]
+        train_list_dataset, test_list_dataset = self._get_model_list_datasets(model, fold_index)
+        model_results = model.train_evaluate(
+            train_list_dataset, test_list_dataset, make_forecasts=make_forecasts, retrain=retrain, timeseries_statistics=timeseries_statistics
         )
-        self.evaluation_forecasts_df[METRICS_DATASET.SESSION] = self.session_name
+        return model_index, fold_index, model, model_results
+
+    def _get_model_metrics(self, model_index, model_folds_results):
+        """Get the metrics of a model on all backtest folds, and their average over the folds if the model was completed on all of them.
+        With a time budget, a training status column gives the outcome of each fold, with one row for each fold on which the model was not completed.
+
+        Args:
+            model_index (int): Index of the model in the models list.
+            model_folds_results (list): Results of Model.train_evaluate on each fold, the last one first. None for folds not completed.
+
+        Returns:
+            DataFrame of metrics, with a backtest fold column if there are several folds.
+        """
+        folds_metrics = []
+        for fold_index, fold_results in enumerate(model_folds_results):
+            if fold_results is not None:
+                fold_metrics = fold_results[0].copy()
+                training_status = TRAINING_STATUS.COMPLETED
+            else:
+                unfinished_metrics = {
+                    METRICS_DATASET.TARGET_COLUMN: METRICS_DATASET.AGGREGATED_ROW,
+                    METRICS_DATASET.MODEL_COLUMN: self.models[model_index].get_label(),
+                }
+                unfinished_metrics.update({identifier: METRICS_DATASET.AGGREGATED_ROW for identifier in self.timeseries_identifiers_names})
+                fold_metrics = pd.DataFrame([unfinished_metrics])
+                training_status = self.unfinished_tasks[(model_index, fold_index)]
+            if self.time_budget is not None:
+                fold_metrics[METRICS_DATASET.TRAINING_STATUS] = training_status
+            if self.backtest_folds > 1:
+                fold_metrics[METRICS_DATASET.BACKTEST_FOLD] = fold_index
+            folds_metrics.append(fold_metrics)
+        metrics = pd.concat(folds_metrics, ignore_index=True)
+        if self.backtest_folds > 1 and all(fold_results is not None for fold_results in model_folds_results):
+            identifiers_columns = model_folds_results[0][1]
+            metrics = pd.concat([self._get_averaged_backtest_metrics(metrics, identifiers_columns), metrics], ignore_index=True)
+        return metrics
+
+    def _get_averaged_backtest_metrics(self, folds_metrics, identifiers_columns):
+        """Average the metrics of a model over all backtest folds.
+
+        Args:
+            folds_metrics (DataFrame): Metrics of the model on each fold, with a backtest fold column.
+            identifiers_columns (list): Timeseries identifiers columns of the metrics.
+
+        Returns:
+            DataFrame of metrics averaged over the folds, with the same columns as folds_metrics.
+        """
+        aggregations = {metric: "mean" for metric in EVALUATION_METRICS_DESCRIPTIONS}
+        aggregations.update({METRICS_DATASET.TRAINING_TIME: "sum", METRICS_DATASET.MODEL_PARAMETERS: "first"})
+        averaged_metrics = folds_metrics.groupby([METRICS_DATASET.TARGET_COLUMN] + identifiers_columns + [METRICS_DATASET.MODEL_COLUMN], sort=False).agg(aggregations)
+        averaged_metrics = averaged_metrics.reset_index()
+        averaged_metrics[METRICS_DATASET.BACKTEST_FOLD] = METRICS_DATASET.AGGREGATED_ROW
+        if self.time_budget is not None:
+            averaged_metrics[METRICS_DATASET.TRAINING_STATUS] = TRAINING_STATUS.COMPLETED
+        return averaged_metrics[folds_metrics.columns]
+
+    def _get_model_list_datasets(self, model, fold_index=0):
+        """Retrieve the train and test gluon list datasets to use for a model on a backtest fold.
+        Models that cannot use external features all share the same projections of the datasets without external features, created once.
+
+        Args:
+            model (Model)
+            fold_index (int, optional): Index of the backtest fold. Defaults to 0, the last prediction_length time steps.
+
+        Returns:
+            Train and test gluon list datasets.
+        """
+        if fold_index > 0:
+            # the model hides the external features of the fold datasets itself if it cannot use them
+            return self.backtest_list_datasets[fold_index - 1]
+        if not self.use_external_features or model.use_external_features:
+            return self.evaluation_train_list_dataset, self.full_list_dataset
+        if self.list_datasets_without_external_features is None:
+            self.list_datasets_without_external_features = (
+                remove_unused_external_features(self.evaluation_train_list_dataset),
+                remove_unused_external_features(self.full_list_dataset),
+            )
+        return self.list_datasets_without_external_features
 
     def _reorder_metrics_df(self, metrics_df):
         """Sort rows by target column and put aggregated rows on top.
@@ -190,7 +523,8 @@ class TrainingSession:
         Returns:
             Ordered metrics DataFrame.
         """
-        metrics_df = metrics_df.sort_values(by=[METRICS_DATASET.TARGET_COLUMN], ascending=True)
+        # a stable sort keeps the rows averaged over the backtest folds before the rows of each fold
+        metrics_df = metrics_df.sort_values(by=[METRICS_DATASET.TARGET_COLUMN], ascending=True, kind="mergesort")
         orderd_metrics_df = pd.concat(
             [
                 metrics_df[metrics_df[METRICS_DATASET.TARGET_COLUMN] == METRICS_DATASET.AGGREGATED_ROW],
@@ -201,6 +535,8 @@ class TrainingSession:
         return orderd_metrics_df
 
     def get_evaluation_forecasts_df(self):
+        """Decode the timeseries identifiers columns to their original values before the output dataset is written """
+        decode_timeseries_identifiers(self.evaluation_forecasts_df, self.timeseries_identifiers_names)
         return self.evaluation_forecasts_df
 
     def create_evaluation_forecasts_column_description(self):
@@ -220,6 +556,9 @@ class TrainingSession:
                     column_descriptions[column] = f"Median forecasts of {target_name} using {model} model"
         return column_descriptions
 
+    def get_gluon_list_datasets(self):
+        return [self.evaluation_train_list_dataset, self.full_list_dataset]
+
     def get_metrics_df(self):
         return self.metrics_df
 
@@ -265,11 +604,45 @@ class TrainingSession:
         """Compute the optimal value of num batches per epoch to scale to the training data size.
         With this formula, each timestep will on average be in 2 samples, once in the context part and once in the prediction part.
         """
-        num_samples_total = 0
-        for timeseries in self.evaluation_train_list_dataset.list_data:
-            timeseries_length = len(timeseries[TIMESERIES_KEYS.TARGET])
-            num_samples = math.ceil(timeseries_length / self.prediction_length)
-            num_samples_total += num_samples
-        optimal_num_batches_per_epoch = max(math.ceil(num_samples_total / self.batch_size), 50)
+        timeseries_lengths = self.timeseries_statistics[TIMESERIES_STATISTICS.LENGTH].values
+        num_samples_total = np.ceil(timeseries_lengths / self.prediction_length).sum()
+        optimal_num_batches_per_epoch = max(int(np.ceil(num_samples_total / self.batch_size)), 50)
         logger.info(f"Number of batches per epoch automatically scaled to training data size: {optimal_num_batches_per_epoch}")
         return optimal_num_batches_per_epoch
+
+
+_worker_training_session = None
+
+
+def _init_training_worker(training_session, cores_sets_queue):
+    """Initialize a model training worker process with the training session.
+    The worker is restricted to its own set of CPU cores, and its BLAS and OpenMP thread pools to as many threads,
+    so that parallel models don't oversubscribe the machine.
+
+    Args:
+        training_session (TrainingSession): Session with the datasets and the models to train.
+        cores_sets_queue (multiprocessing.SimpleQueue): Queue of the sets of cores of the workers, each worker takes one set.
+    """
+    global _worker_training_session
+    _worker_training_session = training_session
+    cores_set = cores_sets_queue.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores_set)
+    # native libraries are already loaded when the worker is forked so their thread pools are resized at runtime.
+    # MXNet sizes its operators threads when it is loaded by the parent process, they only share the cores of the worker
+    threadpool_limits(limits=len(cores_set))
+
+
+def _train_evaluate_worker_model(task):
+    """Train and evaluate a model of the worker training session from a (model_index, fold_index, retrain, make_forecasts) task.
+    Only the results are sent back to the session, with the predictor retrained on the last fold (if any) serialized with dill
+    like the predictors saved in the model folder, instead of the whole model.
+
+    Returns:
+        Index of the model, index of the fold, serialized predictor (None if not retrained) and results of Model.train_evaluate (None if skipped).
+    """
+    model_index, fold_index, model, model_results = _worker_training_session._train_evaluate_scheduled_model(*task)
+    serialized_predictor = None
+    if fold_index == 0 and model is not None and model.predictor is not None:
+        serialized_predictor = pickle.dumps(model.predictor)
+    return model_index, fold_index, serialized_predictor, model_results
@@ -3,9 +3,10 @@ import json
 from pandas.tseries.frequencies import to_offset
 import numpy as np
 from functools import reduce
-import copy
+from gluonts.dataset.common import ListDataset
 from dku_constants import TIMESERIES_KEYS, ROW_ORIGIN, CUSTOMISABLE_FREQUENCIES_OFFSETS, GPU_CONFIGURATION
 from timeseries_preparation.preparation import TimeseriesPreparator
+from gluonts_forecasts.columnar_dataset import get_timeseries_metadata, get_timeseries_identifiers
 
 
 def apply_filter_conditions(df, conditions):
@@ -42,71 +43,102 @@ def add_future_external_features(gluon_train_dataset, external_features_future_d
     Returns:
         gluonts.dataset.common.ListDataset with future external features.
     """
-    gluon_dataset = copy.deepcopy(gluon_train_dataset)
     if isinstance(to_offset(frequency), CUSTOMISABLE_FREQUENCIES_OFFSETS):
         frequency = gluon_train_dataset.process.trans[0].freq
 
-    start_date, periods = None, None
-    for i, timeseries in enumerate(gluon_train_dataset):
-        if TIMESERIES_KEYS.IDENTIFIERS in timeseries:
-            # filter the dataframe to only get rows with the right identifiers
-            timeseries_identifiers = timeseries[TIMESERIES_KEYS.IDENTIFIERS]
-            conditions = [external_features_future_df[k] == v for k, v in timeseries_identifiers.items()]
-            timeseries_external_features_future_df = apply_filter_conditions(external_features_future_df, conditions)
-        else:
-            timeseries_external_features_future_df = external_features_future_df
+    timeseries_ids = get_timeseries_metadata(gluon_train_dataset).index.get_level_values(TIMESERIES_KEYS.TIMESERIES_ID)
+    list_data_with_future = []
+    feat_dynamic_real_appended_by_timeseries_id = {}
+    for timeseries, timeseries_id in zip(gluon_train_dataset.list_data, timeseries_ids):
+        if timeseries_id not in feat_dynamic_real_appended_by_timeseries_id:
+            # all targets of the same timeseries share one buffer of external features
+            feat_dynamic_real_appended_by_timeseries_id[timeseries_id] = _append_future_external_features(
+                timeseries, external_features_future_df, prediction_length, frequency
+            )
+        feat_dynamic_real_appended = feat_dynamic_real_appended_by_timeseries_id[timeseries_id]
 
-        feat_dynamic_real_train = timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL]
-        feat_dynamic_real_columns_names = timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL_COLUMNS_NAMES]
-        time_column_name = timeseries[TIMESERIES_KEYS.TIME_COLUMN_NAME]
+        # timeseries of list_data may be views of the training dataset buffers so a new dictionary is created instead of modifying it
+        timeseries_with_future = timeseries.copy()
+        timeseries_with_future[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL] = feat_dynamic_real_appended
+        list_data_with_future.append(timeseries_with_future)
 
-        timeseries_preparator = TimeseriesPreparator(
-            time_column_name=time_column_name,
-            frequency=frequency,
-        )
-        timeseries_external_features_future_df = timeseries_preparator.prepare_timeseries_dataframe(timeseries_external_features_future_df)
+    return ListDataset(list_data_with_future, freq=gluon_train_dataset.process.trans[0].freq)
 
-        feat_dynamic_real_future = timeseries_external_features_future_df[feat_dynamic_real_columns_names].values.T
 
-        if feat_dynamic_real_future.shape[1] != prediction_length:
-            raise ValueError(f"Please provide {prediction_length} future values of external features, as this was the forecasting horizon used for training")
+def _append_future_external_features(timeseries, external_features_future_df, prediction_length, frequency):
+    """Append the future external features of the timeseries identifiers to the 'feat_dynamic_real' array of timeseries.
 
-        feat_dynamic_real_appended = np.append(feat_dynamic_real_train, feat_dynamic_real_future, axis=1)
+    Raises:
+        ValueError: If the length of external_features_future_df is not prediction_length.
+
+    Returns:
+        Array of external features of shape features x (training length + prediction_length).
+    """
+    if TIMESERIES_KEYS.IDENTIFIERS in timeseries:
+        # filter the dataframe to only get rows with the right identifiers
+        timeseries_identifiers = timeseries[TIMESERIES_KEYS.IDENTIFIERS]
+        conditions = [external_features_future_df[k] == v for k, v in timeseries_identifiers.items()]
+        timeseries_external_features_future_df = apply_filter_conditions(external_features_future_df, conditions)
+    else:
+        timeseries_external_features_future_df = external_features_future_df
+
+    feat_dynamic_real_train = timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL]
+    feat_dynamic_real_columns_names = timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL_COLUMNS_NAMES]
+    time_column_name = timeseries[TIMESERIES_KEYS.TIME_COLUMN_NAME]
+
+    timeseries_preparator = TimeseriesPreparator(
+        time_column_name=time_column_name,
+        frequency=frequency,
+    )
+    timeseries_external_features_future_df = timeseries_preparator.prepare_timeseries_dataframe(timeseries_external_features_future_df)
+
+    feat_dynamic_real_future = timeseries_external_features_future_df[feat_dynamic_real_columns_names].values.T
 
-        gluon_dataset.list_data[i][TIMESERIES_KEYS.FEAT_DYNAMIC_REAL] = feat_dynamic_real_appended
+    if feat_dynamic_real_future.shape[1] != prediction_length:
+        raise ValueError(f"Please provide {prediction_length} future values of external features, as this was the forecasting horizon used for training")
 
-    return gluon_dataset
+    feat_dynamic_real_appended = np.append(feat_dynamic_real_train, feat_dynamic_real_future, axis=1)
+    if feat_dynamic_real_train.dtype == np.float32 or np.issubdtype(feat_dynamic_real_train.dtype, np.integer):
+        # keep compact external features (float32 of compact mode or integer flags) in float32, the type fed to the models,
+        # instead of upcasting them to float64
+        feat_dynamic_real_appended = feat_dynamic_real_appended.astype(np.float32)
+    return feat_dynamic_real_appended
 
 
 def concat_timeseries_per_identifiers(all_timeseries):
     """Concatenate on columns all forecasts timeseries with same identifiers.
 
     Args:
-        all_timeseries (dict): Dictionary of timeseries (value) by identifiers dictionary (key).
+        all_timeseries (dict): Dictionary of timeseries (value) by timeseries id of the timeseries metadata table (key).
 
     Returns:
-        List of timeseries with multiple forecasts for each identifiers.
+        List of timeseries with multiple forecasts for each identifiers, with a timeseries id column.
     """
     multiple_df = []
-    for timeseries_identifier_key, series_list in all_timeseries.items():
+    for timeseries_id, series_list in all_timeseries.items():
         unique_identifiers_df = pd.concat(series_list, axis=1).reset_index(drop=False)
-        if timeseries_identifier_key:
-            for identifier_key, identifier_value in timeseries_identifier_key:
-                unique_identifiers_df[identifier_key] = identifier_value
+        unique_identifiers_df[TIMESERIES_KEYS.TIMESERIES_ID] = timeseries_id
         multiple_df += [unique_identifiers_df]
     return multiple_df
 
 
-def concat_all_timeseries(multiple_df):
+def concat_all_timeseries(multiple_df, timeseries_metadata):
     """Concatenate on rows all forecasts timeseries (one identifiers timeseries after the other).
+    The timeseries id column is replaced by the identifiers columns, looked up by id in the timeseries metadata table.
 
     Args:
-        multiple_df (list): List of multivariate timeseries DataFrame with identifiers columns.
+        multiple_df (list): List of multivariate timeseries DataFrame with a timeseries id column.
+        timeseries_metadata (DataFrame): Timeseries metadata table of the gluon dataset.
 
     Returns:
         DataFrame of multivariate long format timeseries.
     """
-    return pd.concat(multiple_df, axis=0).reset_index(drop=True)
+    all_timeseries_df = pd.concat(multiple_df, axis=0).reset_index(drop=True)
+    timeseries_ids = all_timeseries_df.pop(TIMESERIES_KEYS.TIMESERIES_ID).values
+    timeseries_identifiers = get_timeseries_identifiers(timeseries_metadata)
+    for identifier_column in timeseries_identifiers.columns:
+        all_timeseries_df[identifier_column] = timeseries_identifiers[identifier_column].values[timeseries_ids]
+    return all_timeseries_df
 
 
 def add_row_origin(df, both, left_only):
@@ -1,10 +1,11 @@
 import pandas as pd
 import numpy as np
-from pandas.api.types import is_numeric_dtype, is_string_dtype
+from pandas.api.types import is_numeric_dtype, is_string_dtype, is_datetime64_any_dtype, is_categorical_dtype
 from pandas.tseries.offsets import Tick, BusinessDay, Week, MonthEnd
 from pandas.tseries.frequencies import to_offset
 from timeseries_preparation.h2g2 import H2G2
 import re
+import tracemalloc
 from safe_logger import SafeLogger
 
 logger = SafeLogger("Forecast plugin")
@@ -23,6 +24,8 @@ class TimeseriesPreparator:
         timeseries_identifiers_names=[],
         external_features_columns_names=[],
         max_timeseries_length=None,
+        compact_dtypes=False,
+        resampling_method=None,
     ):
         self.time_column_name = time_column_name
         self.frequency = frequency
@@ -30,52 +33,178 @@ class TimeseriesPreparator:
         self.timeseries_identifiers_names = timeseries_identifiers_names
         self.external_features_columns_names = external_features_columns_names
         self.max_timeseries_length = max_timeseries_length
+        self.compact_dtypes = compact_dtypes
+        self.resampling_method = resampling_method
 
-    def prepare_timeseries_dataframe(self, dataframe):
+    def prepare_timeseries_dataframe(self, dataframe, copy=True):
         """Convert time column to pandas.Datetime without timezones. Truncate dates to selected frequency.
         Check that there are no duplicate dates and that there are no missing dates.
         Sort timeseries. Keep only the most recent dates of each timeseries if specified.
+        Timeseries identifiers are encoded as categorical columns so that sorts, groupbys and merges use integer codes.
+        Sampling is done before parsing when the time column already has a datetime type,
+        so that parsing, truncation and checks only run on the sampled records.
+        Missing dates are filled if a resampling method is specified.
 
         Args:
             dataframe (DataFrame)
+            copy (bool, optional): If False, use the memory-lean mode: dataframe is not copied but modified (and sorted) in place,
+                column by column, and the peak memory allocated by the preparation on top of dataframe is logged. Defaults to True.
 
         Raises:
             ValueError: If the time column cannot be parsed as a date by pandas.
+            ValueError: If some time series have missing values, duplicate dates or missing dates.
 
         Returns:
             Prepared timeseries
         """
-        self._check_data(dataframe)
-
-        dataframe_prepared = dataframe.copy()
+        self._check_timeseries_identifiers_columns_types(dataframe)
 
+        # the allocations of the preparation (numpy buffers included) are traced to measure its own peak memory usage,
+        # the memory of the process before the preparation (e.g. of the input dataframe) is left out
+        trace_memory = not copy and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
         try:
-            dataframe_prepared[self.time_column_name] = pd.to_datetime(dataframe[self.time_column_name]).dt.tz_localize(tz=None)
-        except Exception:
-            raise ValueError(f"Please parse the date column '{self.time_column_name}' in a Prepare recipe")
+            dataframe_prepared = dataframe.copy() if copy else dataframe
+            # from here dataframe_prepared is either a copy or the input dataframe in memory-lean mode so it can be modified in place
 
-        dataframe_prepared = self._truncate_dates(dataframe_prepared)
+            encode_timeseries_identifiers(dataframe_prepared, self.timeseries_identifiers_names)
 
-        dataframe_prepared = self._sort(dataframe_prepared)
+            if self.compact_dtypes:
+                self._downcast_numeric_columns(dataframe_prepared)
 
-        self._check_regular_frequency(dataframe_prepared)
-        log_message_prefix = "Found"
-        self._log_timeseries_lengths(dataframe_prepared, log_message_prefix=log_message_prefix)
+            dataframe_prepared = self._prepare_timeseries(dataframe_prepared)
 
-        if self.max_timeseries_length:
-            dataframe_prepared = self._keep_last_dates(dataframe_prepared)
-            log_message_prefix = f"Sampling {self.max_timeseries_length} last records, obtained"
-            self._log_timeseries_lengths(dataframe_prepared, log_message_prefix=log_message_prefix)
+            self._check_timeseries_validity(dataframe_prepared)
+        finally:
+            if trace_memory:
+                _, peak_memory_usage = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+        if not self.max_timeseries_length:
+            self._log_timeseries_lengths(dataframe_prepared, log_message_prefix="Found")
+
+        if trace_memory:
+            logger.info(f"Time series preparation done with a peak memory usage of {peak_memory_usage / 1024 ** 2:.0f} MB on top of the input dataset")
 
         return dataframe_prepared
 
-    def _check_data(self, df):
-        self._check_timeseries_identifiers_columns_types(df)
-        self._check_no_missing_values(df)
+    def _prepare_timeseries(self, df):
+        """Sample, parse, truncate, sort and resample df (modified in place when possible).
+
+        Args:
+            df (DataFrame): Dataframe with encoded timeseries identifiers.
+
+        Returns:
+            DataFrame sorted by timeseries identifiers and time column.
+        """
+        sample_before_parsing = self.max_timeseries_length and is_datetime64_any_dtype(df[self.time_column_name])
+        if sample_before_parsing:
+            df = self._sample_last_dates(df, inplace=True)
+
+        self._parse_dates(df)
+
+        if self.max_timeseries_length and not sample_before_parsing:
+            df = self._sample_last_dates(df, inplace=True)
+
+        df = self._truncate_dates(df, copy=False)
+
+        df = self._sort(df, inplace=True)
+
+        if self.resampling_method:
+            df = self._fill_missing_dates(df)
+
+        return df
+
+    def sample_last_dates_by_chunks(self, dataframe_chunks):
+        """Stream dataframe chunks and keep only at most the last max_timeseries_length records of each timeseries,
+        so that the whole dataset never has to be loaded in memory.
+        The time column of each chunk is parsed and the chunk is appended to a buffer which is regularly sorted and trimmed
+        to the last max_timeseries_length records of each timeseries (at most twice this size is kept between two trims).
+
+        Args:
+            dataframe_chunks (iterable): Iterable of DataFrame (e.g. dataiku.Dataset.iter_dataframes).
+
+        Raises:
+            ValueError: If max_timeseries_length is not set.
+            ValueError: If the time column cannot be parsed as a date by pandas.
+            ValueError: If there is no record in dataframe_chunks.
+
+        Returns:
+            Sampled dataframe sorted by timeseries identifiers and time column, to be prepared with prepare_timeseries_dataframe.
+        """
+        if not self.max_timeseries_length:
+            raise ValueError("Chunked sampling requires a maximum time series length")
+
+        buffer_chunks = []
+        buffer_rows_count, trimmed_rows_count, total_rows_count = 0, 0, 0
+        for chunk in dataframe_chunks:
+            self._parse_dates(chunk)
+            if self.compact_dtypes:
+                self._downcast_numeric_columns(chunk)
+            buffer_chunks.append(chunk)
+            buffer_rows_count += len(chunk.index)
+            total_rows_count += len(chunk.index)
+            if buffer_rows_count > 2 * max(trimmed_rows_count, len(chunk.index)):
+                buffer_chunks = [self._trim_buffer(buffer_chunks)]
+                trimmed_rows_count = buffer_rows_count = len(buffer_chunks[0].index)
+
+        if total_rows_count == 0:
+            raise ValueError("Input dataset is empty")
+
+        df_sampled = self._trim_buffer(buffer_chunks)
+        logger.info(f"Streamed {total_rows_count} records by chunks, kept {len(df_sampled.index)} most recent records")
+        return df_sampled
+
+    def _trim_buffer(self, buffer_chunks):
+        """Concatenate and sort the buffer chunks, then keep only at most the last max_timeseries_length records of each timeseries"""
+        df = pd.concat(buffer_chunks, axis=0, ignore_index=True)
+        del buffer_chunks[:]
+        df = self._sort(df, inplace=True)
+        timeseries_offsets = get_timeseries_offsets(df, self.timeseries_identifiers_names)
+        return df[get_last_rows_mask(timeseries_offsets, self.max_timeseries_length)].reset_index(drop=True)
+
+    def _downcast_numeric_columns(self, df):
+        """Convert in place the numeric target and external features columns of df to float32, the dtype used by GluonTS.
+        Non numeric columns are left unchanged so that they are reported by the columns types checks.
+        """
+        for column_name in self.target_columns_names + self.external_features_columns_names:
+            if is_numeric_dtype(df[column_name]) and df[column_name].dtype != np.float32:
+                df[column_name] = df[column_name].astype(np.float32)
+
+    def _parse_dates(self, df):
+        """Convert in place the time column of df to pandas.Datetime without timezones.
+        Dates are parsed only once per unique value and mapped back to the rows with integer codes.
+
+        Raises:
+            ValueError: If the time column cannot be parsed as a date by pandas.
+        """
+        codes, unique_dates = pd.factorize(df[self.time_column_name])
+        try:
+            unique_parsed_dates = pd.DatetimeIndex(pd.to_datetime(unique_dates)).tz_localize(tz=None)
+        except Exception:
+            raise ValueError(f"Please parse the date column '{self.time_column_name}' in a Prepare recipe")
+        df[self.time_column_name] = np.append(unique_parsed_dates.values, np.datetime64("NaT")).take(codes)
+
+    def _sample_last_dates(self, df, inplace=False):
+        """Sort the dataframe and keep only at most the last max_timeseries_length dates of each timeseries.
+
+        Args:
+            df (DataFrame): Dataframe with a time column of datetime type (parsed or not).
+            inplace (bool, optional): Whether to sort df in place instead of sorting a copy. Defaults to False.
+
+        Returns:
+            Sampled dataframe sorted by timeseries identifiers and time column.
+        """
+        df_sorted = self._sort(df, inplace=inplace)
+        self._log_timeseries_lengths(df_sorted, log_message_prefix="Found")
+        df_sampled = self._keep_last_dates(df_sorted)
+        self._log_timeseries_lengths(df_sampled, log_message_prefix=f"Sampling {self.max_timeseries_length} last records, obtained")
+        return df_sampled
 
-    def _truncate_dates(self, df):
+    def _truncate_dates(self, df, copy=True):
         """Truncate dates to selected frequency. For Week/Month/Year, truncate to end of Week/Month/Year.
-        Check there are no duplicate dates.
+        Dates are truncated only once per unique value and mapped back to the rows with integer codes.
 
         Examples:
             '2020-12-15 12:45:30' becomes '2020-12-15 12:40:00' with frequency '20min'
@@ -86,105 +215,267 @@ class TimeseriesPreparator:
 
         Args:
             df (DataFrame): Dataframe in wide or long format with a time column.
+            copy (bool, optional): If False, only the time column of df is replaced instead of copying df. Defaults to True.
 
         Raises:
-            ValueError: If there are duplicates dates before or after truncation.
+            ValueError: If all weekly dates were truncated to another day of the week.
 
         Returns:
-            Sorted DataFrame with truncated dates.
+            DataFrame with truncated dates.
         """
-        df_truncated = df.copy()
-
-        error_message_suffix = ". Please check the Long format parameter." if len(self.timeseries_identifiers_names) == 0 else "."
-        self._check_duplicate_dates(df_truncated, error_message_suffix=error_message_suffix)
+        df_truncated = df.copy() if copy else df
+        codes, unique_dates = pd.factorize(df[self.time_column_name])
+        unique_dates = pd.DatetimeIndex(unique_dates)
 
         frequency_offset = to_offset(self.frequency)
         if isinstance(frequency_offset, Tick):
-            df_truncated[self.time_column_name] = df_truncated[self.time_column_name].dt.floor(self.frequency)
+            unique_truncated_dates = unique_dates.floor(self.frequency)
         elif isinstance(frequency_offset, BusinessDay):
-            df_truncated[self.time_column_name] = df_truncated[self.time_column_name].dt.floor("D")
+            unique_truncated_dates = unique_dates.floor("D")
         else:
             if isinstance(frequency_offset, Week):
                 truncation_offset = pd.offsets.Week(weekday=frequency_offset.weekday, n=0)
             elif isinstance(frequency_offset, MonthEnd):
                 truncation_offset = pd.offsets.MonthEnd(n=0)
 
-            df_truncated[self.time_column_name] = df_truncated[self.time_column_name].dt.floor("D") + truncation_offset
+            unique_truncated_dates = unique_dates.floor("D") + truncation_offset
 
-        self._log_truncation(df_truncated, df)
+        df_truncated[self.time_column_name] = np.append(unique_truncated_dates.values, np.datetime64("NaT")).take(codes)
 
-        error_message_suffix = f" after truncation to '{self.frequency}' frequency. Please check the Frequency parameter."
-        self._check_duplicate_dates(df_truncated, error_message_suffix=error_message_suffix)
+        self._log_truncation(unique_truncated_dates, unique_dates, np.bincount(codes[codes >= 0], minlength=len(unique_dates)))
 
         return df_truncated
 
-    def _sort(self, df):
-        """Return a DataFrame sorted by timeseries identifiers and time column (both ascending) """
+    def _sort(self, df, inplace=False):
+        """Return a DataFrame sorted by timeseries identifiers and time column (both ascending). Sort df itself if inplace=True """
+        if inplace:
+            df.sort_values(by=self.timeseries_identifiers_names + [self.time_column_name], inplace=True)
+            return df
         return df.sort_values(by=self.timeseries_identifiers_names + [self.time_column_name])
 
-    def _check_regular_frequency(self, df):
-        """Check that time column exactly equals the pandas.dat_range with selected frequency """
+    def _fill_missing_dates(self, df):
+        """Reindex all timeseries to the regular date range of the selected frequency between their first and last dates
+        in one vectorized operation, and fill the values of targets and external features at missing dates with resampling_method:
+            - 'zero': fill with 0
+            - 'ffill': fill with the previous value
+            - 'interpolate': linear interpolation between the previous and next values
+        Other columns are filled with their previous value. Dataframes with NaT, duplicate dates or dates out of the date range
+        of the selected frequency are not resampled so that they are reported by the validity checks.
+
+        Args:
+            df (DataFrame): Dataframe sorted by timeseries identifiers and time column, with truncated dates.
+
+        Raises:
+            ValueError: If resampling_method is not supported.
+
+        Returns:
+            Resampled dataframe sorted by timeseries identifiers and time column.
+        """
+        if self.resampling_method not in RESAMPLING_METHODS:
+            raise ValueError(f"Resampling method '{self.resampling_method}' is not supported, please use one of {RESAMPLING_METHODS}")
+        time_values = df[self.time_column_name].values
+        if len(time_values) == 0 or pd.isnull(time_values).any():
+            return df
+
+        date_range = pd.date_range(start=time_values.min(), end=time_values.max(), freq=self.frequency)
+        dates_positions = date_range.searchsorted(time_values)
+        if not (date_range.values[np.minimum(dates_positions, len(date_range) - 1)] == time_values).all():
+            logger.warning(f"Missing dates cannot be filled because some dates are not in the date range of frequency '{self.frequency}'")
+            return df
+
+        timeseries_offsets = get_timeseries_offsets(df, self.timeseries_identifiers_names)
+        timeseries_index = np.repeat(np.arange(len(timeseries_offsets) - 1), np.diff(timeseries_offsets))
+        is_continuing_timeseries = np.ones(len(df.index), dtype=bool)
+        is_continuing_timeseries[timeseries_offsets[:-1]] = False
+        if (np.diff(dates_positions)[is_continuing_timeseries[1:]] <= 0).any():  # duplicate dates
+            return df
+
+        start_positions = dates_positions[timeseries_offsets[:-1]]
+        end_positions = dates_positions[timeseries_offsets[1:] - 1]
+        resampled_lengths = end_positions - start_positions + 1
+        if resampled_lengths.sum() == len(df.index):
+            return df
+
+        resampled_offsets = np.append(0, np.cumsum(resampled_lengths))
+        resampled_rows = resampled_offsets[timeseries_index] + dates_positions - start_positions[timeseries_index]
+        source_rows = np.full(resampled_offsets[-1], -1)
+        source_rows[resampled_rows] = np.arange(len(df.index))
+        is_missing_date = source_rows < 0
+        # each timeseries starts and ends with an existing date so previous and next rows never cross timeseries boundaries
+        previous_rows = np.maximum.accumulate(source_rows)
+
+        resampled_df = df.iloc[previous_rows].reset_index(drop=True)
+        resampled_timeseries_index = np.repeat(np.arange(len(resampled_lengths)), resampled_lengths)
+        resampled_df[self.time_column_name] = date_range.values[
+            start_positions[resampled_timeseries_index] + np.arange(resampled_offsets[-1]) - resampled_offsets[resampled_timeseries_index]
+        ]
+
+        if self.resampling_method == "interpolate":
+            next_rows = np.minimum.accumulate(np.where(is_missing_date, len(df.index), source_rows)[::-1])[::-1]
+            missing_rows = np.flatnonzero(is_missing_date)
+            previous_resampled_rows = resampled_rows[previous_rows[missing_rows]]
+            interpolation_weights = (missing_rows - previous_resampled_rows) / (resampled_rows[next_rows[missing_rows]] - previous_resampled_rows)
+
+        for column_name in self.target_columns_names + self.external_features_columns_names:
+            if self.resampling_method == "zero":
+                resampled_values = resampled_df[column_name].values.copy()
+                resampled_values[is_missing_date] = 0
+                resampled_df[column_name] = resampled_values
+            elif self.resampling_method == "interpolate":
+                values = df[column_name].values
+                resampled_values = resampled_df[column_name].values.astype(np.result_type(values.dtype, np.float32))
+                previous_values = values[previous_rows[missing_rows]]
+                resampled_values[missing_rows] = previous_values + (values[next_rows[missing_rows]] - previous_values) * interpolation_weights
+                resampled_df[column_name] = resampled_values
+
+        logger.info(
+            f"Filled {is_missing_date.sum()} missing dates in {np.unique(resampled_timeseries_index[is_missing_date]).size} time series "
+            + f"with resampling method '{self.resampling_method}'"
+        )
+        if self.max_timeseries_length:
+            resampled_df = resampled_df[get_last_rows_mask(resampled_offsets, self.max_timeseries_length)].reset_index(drop=True)
+        return resampled_df
+
+    def _check_timeseries_validity(self, df):
+        """Check in a single vectorized pass over the sorted dataframe that no time series has missing values, duplicate dates
+        or missing dates (i.e. that the time column of each time series exactly equals the pandas.date_range with selected frequency).
+
+        Args:
+            df (DataFrame): Dataframe sorted by timeseries identifiers and time column.
+
+        Raises:
+            ValueError: If some time series are invalid. All invalid time series are reported in the error message.
+        """
+        timeseries_offsets = get_timeseries_offsets(df, self.timeseries_identifiers_names)
+        timeseries_index = np.repeat(np.arange(len(timeseries_offsets) - 1), np.diff(timeseries_offsets))
+        is_continuing_timeseries = np.ones(len(df.index), dtype=bool)
+        is_continuing_timeseries[timeseries_offsets[:-1]] = False
+
+        checked_columns = [self.time_column_name] + self.target_columns_names + self.timeseries_identifiers_names + self.external_features_columns_names
+        # columns are checked one at a time so that the checked columns are never copied together
+        rows_with_missing_values = np.zeros(len(df.index), dtype=bool)
+        columns_with_missing_values = []
+        for column_name in checked_columns:
+            column_missing_values = df[column_name].isnull().values
+            if column_missing_values.any():
+                columns_with_missing_values += [column_name]
+                rows_with_missing_values |= column_missing_values
+
+        time_values = df[self.time_column_name].values
+        missing_dates = pd.isnull(time_values)
+        next_dates, is_on_offset = apply_frequency_offset(time_values, self.frequency)
+        duplicate_dates_rows = np.zeros(len(df.index), dtype=bool)
+        duplicate_dates_rows[1:] = is_continuing_timeseries[1:] & (time_values[1:] == time_values[:-1])
+        missing_dates_rows = np.zeros(len(df.index), dtype=bool)
+        missing_dates_rows[1:] = is_continuing_timeseries[1:] & (time_values[1:] != next_dates[:-1])
+        missing_dates_rows |= ~is_continuing_timeseries & ~is_on_offset
+        missing_dates_rows &= ~duplicate_dates_rows & ~missing_dates
+
+        error_messages = []
+        if columns_with_missing_values:
+            error_messages += [
+                self._format_invalid_timeseries_message(
+                    df,
+                    timeseries_offsets,
+                    np.unique(timeseries_index[rows_with_missing_values]),
+                    f"Column(s) '{columns_with_missing_values}' have missing values",
+                )
+            ]
+        if duplicate_dates_rows.any():
+            error_message_suffix = "Please check the Frequency parameter"
+            if len(self.timeseries_identifiers_names) == 0:
+                error_message_suffix += " and the Long format parameter"
+            error_messages += [
+                self._format_invalid_timeseries_message(
+                    df,
+                    timeseries_offsets,
+                    np.unique(timeseries_index[duplicate_dates_rows]),
+                    f"Input dataset has {duplicate_dates_rows.sum()} duplicate dates after truncation to '{self.frequency}' frequency",
+                    error_message_suffix,
+                )
+            ]
+        if missing_dates_rows.any():
+            error_messages += [
+                self._format_invalid_timeseries_message(
+                    df,
+                    timeseries_offsets,
+                    np.unique(timeseries_index[missing_dates_rows]),
+                    f"Time column '{self.time_column_name}' has missing values with frequency '{self.frequency}'",
+                )
+            ]
+        if error_messages:
+            error_message = " ".join(error_messages)
+            if missing_dates_rows.any() and not self.resampling_method:
+                error_message += " You can select a 'Fill missing dates' method in the recipe settings to resample your time series."
+            raise ValueError(error_message)
+
+    def _format_invalid_timeseries_message(self, df, timeseries_offsets, invalid_timeseries, message, message_suffix=None):
+        """Append the list of invalid time series identifiers to the error message. Log the full list and only keep the first
+        MAX_REPORTED_TIMESERIES ones in the message.
+
+        Args:
+            df (DataFrame): Dataframe sorted by timeseries identifiers and time column.
+            timeseries_offsets (numpy.array): Index of the first row of each time series, followed by the number of rows.
+            invalid_timeseries (numpy.array): Indices of the invalid time series.
+            message (str): Description of the issue.
+            message_suffix (str, optional): Actionable advice appended at the end of the message. Defaults to None.
+
+        Returns:
+            Error message (str).
+        """
         if self.timeseries_identifiers_names:
-            for identifiers_values, identifiers_df in df.groupby(self.timeseries_identifiers_names):
-                assert_time_column_valid(identifiers_df, self.time_column_name, self.frequency)
-        else:
-            assert_time_column_valid(df, self.time_column_name, self.frequency)
+            invalid_identifiers = df[self.timeseries_identifiers_names].iloc[timeseries_offsets[invalid_timeseries]].to_dict(orient="records")
+            logger.error(f"{message} in {len(invalid_identifiers)} time series: {invalid_identifiers}")
+            message += f" in {len(invalid_identifiers)} time series: {invalid_identifiers[:MAX_REPORTED_TIMESERIES]}"
+            if len(invalid_identifiers) > MAX_REPORTED_TIMESERIES:
+                message += f" and {len(invalid_identifiers) - MAX_REPORTED_TIMESERIES} others (full list in the logs)"
+        message += "."
+        if message_suffix:
+            message += f" {message_suffix}."
+        return message
 
     def _keep_last_dates(self, df):
         """Keep only at most the last max_timeseries_length dates of each timeseries.
 
         Args:
-            df (DataFrame)
+            df (DataFrame): Dataframe sorted by timeseries identifiers and time column.
 
         Returns:
             Filtered dataframe
         """
         if self.max_timeseries_length == 42:
             print(H2G2)
-        if len(self.timeseries_identifiers_names) == 0:
-            return df.tail(self.max_timeseries_length)
-        else:
-            return df.groupby(self.timeseries_identifiers_names).apply(lambda x: x.tail(self.max_timeseries_length)).reset_index(drop=True)
+        timeseries_offsets = get_timeseries_offsets(df, self.timeseries_identifiers_names)
+        return df[get_last_rows_mask(timeseries_offsets, self.max_timeseries_length)].reset_index(drop=True)
 
-    def _log_truncation(self, df_truncated, df):
+    def _log_truncation(self, unique_truncated_dates, unique_dates, unique_dates_counts):
         """Log how many dates were truncated for users to understand how their data were changed
 
         Args:
-            df_truncated (DataFrame): Dataframe after truncation
-            df (DataFrame): Original dataframe
+            unique_truncated_dates (DatetimeIndex): Unique dates of the time column after truncation
+            unique_dates (DatetimeIndex): Unique dates of the original time column
+            unique_dates_counts (numpy.array): Number of rows of each unique date
 
         """
-        total_dates = len(df_truncated.index)
-        truncated_dates = (df_truncated[self.time_column_name] != df[self.time_column_name]).sum()
-        if truncated_dates > 0:
+        is_truncated = unique_truncated_dates != unique_dates
+        total_dates_count = unique_dates_counts.sum()
+        truncated_dates_count = unique_dates_counts[is_truncated].sum()
+        if truncated_dates_count > 0:
             logger.warning(
-                f"Dates truncated to {frequency_custom_label(self.frequency)} frequency: {total_dates - truncated_dates} dates kept, {truncated_dates} dates truncated"
+                f"Dates truncated to {frequency_custom_label(self.frequency)} frequency: {total_dates_count - truncated_dates_count} dates kept, {truncated_dates_count} dates truncated"
             )
-            if truncated_dates == total_dates:
-                self._check_end_of_week_frequency(df_truncated, df)
+            if truncated_dates_count == total_dates_count:
+                self._check_end_of_week_frequency(unique_truncated_dates, unique_dates)
         else:
             logger.info(f"No dates were changed after truncation to {frequency_custom_label(self.frequency)} frequency")
 
-    def _check_end_of_week_frequency(self, df_truncated, df):
+    def _check_end_of_week_frequency(self, unique_truncated_dates, unique_dates):
         """Check not all that truncated days are different days"""
         frequency_offset = to_offset(self.frequency)
         if isinstance(frequency_offset, Week):
-            if all(df_truncated[self.time_column_name].dt.dayofweek != df[self.time_column_name].dt.dayofweek):
+            if all(unique_truncated_dates.dayofweek != unique_dates.dayofweek):
                 raise ValueError(f"No weekly dates on {WEEKDAYS[frequency_offset.weekday]}. Please check the 'End of week day' parameter.")
 
-    def _check_duplicate_dates(self, df, error_message_suffix=None):
-        """Check dataframe has no duplicate dates and raise an actionable error message """
-        duplicate_dates = self._count_duplicate_dates(df)
-        if duplicate_dates > 0:
-            error_message = f"Input dataset has {duplicate_dates} duplicate dates"
-            if error_message_suffix:
-                error_message += error_message_suffix
-            raise ValueError(error_message)
-
-    def _count_duplicate_dates(self, df):
-        """Return total number of duplicates dates within all timeseries """
-        return df.duplicated(subset=self.timeseries_identifiers_names + [self.time_column_name], keep=False).sum()
-
     def _check_timeseries_identifiers_columns_types(self, df):
         """ Raises ValueError if a timeseries identifiers column is not numerical or string """
         invalid_columns = []
@@ -194,25 +485,15 @@ class TimeseriesPreparator:
         if len(invalid_columns) > 0:
             raise ValueError(f"Time series identifiers columns '{invalid_columns}' must be of string or numeric type. Please change the type in a Prepare recipe.")
 
-    def _check_no_missing_values(self, df):
-        invalid_columns = []
-        for column_name in [self.time_column_name] + self.target_columns_names + self.timeseries_identifiers_names + self.external_features_columns_names:
-            if df[column_name].isnull().values.any():
-                invalid_columns += [column_name]
-        if len(invalid_columns) > 0:
-            raise ValueError(f"Column(s) '{invalid_columns}' have missing values. You can use the Time Series Preparation plugin to resample your time series.")
-
     def _log_timeseries_lengths(self, df, log_message_prefix=None):
-        """Log the number and sizes of time series and whether it's after sampling or not"""
-        if len(self.timeseries_identifiers_names) == 0:
-            timeseries_lengths = [len(df.index)]
-        else:
-            timeseries_lengths = list(df.groupby(self.timeseries_identifiers_names).size())
+        """Log the number and sizes of time series (of a sorted dataframe) and whether it's after sampling or not"""
+        timeseries_lengths = np.diff(get_timeseries_offsets(df, self.timeseries_identifiers_names))
         log_message = f"{len(timeseries_lengths)} time series"
-        if all(length == timeseries_lengths[0] for length in timeseries_lengths):
-            log_message += f" of {timeseries_lengths[0]} records"
-        else:
-            log_message += f" of {min(timeseries_lengths)} to {max(timeseries_lengths)} records"
+        if len(timeseries_lengths) > 0:
+            if timeseries_lengths.min() == timeseries_lengths.max():
+                log_message += f" of {timeseries_lengths[0]} records"
+            else:
+                log_message += f" of {timeseries_lengths.min()} to {timeseries_lengths.max()} records"
         if log_message_prefix:
             logger.info(f"{log_message_prefix} {log_message}")
 
@@ -241,10 +522,111 @@ def assert_time_column_valid(dataframe, time_column_name, frequency, start_date=
 
     if not np.array_equal(dataframe[time_column_name].values, date_range_values):
         error_message = f"Time column '{time_column_name}' has missing values with frequency '{frequency}'."
-        error_message += " You can use the Time Series Preparation plugin to resample your time column."
+        error_message += " You can select a 'Fill missing dates' method in the recipe settings to resample your time series."
         raise ValueError(error_message)
 
 
+def get_timeseries_offsets(dataframe, timeseries_identifiers_names):
+    """Compute the boundaries of each time series of a dataframe sorted by timeseries identifiers.
+
+    Args:
+        dataframe (DataFrame): Dataframe sorted by timeseries identifiers.
+        timeseries_identifiers_names (list): Columns to identify multiple time series when data is in long format.
+
+    Returns:
+        numpy.array of the index of the first row of each time series, followed by the number of rows.
+    """
+    rows_count = len(dataframe.index)
+    if rows_count == 0:
+        return np.array([0])
+    is_timeseries_start = np.zeros(rows_count, dtype=bool)
+    is_timeseries_start[0] = True
+    for identifier_name in timeseries_identifiers_names:
+        identifier_column = dataframe[identifier_name]
+        identifier_values = identifier_column.cat.codes.values if is_categorical_dtype(identifier_column) else identifier_column.values
+        is_timeseries_start[1:] |= identifier_values[1:] != identifier_values[:-1]
+    return np.append(np.flatnonzero(is_timeseries_start), rows_count)
+
+
+def get_last_rows_mask(timeseries_offsets, max_timeseries_length):
+    """Return a boolean mask of the rows that are among the last max_timeseries_length rows of their timeseries.
+    The position of each row from the end of its timeseries is computed from the timeseries offsets.
+
+    Args:
+        timeseries_offsets (numpy.ndarray): Start offsets of each timeseries followed by the number of rows.
+        max_timeseries_length (int): Maximum number of rows kept per timeseries.
+
+    Returns:
+        numpy.ndarray of booleans
+    """
+    rows_count_from_end = np.repeat(timeseries_offsets[1:], np.diff(timeseries_offsets)) - np.arange(timeseries_offsets[-1])
+    return rows_count_from_end <= max_timeseries_length
+
+
+def encode_timeseries_identifiers(dataframe, timeseries_identifiers_names, categorical_dtypes=None):
+    """Factorize in place the timeseries identifiers columns into categorical columns (integer codes).
+    Categories are sorted so that sorting on codes gives the same order as sorting on values.
+
+    Args:
+        dataframe (DataFrame)
+        timeseries_identifiers_names (list): Columns to identify multiple time series when data is in long format.
+        categorical_dtypes (dict, optional): CategoricalDtype (value) by identifier column name (key) to encode columns with
+            existing categories, so that they can be merged on codes with another encoded dataframe. Defaults to None.
+    """
+    for identifier_name in timeseries_identifiers_names:
+        if categorical_dtypes and identifier_name in categorical_dtypes:
+            dataframe[identifier_name] = pd.Categorical(dataframe[identifier_name], dtype=categorical_dtypes[identifier_name])
+        elif not is_categorical_dtype(dataframe[identifier_name]):
+            dataframe[identifier_name] = pd.Categorical(dataframe[identifier_name])
+
+
+def decode_timeseries_identifiers(dataframe, timeseries_identifiers_names):
+    """Convert in place the categorical timeseries identifiers columns back to their original values.
+
+    Args:
+        dataframe (DataFrame)
+        timeseries_identifiers_names (list): Columns to identify multiple time series when data is in long format.
+    """
+    for identifier_name in timeseries_identifiers_names:
+        if is_categorical_dtype(dataframe[identifier_name]):
+            dataframe[identifier_name] = np.asarray(dataframe[identifier_name].values)
+
+
+def get_categorical_dtypes(dataframe, timeseries_identifiers_names):
+    """Return the CategoricalDtype (value) of each categorical timeseries identifiers column (key) of dataframe"""
+    return {
+        identifier_name: dataframe[identifier_name].dtype
+        for identifier_name in timeseries_identifiers_names
+        if is_categorical_dtype(dataframe[identifier_name])
+    }
+
+
+def apply_frequency_offset(dates, frequency):
+    """Compute the next date of each date with the selected frequency, and whether each date is on the frequency offset.
+    Offsets are only applied once per unique date.
+
+    Args:
+        dates (numpy.array): Array of numpy.datetime64.
+        frequency (str): Pandas timeseries frequency (e.g. '3M').
+
+    Returns:
+        numpy.array of next dates.
+        numpy.array of booleans, True if the date belongs to the pandas.date_range of the selected frequency.
+    """
+    frequency_offset = to_offset(frequency)
+    codes, unique_dates = pd.factorize(dates)
+    unique_dates = pd.DatetimeIndex(unique_dates)
+    unique_next_dates = unique_dates + frequency_offset
+    unique_is_on_offset = (unique_next_dates - frequency_offset) == unique_dates
+    next_dates = np.append(unique_next_dates.values, np.datetime64("NaT")).take(codes)
+    is_on_offset = np.append(unique_is_on_offset, False).take(codes)
+    return next_dates, is_on_offset
+
+
+MAX_REPORTED_TIMESERIES = 10
+
+RESAMPLING_METHODS = ["zero", "ffill", "interpolate"]
+
 FREQUENCY_LABEL = {"T": "minute", "H": "hour", "D": "day", "B": "business day"}
 
 
@@ -1,8 +1,11 @@
-from gluonts_forecasts.gluon_dataset import GluonDataset
+from gluonts_forecasts.gluon_dataset import GluonDataset, remove_unused_external_features
+from gluonts_forecasts.columnar_dataset import save_columnar_list_dataset, load_columnar_list_dataset, get_timeseries_metadata
+from gluonts.dataset.common import ListDataset
 from dku_constants import TIMESERIES_KEYS
 import pandas as pd
 import numpy as np
 import pytest
+import pickle
 
 
 class TestGluonDataset:
@@ -43,3 +46,142 @@ class TestGluonDataset:
 
     def test_timeseries_identifiers(self):
         assert self.gluon_list_dataset.list_data[2][TIMESERIES_KEYS.IDENTIFIERS] == {"store": 1, "item": 2}
+
+    def test_cut_lengths_share_buffers(self):
+        full_list_dataset, evaluation_list_dataset = self.gluon_dataset.create_list_datasets(cut_lengths=[0, 1])
+        full_target = full_list_dataset.list_data[3][TIMESERIES_KEYS.TARGET]
+        evaluation_target = evaluation_list_dataset.list_data[3][TIMESERIES_KEYS.TARGET]
+        assert (evaluation_target == np.array([15, 11])).all()
+        assert np.shares_memory(full_target, evaluation_target)
+
+    def test_unsorted_identifiers(self):
+        gluon_dataset = GluonDataset(
+            dataframe=self.df.iloc[[3, 0, 4, 1, 5, 2]],
+            time_column_name="date",
+            frequency="D",
+            target_columns_names=["volume"],
+            timeseries_identifiers_names=["store", "item"],
+        )
+        gluon_list_dataset = gluon_dataset.create_list_datasets(cut_lengths=[0])[0]
+        assert len(gluon_list_dataset.list_data) == 2
+        assert (gluon_list_dataset.list_data[1][TIMESERIES_KEYS.TARGET] == np.array([5, 2, 5])).all()
+        assert gluon_list_dataset.list_data[1][TIMESERIES_KEYS.IDENTIFIERS] == {"store": 1, "item": 2}
+        assert len(list(gluon_list_dataset)) == 2
+
+    def test_cut_view(self):
+        evaluation_list_dataset = self.gluon_list_dataset.cut(1)
+        twice_cut_list_dataset = evaluation_list_dataset.cut(1)
+        assert (twice_cut_list_dataset.list_data[0][TIMESERIES_KEYS.TARGET] == np.array([2])).all()
+        assert twice_cut_list_dataset.list_data[0][TIMESERIES_KEYS.FEAT_DYNAMIC_REAL].shape == (2, 1)
+        assert evaluation_list_dataset.targets is self.gluon_list_dataset.targets
+        assert evaluation_list_dataset.feat_dynamic_real is self.gluon_list_dataset.feat_dynamic_real
+        assert (self.gluon_list_dataset.list_data[0][TIMESERIES_KEYS.TARGET] == np.array([2, 4, 2])).all()
+
+    def test_external_features_shared_across_targets(self):
+        full_list_dataset, evaluation_list_dataset = pickle.loads(pickle.dumps(self.gluon_dataset.create_list_datasets(cut_lengths=[0, 1])))
+        volume_external_features = full_list_dataset.list_data[0][TIMESERIES_KEYS.FEAT_DYNAMIC_REAL]
+        revenue_external_features = full_list_dataset.list_data[1][TIMESERIES_KEYS.FEAT_DYNAMIC_REAL]
+        assert np.shares_memory(volume_external_features, revenue_external_features)
+        assert evaluation_list_dataset.feat_dynamic_real is full_list_dataset.feat_dynamic_real
+
+    def test_remove_unused_external_features(self):
+        projected_list_dataset = remove_unused_external_features(self.gluon_list_dataset)
+        assert len(projected_list_dataset) == 4
+        assert TIMESERIES_KEYS.FEAT_DYNAMIC_REAL not in projected_list_dataset.list_data[1]
+        assert TIMESERIES_KEYS.FEAT_DYNAMIC_REAL_COLUMNS_NAMES not in projected_list_dataset.list_data[1]
+        assert np.shares_memory(projected_list_dataset.list_data[1][TIMESERIES_KEYS.TARGET], self.gluon_list_dataset.targets[1])
+        assert TIMESERIES_KEYS.FEAT_DYNAMIC_REAL not in next(iter(projected_list_dataset))
+        assert TIMESERIES_KEYS.FEAT_DYNAMIC_REAL in self.gluon_list_dataset.list_data[1]
+
+    def test_disk_backed_datasets(self, tmp_path):
+        gluon_dataset = GluonDataset(
+            dataframe=self.df,
+            time_column_name="date",
+            frequency="D",
+            target_columns_names=["volume", "revenue"],
+            timeseries_identifiers_names=["store", "item"],
+            external_features_columns_names=["is_holiday", "is_weekend"],
+            min_length=2,
+            storage_directory=str(tmp_path),
+        )
+        full_list_dataset, evaluation_list_dataset = gluon_dataset.create_list_datasets(cut_lengths=[0, 1])
+        assert isinstance(full_list_dataset.targets[0], np.memmap)
+        assert isinstance(evaluation_list_dataset.feat_dynamic_real, np.memmap)
+        for timeseries, expected_timeseries in zip(full_list_dataset.list_data, self.gluon_list_dataset.list_data):
+            assert (timeseries[TIMESERIES_KEYS.TARGET] == expected_timeseries[TIMESERIES_KEYS.TARGET]).all()
+            assert (timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL] == expected_timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL]).all()
+            assert timeseries[TIMESERIES_KEYS.START] == expected_timeseries[TIMESERIES_KEYS.START]
+            assert timeseries[TIMESERIES_KEYS.IDENTIFIERS] == expected_timeseries[TIMESERIES_KEYS.IDENTIFIERS]
+        assert len(list(evaluation_list_dataset)) == 4
+
+    def test_buffers_filled_by_chunks(self, monkeypatch):
+        monkeypatch.setattr("gluonts_forecasts.gluon_dataset.DATASET_BUFFERS_CHUNK_SIZE", 2)
+        gluon_dataset = GluonDataset(
+            dataframe=self.df.iloc[[3, 0, 4, 1, 5, 2]],
+            time_column_name="date",
+            frequency="D",
+            target_columns_names=["volume", "revenue"],
+            timeseries_identifiers_names=["store", "item"],
+            external_features_columns_names=["is_holiday", "is_weekend"],
+        )
+        gluon_list_dataset = gluon_dataset.create_list_datasets(cut_lengths=[0])[0]
+        for timeseries, expected_timeseries in zip(gluon_list_dataset.list_data, self.gluon_list_dataset.list_data):
+            assert (timeseries[TIMESERIES_KEYS.TARGET] == expected_timeseries[TIMESERIES_KEYS.TARGET]).all()
+            assert (timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL] == expected_timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL]).all()
+            assert timeseries[TIMESERIES_KEYS.START] == expected_timeseries[TIMESERIES_KEYS.START]
+
+    def test_save_and_load_memory_mapped(self, tmp_path):
+        save_columnar_list_dataset(self.gluon_list_dataset, str(tmp_path))
+        loaded_list_dataset = load_columnar_list_dataset(str(tmp_path))
+        assert isinstance(loaded_list_dataset.targets[1], np.memmap)
+        assert loaded_list_dataset.process.trans[0].freq == "D"
+        assert len(loaded_list_dataset.list_data) == 4
+        assert (loaded_list_dataset.list_data[3][TIMESERIES_KEYS.TARGET] == np.array([15, 11, 10])).all()
+        assert loaded_list_dataset.list_data[3][TIMESERIES_KEYS.IDENTIFIERS] == {"store": 1, "item": 2}
+        assert loaded_list_dataset.list_data[3][TIMESERIES_KEYS.START] == pd.Timestamp("2018-01-06")
+        assert loaded_list_dataset.list_data[3][TIMESERIES_KEYS.FEAT_DYNAMIC_REAL_COLUMNS_NAMES] == ["is_holiday", "is_weekend"]
+
+    def test_short_timeseries(self):
+        df = self.df.iloc[[0, 1, 2, 3, 4]]
+        gluon_dataset = GluonDataset(
+            dataframe=df,
+            time_column_name="date",
+            frequency="D",
+            target_columns_names=["volume"],
+            timeseries_identifiers_names=["store", "item"],
+            min_length=2,
+        )
+        with pytest.raises(ValueError, match="1 time series are too short: \\[{'store': 1, 'item': 2}\\]"):
+            gluon_dataset.create_list_datasets(cut_lengths=[1, 0])
+        gluon_dataset.drop_short_timeseries = True
+        evaluation_list_dataset, full_list_dataset = gluon_dataset.create_list_datasets(cut_lengths=[1, 0])
+        assert len(full_list_dataset.list_data) == 1
+        assert full_list_dataset.list_data[0][TIMESERIES_KEYS.IDENTIFIERS] == {"store": 1, "item": 1}
+        assert (evaluation_list_dataset.list_data[0][TIMESERIES_KEYS.TARGET] == np.array([2, 4])).all()
+        assert gluon_dataset.dropped_timeseries_identifiers.to_dict(orient="records") == [{"store": 1, "item": 2}]
+
+    def test_timeseries_metadata(self):
+        timeseries_metadata = get_timeseries_metadata(self.gluon_list_dataset)
+        assert list(timeseries_metadata.index.get_level_values(TIMESERIES_KEYS.TIMESERIES_ID)) == [0, 0, 1, 1]
+        assert list(timeseries_metadata.index.get_level_values(TIMESERIES_KEYS.TARGET_NAME)) == ["volume", "revenue", "volume", "revenue"]
+        assert timeseries_metadata.to_dict(orient="records")[2] == {"store": 1, "item": 2}
+        list_dataset = ListDataset(list(self.gluon_list_dataset.list_data), freq="D")
+        assert get_timeseries_metadata(list_dataset).equals(timeseries_metadata)
+
+    def test_compact_external_features(self):
+        assert self.gluon_list_dataset.feat_dynamic_real.dtype == np.int8
+        assert next(iter(self.gluon_list_dataset))[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL].dtype == np.float32
+        df = self.df.copy()
+        df["is_holiday"] = df["is_holiday"].astype(float)
+        df.loc[0, "is_holiday"] = 0.5
+        gluon_dataset = GluonDataset(
+            dataframe=df,
+            time_column_name="date",
+            frequency="D",
+            target_columns_names=["volume"],
+            timeseries_identifiers_names=["store", "item"],
+            external_features_columns_names=["is_holiday", "is_weekend"],
+        )
+        gluon_list_dataset = gluon_dataset.create_list_datasets(cut_lengths=[0])[0]
+        assert gluon_list_dataset.feat_dynamic_real.dtype == np.float64
+        assert gluon_list_dataset.list_data[0][TIMESERIES_KEYS.FEAT_DYNAMIC_REAL][0, 0] == 0.5
@@ -0,0 +1,95 @@
+from dku_io_utils.prepared_data_cache import PreparedDataCache
+from gluonts_forecasts.gluon_dataset import GluonDataset
+from dku_constants import PREPARED_DATA_CACHE_DIRECTORY, TIMESERIES_KEYS
+from test_session_checkpoint import InMemoryFolder
+import pandas as pd
+import numpy as np
+import pytest
+
+
+class TestPreparedDataCache:
+    def setup_class(self):
+        self.df = pd.DataFrame(
+            {
+                "date": ["2021-01-01", "2021-01-02", "2021-01-03"],
+                "target": [1.0, 2.0, 3.0],
+                "id": ["a", "a", "a"],
+            }
+        )
+        self.preparation_parameters = {"time_column_name": "date", "frequency": "D", "timeseries_identifiers_names": ["id"]}
+        self.prepared_df = pd.DataFrame(
+            {
+                "date": pd.to_datetime(["2021-01-01", "2021-01-02", "2021-01-03", "2021-01-01", "2021-01-02", "2021-01-03"]),
+                "target": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+                "id": ["a", "a", "a", "b", "b", "b"],
+                "is_holiday": [0, 1, 0, 0, 1, 0],
+            }
+        )
+
+    def get_fingerprint(self, df, preparation_parameters):
+        prepared_data_cache = PreparedDataCache(folder=None, preparation_parameters=preparation_parameters)
+        prepared_data_cache.update_fingerprint(df)
+        return prepared_data_cache.get_fingerprint()
+
+    def test_same_fingerprint(self):
+        assert self.get_fingerprint(self.df, self.preparation_parameters) == self.get_fingerprint(self.df.copy(), dict(self.preparation_parameters))
+
+    def test_fingerprint_of_changed_data(self):
+        df_changed = self.df.copy()
+        df_changed.loc[2, "target"] = 4.0
+        assert self.get_fingerprint(self.df, self.preparation_parameters) != self.get_fingerprint(df_changed, self.preparation_parameters)
+
+    def test_fingerprint_of_changed_parameters(self):
+        preparation_parameters_changed = dict(self.preparation_parameters, frequency="W-SUN")
+        assert self.get_fingerprint(self.df, self.preparation_parameters) != self.get_fingerprint(self.df, preparation_parameters_changed)
+
+    def test_fingerprint_of_chunks(self):
+        prepared_data_cache = PreparedDataCache(folder=None, preparation_parameters=self.preparation_parameters)
+        chunks = list(prepared_data_cache.iter_fingerprinted_chunks([self.df.iloc[:2], self.df.iloc[2:]]))
+        assert len(chunks) == 2
+        assert prepared_data_cache.get_fingerprint() != PreparedDataCache(folder=None, preparation_parameters=self.preparation_parameters).get_fingerprint()
+
+    def get_prepared_data_cache(self, folder):
+        prepared_data_cache = PreparedDataCache(folder=folder, preparation_parameters=self.preparation_parameters)
+        prepared_data_cache.update_fingerprint(self.df)
+        return prepared_data_cache
+
+    @pytest.mark.parametrize("disk_backed", [False, True])
+    def test_save_load(self, disk_backed, tmp_path):
+        storage_directory = str(tmp_path) if disk_backed else None
+        full_list_dataset = GluonDataset(
+            dataframe=self.prepared_df,
+            time_column_name="date",
+            frequency="D",
+            target_columns_names=["target"],
+            timeseries_identifiers_names=["id"],
+            external_features_columns_names=["is_holiday"],
+            storage_directory=storage_directory,
+        ).create_list_datasets(cut_lengths=[0])[0]
+        folder = InMemoryFolder()
+        self.get_prepared_data_cache(folder).save(self.prepared_df, full_list_dataset, local_directory=storage_directory)
+
+        training_df, loaded_full_list_dataset = self.get_prepared_data_cache(folder).load()
+        pd.testing.assert_frame_equal(training_df, self.prepared_df)
+        assert isinstance(loaded_full_list_dataset.targets[0], np.memmap)
+        assert len(loaded_full_list_dataset.list_data) == len(full_list_dataset.list_data)
+        for timeseries, loaded_timeseries in zip(full_list_dataset.list_data, loaded_full_list_dataset.list_data):
+            assert loaded_timeseries[TIMESERIES_KEYS.START] == timeseries[TIMESERIES_KEYS.START]
+            assert loaded_timeseries[TIMESERIES_KEYS.IDENTIFIERS] == timeseries[TIMESERIES_KEYS.IDENTIFIERS]
+            assert (loaded_timeseries[TIMESERIES_KEYS.TARGET] == timeseries[TIMESERIES_KEYS.TARGET]).all()
+            assert (loaded_timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL] == timeseries[TIMESERIES_KEYS.FEAT_DYNAMIC_REAL]).all()
+        assert (loaded_full_list_dataset.cut(1).list_data[1][TIMESERIES_KEYS.TARGET] == np.array([4.0, 5.0])).all()
+
+    def test_load_without_cache(self):
+        assert self.get_prepared_data_cache(InMemoryFolder()).load() is None
+
+    def test_save_removes_other_fingerprints(self):
+        folder = InMemoryFolder()
+        folder.files[f"{PREPARED_DATA_CACHE_DIRECTORY}/other_fingerprint/training_df.pk"] = b""
+        folder.files[f"{PREPARED_DATA_CACHE_DIRECTORY}/other_fingerprint/gluon_dataset/metadata.json"] = b""
+        full_list_dataset = GluonDataset(
+            dataframe=self.prepared_df, time_column_name="date", frequency="D", target_columns_names=["target"], timeseries_identifiers_names=["id"]
+        ).create_list_datasets(cut_lengths=[0])[0]
+        prepared_data_cache = self.get_prepared_data_cache(folder)
+        prepared_data_cache.save(self.prepared_df, full_list_dataset)
+        assert all(file_path.startswith(f"{PREPARED_DATA_CACHE_DIRECTORY}/{prepared_data_cache.get_fingerprint()}/") for file_path in folder.files)
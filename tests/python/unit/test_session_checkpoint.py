@@ -0,0 +1,75 @@
+from dku_io_utils.session_checkpoint import SessionCheckpoint
+from dku_constants import SESSION_CHECKPOINT_FILES
+import pandas as pd
+import io
+
+
+class InMemoryFolder:
+    """Minimal folder storing files in a dictionary of bytes (value) by path (key)"""
+
+    def __init__(self):
+        self.files = {}
+
+    def get_path_details(self, path):
+        path = path.strip("/")
+        if path in self.files:
+            return {"exists": True}
+        prefix = f"{path}/" if path else ""
+        children_names = {file_path[len(prefix) :].split("/")[0] for file_path in self.files if file_path.startswith(prefix)}
+        return {"exists": len(children_names) > 0, "children": [{"name": name} for name in sorted(children_names)]}
+
+    def get_writer(self, path):
+        folder = self
+
+        class Writer(io.BytesIO):
+            def close(self):
+                folder.files[path.strip("/")] = self.getvalue()
+                super().close()
+
+        return Writer()
+
+    def get_download_stream(self, path):
+        return io.BytesIO(self.files[path.strip("/")])
+
+    def delete_path(self, path):
+        path = path.strip("/")
+        for file_path in [file_path for file_path in self.files if file_path == path or file_path.startswith(f"{path}/")]:
+            self.files.pop(file_path)
+
+
+class TestSessionCheckpoint:
+    def setup_class(self):
+        self.df = pd.DataFrame({"date": ["2021-01-01", "2021-01-02", "2021-01-03"], "target": [1.0, 2.0, 3.0]})
+        self.session_parameters = {"prediction_length": 1, "models_parameters": {"trivial_identity": {"activated": True}}}
+
+    def get_session_checkpoint(self, folder, session_parameters=None):
+        session_checkpoint = SessionCheckpoint(folder=folder, session_parameters=session_parameters or self.session_parameters)
+        session_checkpoint.update_fingerprint(self.df)
+        return session_checkpoint
+
+    def test_resume_interrupted_session(self):
+        folder = InMemoryFolder()
+        self.get_session_checkpoint(folder).start("2021-01-01T00:00:00.000000Z")
+        assert self.get_session_checkpoint(folder).find_resumable_session() == "2021-01-01T00:00:00.000000Z"
+
+    def test_no_resume_of_completed_session(self):
+        folder = InMemoryFolder()
+        self.get_session_checkpoint(folder).start("2021-01-01T00:00:00.000000Z")
+        folder.files[f"2021-01-01T00:00:00.000000Z/{SESSION_CHECKPOINT_FILES.METRICS}"] = b""
+        assert self.get_session_checkpoint(folder).find_resumable_session() is None
+
+    def test_no_resume_of_changed_parameters(self):
+        folder = InMemoryFolder()
+        self.get_session_checkpoint(folder).start("2021-01-01T00:00:00.000000Z")
+        session_parameters_changed = dict(self.session_parameters, prediction_length=2)
+        assert self.get_session_checkpoint(folder, session_parameters_changed).find_resumable_session() is None
+
+    def test_clear_completed_session(self):
+        folder = InMemoryFolder()
+        session_checkpoint = self.get_session_checkpoint(folder)
+        session_checkpoint.start("2021-01-01T00:00:00.000000Z")
+        folder.files[f"2021-01-01T00:00:00.000000Z/TrivialIdentity/{SESSION_CHECKPOINT_FILES.PARAMETERS}"] = b"{}"
+        folder.files[f"2021-01-01T00:00:00.000000Z/TrivialIdentity/{SESSION_CHECKPOINT_FILES.RESULTS}"] = b""
+        folder.files[f"2021-01-01T00:00:00.000000Z/TrivialIdentity/fold_1_{SESSION_CHECKPOINT_FILES.RESULTS}"] = b""
+        session_checkpoint.clear()
+        assert list(folder.files) == [f"2021-01-01T00:00:00.000000Z/TrivialIdentity/{SESSION_CHECKPOINT_FILES.PARAMETERS}"]
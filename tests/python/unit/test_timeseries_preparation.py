@@ -1,6 +1,8 @@
-from timeseries_preparation.preparation import TimeseriesPreparator
+from timeseries_preparation.preparation import TimeseriesPreparator, decode_timeseries_identifiers
 import pandas as pd
+from pandas.api.types import is_categorical_dtype
 import pytest
+import tracemalloc
 
 
 def test_duplicate_dates():
@@ -23,7 +25,40 @@ def test_duplicate_dates():
         frequency=frequency,
     )
     with pytest.raises(ValueError):
-        dataframe_prepared = preparator._truncate_dates(df)
+        dataframe_prepared = preparator.prepare_timeseries_dataframe(df)
+
+
+def test_invalid_timeseries_reported_together():
+    df = pd.DataFrame(
+        {
+            "date": [
+                "2021-01-01",
+                "2021-01-02",
+                "2021-01-03",
+                "2021-01-01",
+                "2021-01-01",
+                "2021-01-02",
+                "2021-01-01",
+                "2021-01-03",
+                "2021-01-04",
+            ],
+            "target": [1, 2, 3, 4, 5, 6, 7, 8, None],
+            "id": [1, 1, 1, 2, 2, 2, 3, 3, 3],
+        }
+    )
+    preparator = TimeseriesPreparator(
+        time_column_name="date",
+        frequency="D",
+        target_columns_names=["target"],
+        timeseries_identifiers_names=["id"],
+    )
+    with pytest.raises(ValueError) as err:
+        dataframe_prepared = preparator.prepare_timeseries_dataframe(df)
+    error_message = str(err.value)
+    assert "have missing values in 1 time series: [{'id': 3}]" in error_message
+    assert "duplicate dates after truncation to 'D' frequency in 1 time series: [{'id': 2}]" in error_message
+    assert "missing values with frequency 'D' in 1 time series: [{'id': 3}]" in error_message
+    assert "select a 'Fill missing dates' method" in error_message
 
 
 def test_minutes_truncation():
@@ -48,7 +83,7 @@ def test_minutes_truncation():
     )
     dataframe_prepared = preparator._truncate_dates(df)
     dataframe_prepared = preparator._sort(dataframe_prepared)
-    preparator._check_regular_frequency(dataframe_prepared)
+    preparator._check_timeseries_validity(dataframe_prepared)
 
     assert dataframe_prepared[time_column_name][0] == pd.Timestamp("2021-01-01  12:15:00")
     assert dataframe_prepared[time_column_name][2] == pd.Timestamp("2021-01-01 12:45:00")
@@ -81,7 +116,7 @@ def test_hour_truncation():
     )
     dataframe_prepared = preparator._truncate_dates(df)
     dataframe_prepared = preparator._sort(dataframe_prepared)
-    preparator._check_regular_frequency(dataframe_prepared)
+    preparator._check_timeseries_validity(dataframe_prepared)
     dataframe_prepared = preparator._keep_last_dates(dataframe_prepared)
     assert dataframe_prepared[time_column_name][0] == pd.Timestamp("2020-01-07 16:00:00")
     assert dataframe_prepared[time_column_name][3] == pd.Timestamp("2020-01-08 06:00:00")
@@ -109,7 +144,7 @@ def test_day_truncation():
     )
     dataframe_prepared = preparator._truncate_dates(df)
     dataframe_prepared = preparator._sort(dataframe_prepared)
-    preparator._check_regular_frequency(dataframe_prepared)
+    preparator._check_timeseries_validity(dataframe_prepared)
 
     assert dataframe_prepared[time_column_name][0] == pd.Timestamp("2021-01-01")
     assert dataframe_prepared[time_column_name][2] == pd.Timestamp("2021-01-03")
@@ -137,7 +172,7 @@ def test_business_day_truncation():
     )
     dataframe_prepared = preparator._truncate_dates(df)
     dataframe_prepared = preparator._sort(dataframe_prepared)
-    preparator._check_regular_frequency(dataframe_prepared)
+    preparator._check_timeseries_validity(dataframe_prepared)
 
     assert dataframe_prepared[time_column_name][0] == pd.Timestamp("2021-01-04")
     assert dataframe_prepared[time_column_name][1] == pd.Timestamp("2021-01-07")
@@ -166,7 +201,7 @@ def test_week_sunday_truncation():
     )
     dataframe_prepared = preparator._truncate_dates(df)
     dataframe_prepared = preparator._sort(dataframe_prepared)
-    preparator._check_regular_frequency(dataframe_prepared)
+    preparator._check_timeseries_validity(dataframe_prepared)
 
     dataframe_prepared = preparator._keep_last_dates(dataframe_prepared)
     assert dataframe_prepared[time_column_name][0] == pd.Timestamp("2021-01-10")
@@ -195,7 +230,7 @@ def test_quarter_truncation():
     )
     dataframe_prepared = preparator._truncate_dates(df)
     dataframe_prepared = preparator._sort(dataframe_prepared)
-    preparator._check_regular_frequency(dataframe_prepared)
+    preparator._check_timeseries_validity(dataframe_prepared)
 
     assert dataframe_prepared[time_column_name][0] == pd.Timestamp("2020-12-31")
     assert dataframe_prepared[time_column_name][2] == pd.Timestamp("2021-06-30")
@@ -223,7 +258,7 @@ def test_semester_truncation():
     )
     dataframe_prepared = preparator._truncate_dates(df)
     dataframe_prepared = preparator._sort(dataframe_prepared)
-    preparator._check_regular_frequency(dataframe_prepared)
+    preparator._check_timeseries_validity(dataframe_prepared)
 
     assert dataframe_prepared[time_column_name][0] == pd.Timestamp("2020-12-31")
     assert dataframe_prepared[time_column_name][1] == pd.Timestamp("2021-06-30")
@@ -252,8 +287,231 @@ def test_year_truncation():
     )
     dataframe_prepared = preparator._truncate_dates(df)
     dataframe_prepared = preparator._sort(dataframe_prepared)
-    preparator._check_regular_frequency(dataframe_prepared)
+    preparator._check_timeseries_validity(dataframe_prepared)
 
     assert dataframe_prepared[time_column_name][0] == pd.Timestamp("2020-12-31")
     assert dataframe_prepared[time_column_name][1] == pd.Timestamp("2021-12-31")
-    assert dataframe_prepared[time_column_name][2] == pd.Timestamp("2022-12-31")
\ No newline at end of file
+    assert dataframe_prepared[time_column_name][2] == pd.Timestamp("2022-12-31")
+
+def test_sampling_before_parsing():
+    df = pd.DataFrame(
+        {
+            "date": [
+                "2021-01-05",
+                "2021-01-01",
+                "2021-01-06",
+                "2021-01-07",
+                "2021-01-03",
+                "2021-01-04",
+                "2021-01-05",
+            ],
+            "target": [1, 2, 3, 4, 5, 6, 7],
+            "id": [1, 1, 1, 1, 2, 2, 2],
+        }
+    )
+    df["date"] = pd.to_datetime(df["date"]).dt.tz_localize(tz="UTC")
+    preparator = TimeseriesPreparator(
+        time_column_name="date",
+        frequency="D",
+        target_columns_names=["target"],
+        timeseries_identifiers_names=["id"],
+        max_timeseries_length=2,
+    )
+    dataframe_prepared = preparator.prepare_timeseries_dataframe(df)
+
+    assert len(dataframe_prepared.index) == 4
+    assert dataframe_prepared["date"][0] == pd.Timestamp("2021-01-06")
+    assert dataframe_prepared["target"].tolist() == [3, 4, 6, 7]
+
+
+def test_sampling_after_parsing():
+    df = pd.DataFrame(
+        {
+            "date": ["2021-01-03", "2021-01-01", "2021-01-02", "2021-01-04"],
+            "target": [1, 2, 3, 4],
+        }
+    )
+    preparator = TimeseriesPreparator(
+        time_column_name="date",
+        frequency="D",
+        target_columns_names=["target"],
+        max_timeseries_length=3,
+    )
+    dataframe_prepared = preparator.prepare_timeseries_dataframe(df)
+
+    assert dataframe_prepared["date"][0] == pd.Timestamp("2021-01-02")
+    assert dataframe_prepared["target"].tolist() == [3, 1, 4]
+
+
+def test_memory_lean_preparation():
+    df = pd.DataFrame(
+        {
+            "date": ["2021-01-02 10:00:00", "2021-01-01 12:00:00", "2021-01-01 09:00:00", "2021-01-02 08:00:00"],
+            "target": [1, 2, 3, 4],
+            "id": [1, 1, 2, 2],
+        }
+    )
+    preparator = TimeseriesPreparator(
+        time_column_name="date",
+        frequency="D",
+        target_columns_names=["target"],
+        timeseries_identifiers_names=["id"],
+    )
+    dataframe_prepared = preparator.prepare_timeseries_dataframe(df, copy=False)
+
+    assert dataframe_prepared is df
+    assert dataframe_prepared["date"].tolist() == [pd.Timestamp("2021-01-01"), pd.Timestamp("2021-01-02")] * 2
+    assert dataframe_prepared["target"].tolist() == [2, 1, 3, 4]
+
+
+def test_memory_lean_preparation_stops_memory_tracing():
+    df = pd.DataFrame({"date": ["2021-01-01", "2021-01-01"], "target": [1, 2]})
+    preparator = TimeseriesPreparator(time_column_name="date", frequency="D", target_columns_names=["target"])
+    with pytest.raises(ValueError):
+        preparator.prepare_timeseries_dataframe(df, copy=False)
+    assert not tracemalloc.is_tracing()
+
+
+def test_integer_coded_identifiers():
+    df = pd.DataFrame(
+        {
+            "date": ["2021-01-01", "2021-01-02", "2021-01-01", "2021-01-02", "2021-01-01", "2021-01-02"],
+            "target": [1, 2, 3, 4, 5, 6],
+            "store": ["b", "b", "a", "a", "a", "a"],
+            "item": [2, 2, 1, 1, 10, 10],
+        }
+    )
+    preparator = TimeseriesPreparator(
+        time_column_name="date",
+        frequency="D",
+        target_columns_names=["target"],
+        timeseries_identifiers_names=["store", "item"],
+    )
+    dataframe_prepared = preparator.prepare_timeseries_dataframe(df)
+
+    assert is_categorical_dtype(dataframe_prepared["store"])
+    assert is_categorical_dtype(dataframe_prepared["item"])
+    assert dataframe_prepared["target"].tolist() == [3, 4, 5, 6, 1, 2]
+
+    decode_timeseries_identifiers(dataframe_prepared, ["store", "item"])
+    assert dataframe_prepared["store"].tolist() == ["a", "a", "a", "a", "b", "b"]
+    assert dataframe_prepared["item"].tolist() == [1, 1, 10, 10, 2, 2]
+    assert dataframe_prepared["item"].dtype == "int64"
+
+
+def test_sampling_by_chunks():
+    df = pd.DataFrame(
+        {
+            "date": ["2021-01-0{}".format(day) for day in [5, 1, 2, 3, 4, 1, 2, 3, 4, 5]],
+            "target": [5, 1, 2, 3, 4, 6, 7, 8, 9, 10],
+            "id": ["a", "a", "a", "a", "a", "b", "b", "b", "b", "b"],
+        }
+    )
+    preparator = TimeseriesPreparator(
+        time_column_name="date",
+        frequency="D",
+        target_columns_names=["target"],
+        timeseries_identifiers_names=["id"],
+        max_timeseries_length=2,
+    )
+    chunks = (df.iloc[i : i + 3].copy() for i in range(0, len(df.index), 3))
+    dataframe_sampled = preparator.sample_last_dates_by_chunks(chunks)
+    assert len(dataframe_sampled.index) == 4
+
+    dataframe_prepared = preparator.prepare_timeseries_dataframe(dataframe_sampled, copy=False)
+    expected_dataframe_prepared = preparator.prepare_timeseries_dataframe(df)
+    pd.testing.assert_frame_equal(dataframe_prepared, expected_dataframe_prepared)
+    assert dataframe_prepared["target"].tolist() == [4, 5, 9, 10]
+
+
+def test_compact_dtypes():
+    df = pd.DataFrame(
+        {
+            "date": ["2021-01-01", "2021-01-02", "2021-01-03"],
+            "target": [1.5, 2.5, 3.5],
+            "feature": [0, 1, 0],
+            "id": [1, 1, 1],
+        }
+    )
+    preparator = TimeseriesPreparator(
+        time_column_name="date",
+        frequency="D",
+        target_columns_names=["target"],
+        timeseries_identifiers_names=["id"],
+        external_features_columns_names=["feature"],
+        compact_dtypes=True,
+    )
+    dataframe_prepared = preparator.prepare_timeseries_dataframe(df)
+    assert dataframe_prepared["target"].dtype == "float32"
+    assert dataframe_prepared["feature"].dtype == "float32"
+    assert df["target"].dtype == "float64"
+
+
+def test_truncation_of_shared_dates():
+    df = pd.DataFrame(
+        {
+            "date": ["2021-01-10 10:00:00", "2021-01-12 10:00:00", "2021-01-10 10:00:00", "2021-01-12 10:00:00"],
+            "target": [1, 2, 3, 4],
+            "id": ["a", "a", "b", "b"],
+        }
+    )
+    preparator = TimeseriesPreparator(
+        time_column_name="date",
+        frequency="W-SUN",
+        target_columns_names=["target"],
+        timeseries_identifiers_names=["id"],
+    )
+    dataframe_prepared = preparator.prepare_timeseries_dataframe(df)
+    assert dataframe_prepared["date"].tolist() == [pd.Timestamp("2021-01-10"), pd.Timestamp("2021-01-17")] * 2
+
+
+class TestFillMissingDates:
+    def setup_class(self):
+        self.df = pd.DataFrame(
+            {
+                "date": ["2021-01-01", "2021-01-04", "2021-01-02", "2021-01-03", "2021-01-05", "2021-01-08"],
+                "target": [1, 4, 10, 20, 0, 3],
+                "feature": [1, 1, 0, 0, 5, 5],
+                "id": ["a", "a", "b", "b", "c", "c"],
+            }
+        )
+
+    def prepare(self, resampling_method, max_timeseries_length=None):
+        preparator = TimeseriesPreparator(
+            time_column_name="date",
+            frequency="D",
+            target_columns_names=["target"],
+            timeseries_identifiers_names=["id"],
+            external_features_columns_names=["feature"],
+            max_timeseries_length=max_timeseries_length,
+            resampling_method=resampling_method,
+        )
+        return preparator.prepare_timeseries_dataframe(self.df)
+
+    def test_zero(self):
+        dataframe_prepared = self.prepare("zero")
+        assert dataframe_prepared["target"].tolist() == [1, 0, 0, 4, 10, 20, 0, 0, 0, 3]
+        assert dataframe_prepared["feature"].tolist() == [1, 0, 0, 1, 0, 0, 5, 0, 0, 5]
+        assert dataframe_prepared["date"].tolist() == list(pd.date_range("2021-01-01", "2021-01-04")) + list(
+            pd.date_range("2021-01-02", "2021-01-03")
+        ) + list(pd.date_range("2021-01-05", "2021-01-08"))
+
+    def test_ffill(self):
+        dataframe_prepared = self.prepare("ffill")
+        assert dataframe_prepared["target"].tolist() == [1, 1, 1, 4, 10, 20, 0, 0, 0, 3]
+        assert dataframe_prepared["id"].tolist() == ["a"] * 4 + ["b"] * 2 + ["c"] * 4
+
+    def test_interpolate(self):
+        dataframe_prepared = self.prepare("interpolate")
+        assert dataframe_prepared["target"].tolist() == [1, 2, 3, 4, 10, 20, 0, 1, 2, 3]
+
+    def test_sampling_after_filling(self):
+        dataframe_prepared = self.prepare("interpolate", max_timeseries_length=3)
+        assert dataframe_prepared["target"].tolist() == [2, 3, 4, 10, 20, 1, 2, 3]
+
+    def test_duplicate_dates_not_filled(self):
+        df = pd.DataFrame({"date": ["2021-01-01", "2021-01-01", "2021-01-03"], "target": [1, 2, 3]})
+        preparator = TimeseriesPreparator(time_column_name="date", frequency="D", target_columns_names=["target"], resampling_method="zero")
+        with pytest.raises(ValueError):
+            preparator.prepare_timeseries_dataframe(df)
+
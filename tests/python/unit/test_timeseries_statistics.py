@@ -0,0 +1,53 @@
+from gluonts_forecasts.gluon_dataset import GluonDataset
+from gluonts_forecasts.timeseries_statistics import get_timeseries_statistics
+import gluonts_forecasts.timeseries_statistics
+from gluonts.dataset.common import ListDataset
+from gluonts.evaluation import Evaluator
+from dku_constants import TIMESERIES_KEYS, TIMESERIES_STATISTICS
+import pandas as pd
+import numpy as np
+
+
+class TestTimeseriesStatistics:
+    def setup_class(self):
+        self.df = pd.DataFrame(
+            {
+                "date": pd.date_range("2018-01-01", periods=10, freq="H").append(pd.date_range("2018-01-01", periods=30, freq="H")),
+                "volume": np.append(np.arange(10), np.sin(np.arange(30))),
+                "revenue": np.append([0, 0, 1, np.nan, 3, 0, 2, 2, 1, 0], np.arange(30) % 24),
+                "item": [1] * 10 + [2] * 30,
+            }
+        )
+        gluon_dataset = GluonDataset(
+            dataframe=self.df, time_column_name="date", frequency="H", target_columns_names=["volume", "revenue"], timeseries_identifiers_names=["item"]
+        )
+        self.evaluation_list_dataset, self.full_list_dataset = gluon_dataset.create_list_datasets(cut_lengths=[3, 0])
+
+    def test_chunked_statistics(self, monkeypatch):
+        expected_statistics = get_timeseries_statistics(self.evaluation_list_dataset, "H")
+        monkeypatch.setattr(gluonts_forecasts.timeseries_statistics, "STATISTICS_CHUNK_SIZE", 5)
+        pd.testing.assert_frame_equal(get_timeseries_statistics(self.evaluation_list_dataset, "H"), expected_statistics)
+
+    def test_columnar_statistics_match_timeseries_statistics(self):
+        timeseries_statistics = get_timeseries_statistics(self.evaluation_list_dataset, "H")
+        plain_list_dataset = ListDataset(list(self.evaluation_list_dataset.list_data), freq="H")
+        expected_statistics = get_timeseries_statistics(plain_list_dataset, "H")
+        pd.testing.assert_frame_equal(timeseries_statistics, expected_statistics)
+        assert list(timeseries_statistics[TIMESERIES_STATISTICS.LENGTH]) == [7, 7, 27, 27]
+        assert timeseries_statistics[TIMESERIES_STATISTICS.ZERO_RATIO].iloc[1] == 3 / 7
+
+    def test_cut_length(self):
+        timeseries_statistics = get_timeseries_statistics(self.full_list_dataset, "H", cut_length=3)
+        pd.testing.assert_frame_equal(timeseries_statistics, get_timeseries_statistics(self.evaluation_list_dataset, "H"))
+
+    def test_seasonal_error_matches_gluonts_evaluator(self):
+        timeseries_statistics = get_timeseries_statistics(self.evaluation_list_dataset, "H")
+        evaluator = Evaluator()
+
+        class Forecast:
+            freq = "H"
+
+        for timeseries_index, timeseries in enumerate(self.evaluation_list_dataset.list_data):
+            past_data = np.ma.masked_invalid(np.asarray(timeseries[TIMESERIES_KEYS.TARGET], dtype=float))
+            expected_seasonal_error = evaluator.seasonal_error(past_data, Forecast())
+            assert np.isclose(timeseries_statistics[TIMESERIES_STATISTICS.SEASONAL_ERROR].iloc[timeseries_index], expected_seasonal_error)
@@ -1,6 +1,6 @@
 from gluonts_forecasts.training_session import TrainingSession
 from gluonts_forecasts.model_handler import MODEL_DESCRIPTORS, LABEL
-from dku_constants import TIMESERIES_KEYS, METRICS_DATASET, EVALUATION_METRICS_DESCRIPTIONS, ROW_ORIGIN
+from dku_constants import TIMESERIES_KEYS, METRICS_DATASET, EVALUATION_METRICS_DESCRIPTIONS, ROW_ORIGIN, TRAINING_STATUS
 from datetime import datetime
 from pandas.api.types import is_datetime64_ns_dtype
 import pandas as pd
@@ -34,26 +34,54 @@ class TestTrainingSession:
             "mqcnn": {"activated": True, "kwargs": {}},
             "trivial_identity": {"activated": True, "method": "trivial_identity", "kwargs": {"num_samples": 100}},
         }
+        self.trivial_identity_parameters = {"trivial_identity": {"activated": True, "method": "trivial_identity", "kwargs": {"num_samples": 100}}}
+        self.backtest_df = pd.DataFrame(
+            {
+                "date": pd.date_range("2020-01-12", periods=5, freq="6H").append(pd.date_range("2020-01-12", periods=5, freq="6H")),
+                "volume": [2, 4, 2, 5, 2, 5, 3, 4, 6, 2],
+                "item": [1, 1, 1, 1, 1, 2, 2, 2, 2, 2],
+            }
+        )
         self.session_name = datetime.utcnow().isoformat() + "Z"
 
     def setup_method(self):
-        self.training_session = TrainingSession(
-            target_columns_names=["volume", "revenue"],
-            time_column_name="date",
-            frequency="6H",
-            epoch=1,
-            models_parameters=self.models_parameters,
-            prediction_length=1,
-            training_df=self.df,
-            make_forecasts=True,
-            external_features_columns_names=["is_holiday", "is_weekend"],
-            timeseries_identifiers_names=["store", "item"],
-            batch_size=32,
-            user_num_batches_per_epoch=-1,
-        )
-        self.training_session.init(self.session_name)
-        self.training_session.create_gluon_datasets()
-        self.training_session.instantiate_models()
+        self.training_session = self.create_training_session()
+
+    def create_training_session(self, gluon_list_datasets=None, **kwargs):
+        """Create a training session with its datasets and models, with the parameters of the default session overridden by kwargs"""
+        training_session_parameters = {
+            "target_columns_names": ["volume", "revenue"],
+            "time_column_name": "date",
+            "frequency": "6H",
+            "epoch": 1,
+            "models_parameters": self.models_parameters,
+            "prediction_length": 1,
+            "training_df": self.df,
+            "make_forecasts": True,
+            "external_features_columns_names": ["is_holiday", "is_weekend"],
+            "timeseries_identifiers_names": ["store", "item"],
+            "batch_size": 32,
+            "user_num_batches_per_epoch": -1,
+        }
+        training_session_parameters.update(kwargs)
+        training_session = TrainingSession(**training_session_parameters)
+        training_session.init(self.session_name)
+        training_session.create_gluon_datasets(gluon_list_datasets=gluon_list_datasets)
+        training_session.instantiate_models()
+        return training_session
+
+    def create_backtest_training_session(self, gluon_list_datasets=None, **kwargs):
+        """Create a training session of the trivial identity model with a backtest on the univariate backtest dataframe"""
+        backtest_parameters = {
+            "target_columns_names": ["volume"],
+            "models_parameters": self.trivial_identity_parameters,
+            "training_df": self.backtest_df,
+            "external_features_columns_names": [],
+            "timeseries_identifiers_names": ["item"],
+            "backtest_folds": 3,
+        }
+        backtest_parameters.update(kwargs)
+        return self.create_training_session(gluon_list_datasets=gluon_list_datasets, **backtest_parameters)
 
     def test_gluon_list_datasets(self):
         test_timeseries_length = len(self.training_session.full_list_dataset.list_data[0][TIMESERIES_KEYS.TARGET])
@@ -102,5 +130,145 @@ class TestTrainingSession:
         assert set(self.training_session.evaluation_forecasts_df.columns) == set(expected_evaluation_forecasts_columns)
         assert not_nan_count["volume"] == 6 and not_nan_count["deepar_volume"] == 2
 
+    def test_evaluation_forecasts_order(self):
+        self.training_session.train_evaluate()
+        evaluation_forecasts_df = self.training_session.evaluation_forecasts_df
+        assert list(evaluation_forecasts_df["item"]) == [1, 1, 1, 2, 2, 2]
+        assert list(evaluation_forecasts_df["date"].dt.hour) == [12, 6, 0, 12, 6, 0]
+        assert list(evaluation_forecasts_df[ROW_ORIGIN.COLUMN_NAME]) == [ROW_ORIGIN.EVALUATION, ROW_ORIGIN.TRAIN, ROW_ORIGIN.TRAIN] * 2
+        assert evaluation_forecasts_df["trivial_identity_revenue"].iloc[3] == 11
+
     def test_retrain(self):
         self.training_session.train_evaluate(retrain=True)
+
+    def test_list_datasets_without_external_features_shared_by_models(self):
+        trivial_identity_model = next(model for model in self.training_session.models if model.model_name == "trivial_identity")
+        deepar_model = next(model for model in self.training_session.models if model.model_name == "deepar")
+        train_list_dataset, test_list_dataset = self.training_session._get_model_list_datasets(trivial_identity_model)
+        assert TIMESERIES_KEYS.FEAT_DYNAMIC_REAL not in train_list_dataset.list_data[0]
+        assert TIMESERIES_KEYS.FEAT_DYNAMIC_REAL not in test_list_dataset.list_data[0]
+        assert self.training_session._get_model_list_datasets(trivial_identity_model)[0] is train_list_dataset
+        assert self.training_session._get_model_list_datasets(deepar_model)[0] is self.training_session.evaluation_train_list_dataset
+
+    def test_disk_backed_training(self, tmp_path):
+        training_session = self.create_training_session(
+            models_parameters={"simplefeedforward": {"activated": True, "kwargs": {}}},
+            training_df=self.df.assign(unused=0),
+            storage_directory=str(tmp_path),
+        )
+        assert not training_session.full_list_dataset.targets[0].flags.writeable
+        assert "unused" not in training_session.training_df.columns
+        # gluonts transformations would fail on the read-only memory-mapped buffers if they modified the timeseries in place
+        training_session.train_evaluate(retrain=True)
+        assert training_session.models[0].predictor is not None
+        assert training_session.evaluation_forecasts_df["simplefeedforward_volume"].count() == 2
+
+    def test_training_df_released_without_forecasts(self):
+        training_session = self.create_training_session(models_parameters=self.trivial_identity_parameters, make_forecasts=False)
+        training_session.train_evaluate()
+        assert training_session.training_df is None
+
+    def test_parallel_training(self):
+        training_session = self.create_training_session(num_workers=2)
+        training_session.train_evaluate(retrain=True)
+        assert all(model.predictor is not None for model in training_session.models)
+        assert [model.model_name for model in training_session.models] == ["deepar", "mqcnn", "trivial_identity"]
+        assert len(training_session.metrics_df.index) == 15
+
+    def test_parallel_training_same_results_as_sequential(self):
+        results = []
+        # the sequential session initializes MXNet in this process before the workers of the parallel session are forked
+        for num_workers in [1, 2]:
+            training_session = self.create_training_session(
+                models_parameters=dict(
+                    self.trivial_identity_parameters,
+                    seasonal_naive={"activated": True, "method": "seasonal_naive", "kwargs": {}},
+                    simplefeedforward={"activated": True, "kwargs": {}},
+                ),
+                external_features_columns_names=[],
+                num_workers=num_workers,
+            )
+            training_session.train_evaluate(retrain=True)
+            results.append(training_session)
+        assert all(model.predictor is not None for model in results[1].models)
+        sequential_metrics_df, parallel_metrics_df = [
+            training_session.metrics_df.drop(columns=[METRICS_DATASET.TRAINING_TIME]) for training_session in results
+        ]
+        is_deep_learning_model = sequential_metrics_df[METRICS_DATASET.MODEL_COLUMN] == MODEL_DESCRIPTORS["simplefeedforward"][LABEL]
+        # deep learning models are randomly initialized, so only their metrics rows are compared
+        pd.testing.assert_frame_equal(
+            sequential_metrics_df[is_deep_learning_model].drop(columns=list(EVALUATION_METRICS_DESCRIPTIONS)),
+            parallel_metrics_df[is_deep_learning_model].drop(columns=list(EVALUATION_METRICS_DESCRIPTIONS)),
+        )
+        assert parallel_metrics_df[is_deep_learning_model]["MSE"].notnull().all()
+        pd.testing.assert_frame_equal(sequential_metrics_df[~is_deep_learning_model], parallel_metrics_df[~is_deep_learning_model])
+        forecasts_columns = ["trivial_identity_volume", "trivial_identity_revenue", "seasonal_naive_volume", "seasonal_naive_revenue"]
+        pd.testing.assert_frame_equal(results[0].evaluation_forecasts_df[forecasts_columns], results[1].evaluation_forecasts_df[forecasts_columns])
+
+    def test_backtest(self):
+        training_session = self.create_backtest_training_session()
+        training_session.train_evaluate(retrain=True)
+        oldest_train_list_dataset, oldest_test_list_dataset = training_session.backtest_list_datasets[-1]
+        assert len(oldest_train_list_dataset.list_data[0][TIMESERIES_KEYS.TARGET]) == 2
+        assert oldest_test_list_dataset.targets is training_session.full_list_dataset.targets
+        metrics_df = training_session.metrics_df
+        aggregated_metrics_df = metrics_df[metrics_df[METRICS_DATASET.TARGET_COLUMN] == METRICS_DATASET.AGGREGATED_ROW]
+        assert list(aggregated_metrics_df[METRICS_DATASET.BACKTEST_FOLD]) == [METRICS_DATASET.AGGREGATED_ROW, 0, 1, 2]
+        assert aggregated_metrics_df["MSE"].iloc[0] == pytest.approx(aggregated_metrics_df["MSE"].iloc[1:].mean())
+        assert len(metrics_df.index) == 12
+        assert training_session.evaluation_forecasts_df["trivial_identity_volume"].count() == 2
+
+    def test_backtest_metrics_of_model_stopped_on_last_fold(self):
+        training_session = self.create_backtest_training_session(
+            training_df=self.backtest_df[self.backtest_df["item"] == 1].drop(columns=["item"]),
+            timeseries_identifiers_names=[],
+            make_forecasts=False,
+            time_budget=600,
+        )
+        model_folds_results = training_session._train_evaluate_models(retrain=False, make_forecasts=False)[0]
+        model_folds_results[0] = None
+        training_session.unfinished_tasks[(0, 0)] = TRAINING_STATUS.STOPPED
+        metrics_df = training_session._get_model_metrics(0, model_folds_results)
+        aggregated_metrics_df = metrics_df[metrics_df[METRICS_DATASET.TARGET_COLUMN] == METRICS_DATASET.AGGREGATED_ROW]
+        assert list(aggregated_metrics_df[METRICS_DATASET.BACKTEST_FOLD]) == [0, 1, 2]
+        assert list(aggregated_metrics_df[METRICS_DATASET.TRAINING_STATUS]) == [TRAINING_STATUS.STOPPED] + [TRAINING_STATUS.COMPLETED] * 2
+
+    def test_backtest_with_cached_datasets(self):
+        training_sessions = []
+        for _ in range(2):
+            # the second session reuses the datasets of the first one, like on a prepared data cache hit
+            training_session = self.create_backtest_training_session(
+                gluon_list_datasets=training_sessions[0].get_gluon_list_datasets() if training_sessions else None, make_forecasts=False
+            )
+            training_session.train_evaluate()
+            training_sessions.append(training_session)
+        cached_train_list_dataset, _ = training_sessions[1].backtest_list_datasets[-1]
+        assert len(cached_train_list_dataset.list_data[0][TIMESERIES_KEYS.TARGET]) == 2
+        pd.testing.assert_frame_equal(
+            training_sessions[0].metrics_df.drop(columns=[METRICS_DATASET.TRAINING_TIME]),
+            training_sessions[1].metrics_df.drop(columns=[METRICS_DATASET.TRAINING_TIME]),
+        )
+
+    def test_time_budget_skips_models(self):
+        training_session = self.create_training_session(time_budget=600, estimated_training_times={MODEL_DESCRIPTORS["deepar"][LABEL]: 3600})
+        training_session.train_evaluate(retrain=True)
+        metrics_df = training_session.metrics_df
+        deepar_metrics_df = metrics_df[metrics_df[METRICS_DATASET.MODEL_COLUMN] == MODEL_DESCRIPTORS["deepar"][LABEL]]
+        assert list(deepar_metrics_df[METRICS_DATASET.TRAINING_STATUS]) == [TRAINING_STATUS.SKIPPED]
+        other_metrics_df = metrics_df[metrics_df[METRICS_DATASET.MODEL_COLUMN] != MODEL_DESCRIPTORS["deepar"][LABEL]]
+        assert (other_metrics_df[METRICS_DATASET.TRAINING_STATUS] == TRAINING_STATUS.COMPLETED).all()
+        assert len(metrics_df.index) == 11
+        assert "deepar_volume" not in training_session.evaluation_forecasts_df.columns
+        assert "trivial_identity_volume" in training_session.evaluation_forecasts_df.columns
+
+    def test_time_budget_stops_running_models(self):
+        training_session = self.create_training_session(
+            models_parameters=dict(self.trivial_identity_parameters, deepar={"activated": True, "kwargs": {}}), epoch=1000, time_budget=10
+        )
+        training_session.train_evaluate(retrain=True)
+        metrics_df = training_session.metrics_df
+        deepar_metrics_df = metrics_df[metrics_df[METRICS_DATASET.MODEL_COLUMN] == MODEL_DESCRIPTORS["deepar"][LABEL]]
+        assert list(deepar_metrics_df[METRICS_DATASET.TRAINING_STATUS]) == [TRAINING_STATUS.STOPPED]
+        assert next(model for model in training_session.models if model.model_name == "deepar").predictor is None
+        trivial_identity_metrics_df = metrics_df[metrics_df[METRICS_DATASET.MODEL_COLUMN] == MODEL_DESCRIPTORS["trivial_identity"][LABEL]]
+        assert (trivial_identity_metrics_df[METRICS_DATASET.TRAINING_STATUS] == TRAINING_STATUS.COMPLETED).all()